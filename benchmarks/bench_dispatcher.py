@@ -0,0 +1,200 @@
+"""End-to-end handler latency: replays a realistic update mix through the
+real dispatcher (all routers, DatabaseMiddleware, FSM) against a fake Bot API.
+
+Each simulated user starts the bot, creates a habit and then mostly looks at
+stats, sometimes logs a relapse with a reason and sometimes deletes the habit.
+Users run concurrently, each one's updates in order.
+
+    python -m benchmarks.bench_dispatcher [--users 200] [--concurrency 1] [--url URL]
+    python -m benchmarks.bench_dispatcher --output baseline.json
+    python -m benchmarks.bench_dispatcher --baseline baseline.json [--threshold 0.2]
+
+With --baseline the run exits with status 1 if a handler's p95 latency or the
+overall throughput regressed by more than the threshold. In-memory SQLite
+shares one connection, so use a file or PostgreSQL URL for --concurrency > 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+# Scripted users act faster than anyone could tap
+os.environ.setdefault("THROTTLE_ENABLED", "false")
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from benchmarks.fakes import FakeBotSession, callback_update, message_update
+from bot.db.base import Base
+from bot.dispatcher import create_bot, create_dispatcher
+from bot.middlewares.db import DatabaseMiddleware
+
+REASONS = ["Стресс на работе", "Встреча с друзьями", "Плохой сон", "Скука"]
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(timings: dict[str, list[float]], seconds: float) -> dict:
+    updates = sum(len(values) for values in timings.values())
+    return {
+        "updates": updates,
+        "seconds": round(seconds, 3),
+        "throughput_per_second": round(updates / seconds, 1),
+        "handlers": {
+            name: {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+            }
+            for name, values in sorted(timings.items())
+        },
+    }
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list[str]:
+    """Regressions of result against baseline beyond threshold (0.2 = 20%)."""
+    regressions = []
+    if result["throughput_per_second"] < baseline["throughput_per_second"] * (1 - threshold):
+        regressions.append(
+            f"throughput {result['throughput_per_second']}/s < baseline {baseline['throughput_per_second']}/s"
+        )
+    for name, stats in result["handlers"].items():
+        before = baseline["handlers"].get(name)
+        if before and stats["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {stats['p95_ms']} ms > baseline {before['p95_ms']} ms")
+    return regressions
+
+
+class UserScript:
+    """One simulated user's session; yields (handler name, update) pairs."""
+
+    def __init__(self, user_id: int, bot_session: FakeBotSession, rng: random.Random, actions: int):
+        self.user_id = user_id
+        self.bot_session = bot_session
+        self.rng = rng
+        self.actions = actions
+
+    def _created_habit_id(self) -> str:
+        # The creation reply carries the habit's action keyboard
+        for call in reversed(self.bot_session.calls):
+            if getattr(call, "chat_id", None) == self.user_id and call.reply_markup is not None:
+                return call.reply_markup.inline_keyboard[0][0].callback_data.split(":")[1]
+        raise RuntimeError(f"No habit created for user {self.user_id}")
+
+    def steps(self):
+        user_id = self.user_id
+        yield "cmd_start", message_update(user_id, "/start")
+        yield "start_new_habit", message_update(user_id, "➕ Add Habit")
+        yield "process_habit_name", message_update(user_id, f"Не курить {user_id}")
+        habit_id = self._created_habit_id()
+
+        for _ in range(self.actions):
+            action = self.rng.choices(["stats", "list", "relapse", "progress"], weights=[50, 20, 20, 10])[0]
+            if action == "stats":
+                yield "show_habit_details", callback_update(user_id, f"stats:{habit_id}")
+            elif action == "list":
+                yield "show_habits", message_update(user_id, "📊 My Habits")
+            elif action == "progress":
+                yield "show_progress", message_update(user_id, "📈 Progress")
+            else:
+                yield "start_relapse_from_habit", callback_update(user_id, f"relapse:{habit_id}")
+                yield "process_relapse_reason", message_update(user_id, self.rng.choice(REASONS))
+
+        if self.rng.random() < 0.3:
+            yield "process_delete_request", callback_update(user_id, f"delete:{habit_id}")
+            yield "confirm_habit_deletion", callback_update(user_id, "confirm")
+
+
+async def replay(
+    dp: Dispatcher,
+    bot: Bot,
+    scripts: list[UserScript],
+    concurrency: int
+) -> tuple[dict[str, list[float]], float]:
+    timings: dict[str, list[float]] = defaultdict(list)
+    pending = list(reversed(scripts))
+
+    async def feed(name: str, update: Update) -> None:
+        started = time.perf_counter()
+        result = await dp.feed_update(bot, update)
+        timings[name].append(time.perf_counter() - started)
+        if result is UNHANDLED:
+            raise RuntimeError(f"Update for {name} was not handled")
+
+    async def worker() -> None:
+        while pending:
+            script = pending.pop()
+            for name, update in script.steps():
+                await feed(name, update)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return timings, time.perf_counter() - started
+
+
+async def run(url: str, users: int, actions: int, concurrency: int, seed: int = 0) -> dict:
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    bot_session = FakeBotSession()
+    bot = create_bot(bot_session)
+    dp = create_dispatcher(DatabaseMiddleware(session_maker))
+    rng = random.Random(seed)
+    scripts = [UserScript(user_id, bot_session, rng, actions) for user_id in range(1, users + 1)]
+
+    try:
+        timings, seconds = await replay(dp, bot, scripts, concurrency)
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+
+    result = summarize(timings, seconds)
+    result["api_calls"] = len(bot_session.calls)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--actions", type=int, default=10, help="actions per user after creating a habit")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--url", default="sqlite+aiosqlite:///:memory:")
+    parser.add_argument("--output", help="write the result to this file")
+    parser.add_argument("--baseline", help="compare against a previous --output")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.url, args.users, args.actions, args.concurrency))
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
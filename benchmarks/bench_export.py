@@ -0,0 +1,101 @@
+"""Peak memory and time of a user's data export as the history grows.
+
+    python -m benchmarks.bench_export [--sizes 1000 10000 100000] [--format csv] [--url URL]
+
+Peak memory should stay flat across sizes: rows are streamed and written
+chunk by chunk.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+import pytz
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from bot.db.base import Base
+from bot.db.models import User, Habit, Period, Relapse
+from bot.services.export import Exporter
+
+SEED_BATCH = 10_000
+
+
+async def seed(session: AsyncSession, user_id: int, periods: int) -> None:
+    habit_id = uuid.uuid4()
+    await session.execute(insert(User).values(id=user_id))
+    await session.execute(insert(Habit).values(id=habit_id, user_id=user_id, name=f"Habit {periods}"))
+
+    start = datetime.now(pytz.UTC) - timedelta(hours=periods + 1)
+    for offset in range(0, periods, SEED_BATCH):
+        period_rows, relapse_rows = [], []
+        for i in range(offset, min(offset + SEED_BATCH, periods)):
+            period_id = uuid.uuid4()
+            end = start + timedelta(hours=1)
+            period_rows.append({"id": period_id, "habit_id": habit_id, "start_at": start, "end_at": end})
+            relapse_rows.append({"id": uuid.uuid4(), "period_id": period_id, "occurred_at": end, "reason": f"reason {i}"})
+            start = end
+        await session.execute(insert(Period), period_rows)
+        await session.execute(insert(Relapse), relapse_rows)
+    await session.execute(insert(Period).values(id=uuid.uuid4(), habit_id=habit_id, start_at=start))
+    await session.commit()
+
+
+async def run(url: str | None, sizes: list[int], fmt: str) -> list[dict]:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(url or f"sqlite+aiosqlite:///{directory}/bench.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        results = []
+        for user_id, size in enumerate(sizes, start=1):
+            async with session_maker() as session:
+                await seed(session, user_id, size)
+
+            path = os.path.join(directory, f"export_{user_id}.{fmt}.gz")
+            async with session_maker() as session:
+                tracemalloc.start()
+                started = time.perf_counter()
+                with open(path, "wb") as fileobj, Exporter(fileobj, fmt) as exporter:
+                    await exporter.write_users(session, [user_id])
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+            results.append({
+                "periods": size,
+                "rows": exporter.rows,
+                "seconds": round(elapsed, 3),
+                "peak_kib": round(peak / 1024, 1),
+                "file_kib": round(os.path.getsize(path) / 1024, 1),
+            })
+
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--url", default=None, help="defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.url, args.sizes, args.format))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
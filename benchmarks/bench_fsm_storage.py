@@ -0,0 +1,80 @@
+"""Per-update FSM storage overhead: SQLStorage against MemoryStorage.
+
+Each simulated update does what a handler step does: read the state and
+data, update the data and move to the next state.
+
+    python -m benchmarks.bench_fsm_storage [--users 1000] [--updates 20000] [--url URL]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from bot.db.base import Base
+from bot.fsm.habit import RelapseLogging
+from bot.fsm.storage import SQLStorage
+
+
+async def replay(storage: BaseStorage, users: int, updates: int) -> float:
+    rng = random.Random(0)
+    keys = [StorageKey(bot_id=42, chat_id=user_id, user_id=user_id) for user_id in range(users)]
+    states = [RelapseLogging.waiting_for_habit, RelapseLogging.waiting_for_reason, None]
+
+    started = time.perf_counter()
+    for i in range(updates):
+        key = rng.choice(keys)
+        await storage.get_state(key)
+        await storage.get_data(key)
+        await storage.update_data(key, {"habit_id": str(i)})
+        await storage.set_state(key, states[i % len(states)])
+    elapsed = time.perf_counter() - started
+    await storage.close()
+    return elapsed
+
+
+async def run(url: str, users: int, updates: int) -> list[dict]:
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    results = []
+    memory = await replay(MemoryStorage(), users, updates)
+    results.append({"storage": "memory", "us_per_update": round(memory / updates * 1e6, 2)})
+
+    storage = SQLStorage(engine, flush_interval=0.05)
+    sql = await replay(storage, users, updates)
+    results.append({
+        "storage": "sql",
+        "us_per_update": round(sql / updates * 1e6, 2),
+        "flushes": storage.flushes,
+        "rows_written": storage.rows_written,
+    })
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--url", default="sqlite+aiosqlite:///:memory:")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.url, args.users, args.updates))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Latency of HabitService.get_habit_stats as a habit's period history grows.
+
+    python -m benchmarks.bench_habit_stats [--sizes 10 100 1000 10000] [--url URL]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytz
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from bot.db.base import Base
+from bot.db.models import User, Habit, Period
+from bot.services.habit import HabitService
+
+
+async def seed(session: AsyncSession, user_id: int, periods: int) -> uuid.UUID:
+    habit_id = uuid.uuid4()
+    await session.execute(insert(User).values(id=user_id))
+    await session.execute(insert(Habit).values(id=habit_id, user_id=user_id, name=f"Habit {periods}"))
+
+    now = datetime.now(pytz.UTC)
+    start = now - timedelta(hours=periods + 1)
+    rows = []
+    for _ in range(periods):
+        end = start + timedelta(hours=1)
+        rows.append({"id": uuid.uuid4(), "habit_id": habit_id, "start_at": start, "end_at": end})
+        start = end
+    rows.append({"id": uuid.uuid4(), "habit_id": habit_id, "start_at": start, "end_at": None})
+    await session.execute(insert(Period), rows)
+    await session.commit()
+    return habit_id
+
+
+async def run(url: str, sizes: list[int], repeat: int) -> list[dict]:
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    results = []
+    for user_id, size in enumerate(sizes, start=1):
+        async with session_maker() as session:
+            habit_id = await seed(session, user_id, size)
+
+        timings = []
+        for _ in range(repeat):
+            async with session_maker() as session:
+                started = time.perf_counter()
+                await HabitService(session).get_habit_stats(str(habit_id))
+                timings.append((time.perf_counter() - started) * 1000)
+
+        results.append({
+            "periods": size,
+            "median_ms": round(statistics.median(timings), 3),
+            "max_ms": round(max(timings), 3),
+        })
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--url", default="sqlite+aiosqlite:///:memory:")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.url, args.sizes, args.repeat))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Latency of a /history page by depth, keyset cursor against OFFSET.
+
+    python -m benchmarks.bench_history [--pages 1 10 100 500] [--page-size 5] [--url URL]
+
+Keyset pages should cost the same at every depth, OFFSET grows with it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytz
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from bot.db.base import Base
+from bot.db.models import User, Habit, Period, Relapse
+from bot.services.habit import HabitService, _history_page_statement
+
+USER_ID = 1
+
+
+async def seed(session: AsyncSession, periods: int) -> tuple[uuid.UUID, list[tuple[datetime, uuid.UUID]]]:
+    habit_id = uuid.uuid4()
+    await session.execute(insert(User).values(id=USER_ID))
+    await session.execute(insert(Habit).values(id=habit_id, user_id=USER_ID, name="History"))
+
+    start = datetime.now(pytz.UTC) - timedelta(hours=periods + 1)
+    period_rows, relapse_rows = [], []
+    for i in range(periods):
+        end = start + timedelta(hours=1)
+        period_id = uuid.uuid4()
+        period_rows.append({"id": period_id, "habit_id": habit_id, "start_at": start, "end_at": end})
+        relapse_rows.append({"id": uuid.uuid4(), "period_id": period_id, "occurred_at": end, "reason": f"reason {i}"})
+        start = end
+    period_rows.append({"id": uuid.uuid4(), "habit_id": habit_id, "start_at": start, "end_at": None})
+    await session.execute(insert(Period), period_rows)
+    await session.execute(insert(Relapse), relapse_rows)
+    await session.commit()
+
+    # Newest first, the order the pages are shown in
+    keys = [(row["start_at"], row["id"]) for row in reversed(period_rows)]
+    return habit_id, keys
+
+
+async def time_calls(session_maker, call, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        async with session_maker() as session:
+            started = time.perf_counter()
+            await call(session)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def run(url: str, pages: list[int], page_size: int, repeat: int) -> list[dict]:
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with session_maker() as session:
+        habit_id, keys = await seed(session, max(pages) * page_size + page_size)
+
+    results = []
+    for number in pages:
+        # The ▶️ button of page N - 1 carries its last entry as the cursor
+        cursor = keys[(number - 1) * page_size - 1] if number > 1 else None
+
+        async def keyset(session):
+            page = await HabitService(session).get_history_page(
+                USER_ID, str(habit_id), cursor=cursor, limit=page_size
+            )
+            assert len(page.entries) == page_size
+
+        async def offset(session):
+            statement = _history_page_statement(USER_ID, habit_id, None, False, page_size)
+            result = await session.execute(statement.offset((number - 1) * page_size))
+            assert len(result.all()) == page_size + 1
+
+        keyset_ms = await time_calls(session_maker, keyset, repeat)
+        offset_ms = await time_calls(session_maker, offset, repeat)
+        results.append({
+            "page": number,
+            "keyset_median_ms": round(statistics.median(keyset_ms), 3),
+            "keyset_max_ms": round(max(keyset_ms), 3),
+            "offset_median_ms": round(statistics.median(offset_ms), 3),
+        })
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--page-size", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--url", default="sqlite+aiosqlite:///:memory:")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.url, args.pages, args.page_size, args.repeat))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
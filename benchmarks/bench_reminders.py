@@ -0,0 +1,106 @@
+"""Throughput of the reminder scheduler: seed due reminders, then drain them.
+
+Several ReminderService instances drain concurrently, like several bot
+processes sharing the load. Messages go to a FakeBotSession.
+
+    python -m benchmarks.bench_reminders [--count 1000000] [--workers 4] [--url URL]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytz
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from benchmarks.fakes import FakeBotSession
+from bot.db.base import Base
+from bot.db.models import User, Habit, Period
+from bot.dispatcher import create_bot
+from bot.services.reminders import ReminderService
+
+CHUNK = 10000
+
+
+async def seed(session_maker: async_sessionmaker[AsyncSession], count: int, now: datetime) -> None:
+    for offset in range(0, count, CHUNK):
+        users, habits, periods = [], [], []
+        for user_id in range(offset + 1, min(offset + CHUNK, count) + 1):
+            habit_id = uuid.uuid4()
+            start = now - timedelta(days=user_id % 400, hours=1)
+            users.append({"id": user_id, "next_reminder_at": now - timedelta(seconds=user_id % 3600)})
+            habits.append({
+                "id": habit_id, "user_id": user_id, "name": "Не курить",
+                "is_active": True, "current_period_start": start,
+            })
+            periods.append({"id": uuid.uuid4(), "habit_id": habit_id, "start_at": start})
+        async with session_maker() as session:
+            await session.execute(insert(User), users)
+            await session.execute(insert(Habit), habits)
+            await session.execute(insert(Period), periods)
+            await session.commit()
+
+
+async def run(url: str, count: int, workers: int, batch_size: int, concurrency: int) -> dict:
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    now = datetime.now(pytz.UTC)
+
+    started = time.perf_counter()
+    await seed(session_maker, count, now)
+    seed_seconds = time.perf_counter() - started
+
+    bot_session = FakeBotSession()
+    bot = create_bot(bot_session)
+    services = [
+        ReminderService(session_maker, bot, batch_size=batch_size, concurrency=concurrency)
+        for _ in range(workers)
+    ]
+    started = time.perf_counter()
+    claimed = await asyncio.gather(*(service.run_once(now) for service in services))
+    drain_seconds = time.perf_counter() - started
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+    return {
+        "reminders": count,
+        "workers": workers,
+        "batch_size": batch_size,
+        "seed_seconds": round(seed_seconds, 2),
+        "drain_seconds": round(drain_seconds, 2),
+        "reminders_per_second": round(count / drain_seconds),
+        "claimed_per_worker": claimed,
+        "sent": len(bot_session.calls),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--url", default=None, help="defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.url or f"sqlite+aiosqlite:///{os.path.join(directory, 'reminders.db')}"
+        result = asyncio.run(run(url, args.count, args.workers, args.batch_size, args.concurrency))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
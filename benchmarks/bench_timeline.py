@@ -0,0 +1,141 @@
+"""Memory and latency of a habit's full history, ORM instances against PeriodTimeline.
+
+    python -m benchmarks.bench_timeline [--sizes 10000 100000] [--url URL]
+
+Each mode loads every period of one habit, then answers count, total,
+longest streak and a one-week range query. Retained memory is what the
+loaded history holds on to; peak includes the load itself.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import statistics
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+import pytz
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from bot.db.base import Base
+from bot.db.models import User, Habit, Period
+from bot.services.timeline import PeriodTimeline
+
+USER_ID = 1
+WEEK = timedelta(days=7)
+
+
+async def seed(session: AsyncSession, periods: int) -> tuple[uuid.UUID, datetime]:
+    habit_id = uuid.uuid4()
+    await session.execute(insert(User).values(id=USER_ID))
+    await session.execute(insert(Habit).values(id=habit_id, user_id=USER_ID, name="Timeline"))
+
+    start = datetime.now(pytz.UTC) - timedelta(hours=2 * periods + 1)
+    rows = []
+    for i in range(periods):
+        end = start + timedelta(hours=1 + i % 3)
+        rows.append({"id": uuid.uuid4(), "habit_id": habit_id, "start_at": start, "end_at": end})
+        start = end
+    rows.append({"id": uuid.uuid4(), "habit_id": habit_id, "start_at": start, "end_at": None})
+    for chunk in range(0, len(rows), 10000):
+        await session.execute(insert(Period), rows[chunk:chunk + 10000])
+    await session.commit()
+    return habit_id, rows[len(rows) // 2]["start_at"]
+
+
+async def orm_mode(session: AsyncSession, habit_id: uuid.UUID, since: datetime):
+    result = await session.execute(
+        select(Period).where(Period.habit_id == habit_id).order_by(Period.start_at)
+    )
+    periods = result.scalars().all()
+    if periods[0].start_at.tzinfo is None:
+        # SQLite hands back naive UTC datetimes
+        since = since.replace(tzinfo=None)
+    completed = [(period.end_at - period.start_at).total_seconds() for period in periods if period.end_at]
+    answers = (
+        len(completed),
+        sum(completed),
+        max(completed),
+        sum(1 for period in periods if period.end_at and since <= period.start_at < since + WEEK),
+    )
+    return periods, answers
+
+
+async def timeline_mode(session: AsyncSession, habit_id: uuid.UUID, since: datetime):
+    timeline = await PeriodTimeline.load(session, habit_id)
+    since = since.timestamp()
+    answers = (
+        len(timeline),
+        timeline.total_seconds,
+        timeline.longest_seconds,
+        timeline.count_between(since, since + WEEK.total_seconds()),
+    )
+    return timeline, answers
+
+
+async def measure(session_maker, mode, habit_id, since, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        async with session_maker() as session:
+            started = time.perf_counter()
+            await mode(session, habit_id, since)
+            timings.append((time.perf_counter() - started) * 1000)
+
+    async with session_maker() as session:
+        gc.collect()
+        tracemalloc.start()
+        held, answers = await mode(session, habit_id, since)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del held
+    return {
+        "median_ms": round(statistics.median(timings), 1),
+        "retained_mib": round(retained / 2 ** 20, 2),
+        "peak_mib": round(peak / 2 ** 20, 2),
+        "answers": answers,
+    }
+
+
+async def run(url: str, sizes: list[int], repeat: int) -> list[dict]:
+    results = []
+    for size in sizes:
+        engine = create_async_engine(url)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with session_maker() as session:
+            habit_id, since = await seed(session, size)
+
+        orm = await measure(session_maker, orm_mode, habit_id, since, repeat)
+        timeline = await measure(session_maker, timeline_mode, habit_id, since, repeat)
+        # Both modes must agree up to the float rounding of epoch()
+        assert orm.pop("answers")[::3] == timeline.pop("answers")[::3]
+        results.append({"periods": size, "orm": orm, "timeline": timeline})
+
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--url", default="sqlite+aiosqlite:///:memory:")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.url, args.sizes, args.repeat))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
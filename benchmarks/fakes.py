@@ -0,0 +1,189 @@
+"""Stand-ins for the Telegram Bot API, shared by the benchmarks and tests."""
+import time
+from datetime import datetime
+from typing import Any, AsyncGenerator
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Chat, Message, Update, User
+from aiohttp import web
+
+BOT_USER = User(id=42, is_bot=True, first_name="Strong Will", username="strong_will_bot")
+
+
+class FakeBotSession(BaseSession):
+    """Records every API call and answers without touching the network.
+
+    Calls to chats in blocked fail like those to a user who blocked the bot.
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.calls: list[TelegramMethod[Any]] = []
+        self.blocked: set[int] = set()
+        self._message_id = 0
+
+    async def close(self) -> None:
+        pass
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+        timeout: int | None = None
+    ) -> TelegramType:
+        self.calls.append(method)
+        if getattr(method, "chat_id", None) in self.blocked:
+            raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+        return self._result(method)
+
+    async def stream_content(
+        self, url: str, headers: dict[str, Any] | None = None, timeout: int = 30,
+        chunk_size: int = 65536, raise_for_status: bool = True
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    def _result(self, method: TelegramMethod[Any]) -> Any:
+        name = type(method).__name__
+        if name == "GetMe":
+            return BOT_USER
+        chat_id = getattr(method, "chat_id", None)
+        if name.startswith("Send") or (name.startswith("Edit") and chat_id is not None):
+            self._message_id += 1
+            return Message(
+                message_id=self._message_id,
+                date=datetime.now(),
+                chat=Chat(id=chat_id, type="private"),
+                from_user=BOT_USER,
+                text=getattr(method, "text", None)
+            )
+        return True
+
+    def calls_of(self, method_name: str) -> list[TelegramMethod[Any]]:
+        return [call for call in self.calls if type(call).__name__ == method_name]
+
+
+class FakeTelegramServer:
+    """Local Bot API over HTTP that records calls and can answer with 429s.
+
+    Serve app() (e.g. with aiohttp's TestServer) and point a real session at
+    it with TelegramAPIServer.from_base(). flood[chat_id] = n makes the next n
+    calls to that chat fail with retry_after; chats in blocked answer 403 like
+    a user who blocked the bot, texts in malformed 400 like broken markup.
+    """
+
+    def __init__(self, retry_after: int = 1) -> None:
+        self.retry_after = retry_after
+        self.flood: dict[int, int] = {}
+        self.blocked: set[int] = set()
+        self.malformed: set[str] = set()
+        self.calls: list[tuple[float, str, dict[str, str]]] = []
+        self.rejected: list[tuple[float, str, dict[str, str]]] = []
+        self._message_id = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    def calls_of(self, method_name: str) -> list[dict[str, str]]:
+        return [data for _, method, data in self.calls if method == method_name]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = {key: str(value) for key, value in (await request.post()).items()}
+        call = (time.monotonic(), method, data)
+        chat_id = int(data["chat_id"]) if "chat_id" in data else None
+
+        if self.flood.get(chat_id):
+            self.flood[chat_id] -= 1
+            self.rejected.append(call)
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        if chat_id in self.blocked:
+            self.rejected.append(call)
+            return web.json_response({
+                "ok": False,
+                "error_code": 403,
+                "description": "Forbidden: bot was blocked by the user",
+            }, status=403)
+
+        if data.get("text") in self.malformed:
+            self.rejected.append(call)
+            return web.json_response({
+                "ok": False,
+                "error_code": 400,
+                "description": "Bad Request: can't parse entities",
+            }, status=400)
+
+        self.calls.append(call)
+        return web.json_response({"ok": True, "result": self._result(method, chat_id, data)})
+
+    def _result(self, method: str, chat_id: int | None, data: dict[str, str]) -> Any:
+        if method == "getMe":
+            return BOT_USER.model_dump()
+        if method.startswith("send") or (method.startswith("edit") and chat_id is not None):
+            self._message_id += 1
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER.model_dump(),
+                "text": data.get("text"),
+            }
+        return True
+
+
+_update_id = int(time.time())
+
+
+def _next_update_id() -> int:
+    global _update_id
+    _update_id += 1
+    return _update_id
+
+
+def message_update(user_id: int, text: str) -> Update:
+    user = User(id=user_id, is_bot=False, first_name=f"User {user_id}")
+    return Update.model_validate({
+        "update_id": _next_update_id(),
+        "message": {
+            "message_id": _next_update_id(),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user.model_dump(),
+            "text": text,
+            "entities": (
+                [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+                if text.startswith("/") else None
+            ),
+        },
+    })
+
+
+def callback_update(user_id: int, data: str) -> Update:
+    user = User(id=user_id, is_bot=False, first_name=f"User {user_id}")
+    return Update.model_validate({
+        "update_id": _next_update_id(),
+        "callback_query": {
+            "id": str(_next_update_id()),
+            "from": user.model_dump(),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": _next_update_id(),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER.model_dump(),
+                "text": "...",
+            },
+        },
+    })
@@ -0,0 +1,169 @@
+"""Bounded, per-user ordered processing of webhook updates.
+
+Updates are routed to a fixed set of shard workers by user id. Each shard
+handles its updates one at a time, so a user's updates never race through
+the FSM, and the number of shards caps how many handlers (and DB
+connections) run at once.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from bot.misc.metrics import MetricsRegistry, metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestStats:
+    accepted: int = 0
+    rejected: int = 0
+    processed: int = 0
+    failed: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    max_depth: int = 0
+
+    @property
+    def average_wait_seconds(self) -> float:
+        return self.total_wait_seconds / self.processed if self.processed else 0.0
+
+
+@dataclass
+class _QueuedUpdate:
+    update: Update
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class ShardedUpdateQueue:
+    """Exports update_queue_depth, update_queue_wait_seconds and
+    updates_{queued,shed,failed}_total to the metrics registry."""
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        shards: int,
+        max_size: int,
+        registry: MetricsRegistry | None = None,
+        **data: Any
+    ) -> None:
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.data = data
+        # Split the global bound between shards, at least one slot each
+        shard_size = max(1, -(-max_size // shards))
+        self.queues: list[asyncio.Queue[_QueuedUpdate]] = [
+            asyncio.Queue(maxsize=shard_size) for _ in range(shards)
+        ]
+        self.stats = IngestStats()
+        self.registry = registry or metrics
+        self._workers: list[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def shard_for(self, update: Update) -> int:
+        user = UserContextMiddleware.resolve_event_context(update).user
+        key = user.id if user else update.update_id
+        return key % len(self.queues)
+
+    def submit(self, update: Update) -> bool:
+        """Queue an update; returns False when its shard is full."""
+        try:
+            self.queues[self.shard_for(update)].put_nowait(_QueuedUpdate(update))
+        except asyncio.QueueFull:
+            self.stats.rejected += 1
+            self.registry.inc("updates_shed_total")
+            return False
+        self.stats.accepted += 1
+        depth = self.depth
+        self.stats.max_depth = max(self.stats.max_depth, depth)
+        self.registry.inc("updates_queued_total")
+        self.registry.set_gauge("update_queue_depth", depth)
+        return True
+
+    async def start(self) -> None:
+        self._workers = [
+            asyncio.create_task(self._work(queue), name=f"update-shard-{index}")
+            for index, queue in enumerate(self.queues)
+        ]
+
+    async def join(self) -> None:
+        for queue in self.queues:
+            await queue.join()
+
+    async def stop(self) -> None:
+        """Finish queued updates, then stop the shard workers."""
+        await self.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info(
+            "Update queue: processed %d, failed %d, rejected %d, average wait %.1f ms, max wait %.1f ms, max depth %d",
+            self.stats.processed,
+            self.stats.failed,
+            self.stats.rejected,
+            self.stats.average_wait_seconds * 1000,
+            self.stats.max_wait_seconds * 1000,
+            self.stats.max_depth
+        )
+
+    async def _work(self, queue: asyncio.Queue[_QueuedUpdate]) -> None:
+        while True:
+            item = await queue.get()
+            wait = time.perf_counter() - item.enqueued_at
+            self.stats.total_wait_seconds += wait
+            self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, wait)
+            self.registry.observe("update_queue_wait_seconds", wait)
+            self.registry.set_gauge("update_queue_depth", self.depth)
+            try:
+                result = await self.dispatcher.feed_update(self.bot, item.update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=self.bot, result=result)
+            except Exception:
+                self.stats.failed += 1
+                self.registry.inc("updates_failed_total")
+                logger.exception("Failed to process update %d", item.update.update_id)
+            finally:
+                self.stats.processed += 1
+                queue.task_done()
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """Acknowledges webhook requests as soon as the update is queued.
+
+    A full queue answers 503 with Retry-After, so Telegram redelivers the
+    update later instead of the process buffering without bound.
+    """
+
+    def __init__(self, queue: ShardedUpdateQueue, retry_after: int = 1, **kwargs: Any) -> None:
+        super().__init__(dispatcher=queue.dispatcher, bot=queue.bot, **kwargs)
+        self.queue = queue
+        self.retry_after = retry_after
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+
+        update = Update.model_validate(
+            await request.json(loads=bot.session.json_loads),
+            context={"bot": bot}
+        )
+        if not self.queue.submit(update):
+            return web.Response(status=503, headers={"Retry-After": str(self.retry_after)})
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    __call__ = handle
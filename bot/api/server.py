@@ -0,0 +1,176 @@
+"""Webhook serving, optionally across several worker processes.
+
+Workers share the listening port through SO_REUSEPORT and each one builds
+its own Bot, Dispatcher and database pool. The parent only registers the
+webhook with Telegram and supervises the workers. Background jobs run in
+worker 0 only.
+
+The kernel spreads connections, not users, over the workers: two updates of
+one user can be handled by two processes at once and in either order. So
+with more than one worker nothing per-user may live in process memory
+unshared (see check_worker_settings); the write paths are single atomic
+statements and tolerate the reordering.
+"""
+import asyncio
+import logging
+import multiprocessing
+import signal
+from typing import Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
+
+from bot.api.ingest import QueuedRequestHandler, ShardedUpdateQueue
+from bot.config import Settings, settings
+from bot.misc.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SessionFactory = Callable[[], BaseSession]
+UPDATE_QUEUE = web.AppKey("update_queue", ShardedUpdateQueue)
+
+def create_app(dp: Dispatcher, bot: Bot, path: str) -> web.Application:
+    app = web.Application()
+    queue = ShardedUpdateQueue(
+        dp,
+        bot,
+        shards=settings.UPDATE_WORKERS or settings.DB_POOL_SIZE,
+        max_size=settings.UPDATE_QUEUE_SIZE
+    )
+    app[UPDATE_QUEUE] = queue
+
+    async def start_queue(app: web.Application) -> None:
+        await queue.start()
+
+    async def drain_queue(app: web.Application) -> None:
+        await queue.stop()
+
+    # Queued updates are finished before the bot session is closed
+    app.on_startup.append(start_queue)
+    app.on_shutdown.append(drain_queue)
+    QueuedRequestHandler(queue).register(app, path=path)
+    # Opt-in, the webhook app is public and the endpoint has no auth
+    if settings.METRICS_ENABLED and settings.METRICS_PATH:
+        app.router.add_get(settings.METRICS_PATH, metrics_view)
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def metrics_view(request: web.Request) -> web.Response:
+    # Figures of the worker process that accepted this connection
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+def check_worker_settings(config: Settings) -> list[str]:
+    """Settings that are unsafe when several processes serve the same users."""
+    problems = []
+    if config.FSM_STORAGE != "sql":
+        problems.append("FSM_STORAGE must be sql: in-memory dialog state is per process")
+    elif config.FSM_FLUSH_INTERVAL > 0:
+        problems.append("FSM_FLUSH_INTERVAL must be 0: the write-back FSM cache is per process")
+    if config.HABIT_CACHE_SIZE > 0 and config.CACHE_INVALIDATION != "postgres":
+        problems.append(
+            "CACHE_INVALIDATION must be postgres (or HABIT_CACHE_SIZE 0): "
+            "habit lists cached by one process are not invalidated by another"
+        )
+    return problems
+
+async def set_webhook(session_factory: SessionFactory | None = None) -> None:
+    from bot.dispatcher import create_bot
+
+    bot = create_bot(session_factory() if session_factory else None)
+    try:
+        await bot.set_webhook(
+            url=settings.WEBHOOK_URL + settings.WEBHOOK_PATH,
+            drop_pending_updates=True
+        )
+    finally:
+        await bot.session.close()
+
+async def serve(
+    host: str,
+    port: int,
+    path: str,
+    session_factory: SessionFactory | None = None,
+    worker: int = 0
+) -> None:
+    """Serve the webhook until SIGINT/SIGTERM, then finish in-flight updates."""
+    from bot.dispatcher import create_bot, create_dispatcher
+
+    bot = create_bot(session_factory() if session_factory else None)
+    dp = create_dispatcher(jobs=worker == 0)
+    app = create_app(dp, bot, path)
+
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, host, port, reuse_port=True).start()
+    logger.info("Webhook worker listening on %s:%d%s", host, port, path)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        # Stops accepting connections, then drains the update queue
+        await runner.cleanup()
+        logger.info("Webhook worker stopped")
+
+def _run_worker(host: str, port: int, path: str, session_factory: SessionFactory | None, worker: int) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    asyncio.run(serve(host, port, path, session_factory, worker))
+
+def run_webhook(
+    workers: int | None = None,
+    host: str | None = None,
+    port: int | None = None,
+    session_factory: SessionFactory | None = None
+) -> None:
+    workers = workers or settings.WEBHOOK_WORKERS
+    host = host or settings.WEBAPP_HOST
+    port = port or settings.WEBAPP_PORT
+    path = settings.WEBHOOK_PATH
+    if workers > 1:
+        problems = check_worker_settings(settings)
+        if problems:
+            raise SystemExit(f"Unsafe settings for {workers} webhook workers:\n" + "\n".join(problems))
+
+    asyncio.run(set_webhook(session_factory))
+
+    if workers == 1:
+        asyncio.run(serve(host, port, path, session_factory))
+        return
+
+    # Spawned workers import everything afresh, so no engine or event loop
+    # state leaks from the parent
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=_run_worker,
+            args=(host, port, path, session_factory, number),
+            name=f"webhook-worker-{number}"
+        )
+        for number in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    for process in processes:
+        process.join()
+    failed = [process.name for process in processes if process.exitcode]
+    if failed:
+        raise SystemExit(f"Webhook workers failed: {', '.join(failed)}")
+    logger.info("All webhook workers stopped")
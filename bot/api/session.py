@@ -0,0 +1,348 @@
+"""Bot API session that schedules outgoing calls under Telegram's rate limits.
+
+Calls addressed to a chat go through a global token bucket and a per-chat
+one. Each chat is served in FIFO order with at most one call in flight, and
+chats with interactive replies are served before bulk sends. A 429 pauses
+the chat for retry_after and the call is retried. Calls without a chat
+(answerCallbackQuery, getMe, ...) are not limited.
+
+Interactive messages and edits are delivered in the background: the handler
+gets None back immediately and is not held up by flood control. Code that
+needs the result or the error (a preview that must be valid HTML, a message
+id) sends inside delivered().
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    DeleteMessage,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    SendMessage,
+    TelegramMethod,
+)
+from aiogram.methods.base import TelegramType
+from aiohttp import ClientSession
+
+from bot.misc.metrics import MetricsRegistry
+from bot.misc.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+ChatId = int | str
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+
+
+send_priority: ContextVar[Priority] = ContextVar("send_priority", default=Priority.INTERACTIVE)
+wait_for_delivery: ContextVar[bool] = ContextVar("wait_for_delivery", default=False)
+
+# Results of these are not used by handlers, so they need not wait for delivery
+DEFERRABLE_METHODS = (SendMessage, EditMessageText, EditMessageReplyMarkup, DeleteMessage)
+
+
+@contextmanager
+def bulk_sends() -> Iterator[None]:
+    """Send at bulk priority and wait for each delivery (broadcasts, reminders)."""
+    token = send_priority.set(Priority.BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+@contextmanager
+def delivered() -> Iterator[None]:
+    """Wait for delivery of interactive sends, so results and errors come back."""
+    token = wait_for_delivery.set(True)
+    try:
+        yield
+    finally:
+        wait_for_delivery.reset(token)
+
+
+@dataclass
+class SendStats:
+    sent: int = 0
+    deferred: int = 0
+    retried: int = 0
+    failed: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    @property
+    def average_wait_seconds(self) -> float:
+        return self.total_wait_seconds / self.sent if self.sent else 0.0
+
+
+@dataclass
+class _Call:
+    bot: Bot
+    method: TelegramMethod[Any]
+    timeout: int | None
+    chat_id: ChatId
+    priority: Priority
+    future: asyncio.Future | None
+    enqueued_at: float
+    attempts: int = 0
+
+
+@dataclass
+class _Chat:
+    calls: deque[_Call] = field(default_factory=deque)
+    bucket: TokenBucket | None = None
+    paused_until: float = 0.0
+    busy: bool = False
+
+
+class RateLimitedSession(AiohttpSession):
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: int = 3,
+        max_retries: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+        registry: MetricsRegistry | None = None,
+        **kwargs: Any
+    ) -> None:
+        super().__init__(**kwargs)
+        # Where the HTTP calls happen, so deferred sends are timed too
+        self.registry = registry
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.stats = SendStats()
+        self._clock = clock
+        self._global = TokenBucket(global_rate, global_rate, clock())
+        self._chats: dict[ChatId, _Chat] = {}
+        # (priority, sequence, chat_id) for every chat that has a call ready to go
+        self._ready: list[tuple[Priority, int, ChatId]] = []
+        self._sequence = itertools.count()
+        self._pending = 0
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._last_prune = clock()
+        self._scheduler: asyncio.Task | None = None
+        self._deliveries: set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+        timeout: int | None = None
+    ) -> TelegramType:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await self._request(bot, method, timeout)
+
+        priority = send_priority.get()
+        defer = (
+            priority is Priority.INTERACTIVE
+            and isinstance(method, DEFERRABLE_METHODS)
+            and not wait_for_delivery.get()
+        )
+        loop = asyncio.get_running_loop()
+        future = None if defer else loop.create_future()
+        self._submit(_Call(bot, method, timeout, chat_id, priority, future, self._clock()))
+        if future is None:
+            self.stats.deferred += 1
+            return None  # type: ignore[return-value]
+        return await future
+
+    async def create_session(self) -> ClientSession:
+        # The base class resets the connector through close(), which here
+        # would wait for the very call that is opening the session
+        if self._should_reset_connector:
+            await AiohttpSession.close(self)
+            self._should_reset_connector = False
+        return await super().create_session()
+
+    async def join(self) -> None:
+        """Wait until every queued call has been delivered or has failed."""
+        await self._idle.wait()
+
+    async def close(self) -> None:
+        await self.join()
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            await asyncio.gather(self._scheduler, return_exceptions=True)
+            self._scheduler = None
+            logger.info(
+                "Bot API sends: %d, deferred: %d, retried after 429: %d, failed: %d, "
+                "average queue wait: %.1f ms, max: %.1f ms",
+                self.stats.sent,
+                self.stats.deferred,
+                self.stats.retried,
+                self.stats.failed,
+                self.stats.average_wait_seconds * 1000,
+                self.stats.max_wait_seconds * 1000
+            )
+        await super().close()
+
+    async def _request(self, bot: Bot, method: TelegramMethod[TelegramType], timeout: int | None) -> TelegramType:
+        started = time.perf_counter()
+        error = None
+        try:
+            return await AiohttpSession.make_request(self, bot, method, timeout)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if self.registry is not None:
+                name = method.__api_method__
+                self.registry.observe("telegram_api_seconds", time.perf_counter() - started, method=name)
+                if error is not None:
+                    self.registry.inc("telegram_api_errors_total", method=name, error=type(error).__name__)
+
+    def _submit(self, call: _Call) -> None:
+        chat = self._chats.get(call.chat_id)
+        if chat is None:
+            chat = self._chats[call.chat_id] = _Chat()
+        chat.calls.append(call)
+        if len(chat.calls) == 1 and not chat.busy:
+            self._push_ready(call.chat_id, chat)
+        self._pending += 1
+        self._idle.clear()
+        if self._scheduler is None or self._scheduler.done():
+            self._scheduler = asyncio.create_task(self._schedule(), name="bot-api-scheduler")
+        self._wakeup.set()
+
+    def _push_ready(self, chat_id: ChatId, chat: _Chat) -> None:
+        # A chat is ranked by its most urgent queued call
+        priority = min(call.priority for call in chat.calls)
+        heapq.heappush(self._ready, (priority, next(self._sequence), chat_id))
+
+    def _chat_delay(self, chat: _Chat, now: float) -> float:
+        if chat.paused_until > now:
+            return chat.paused_until - now
+        if chat.bucket is None:
+            return 0.0
+        return chat.bucket.delay(now)
+
+    def _next_call(self) -> tuple[_Call | None, float | None]:
+        """Pick the next call allowed to go out, or how long to sleep."""
+        if not self._ready:
+            return None, None
+        now = self._clock()
+        global_delay = self._global.delay(now)
+        if global_delay > 0:
+            return None, global_delay
+
+        held = []
+        chosen = None
+        wait = None
+        while self._ready:
+            entry = heapq.heappop(self._ready)
+            chat = self._chats[entry[2]]
+            delay = self._chat_delay(chat, now)
+            if delay <= 0:
+                chosen = chat
+                break
+            held.append(entry)
+            wait = delay if wait is None else min(wait, delay)
+        for entry in held:
+            heapq.heappush(self._ready, entry)
+        if chosen is None:
+            return None, wait
+
+        self._global.take(now)
+        if chosen.bucket is None:
+            chosen.bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+        chosen.bucket.take(now)
+        chosen.busy = True
+        return chosen.calls.popleft(), None
+
+    async def _schedule(self) -> None:
+        while True:
+            self._wakeup.clear()
+            call, wait = self._next_call()
+            if call is None:
+                self._prune()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._deliver(call))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    def _prune(self, interval: float = 60.0) -> None:
+        # Forget idle chats whose buckets have refilled
+        now = self._clock()
+        if now - self._last_prune < interval:
+            return
+        self._last_prune = now
+        for chat_id, chat in list(self._chats.items()):
+            if not chat.calls and not chat.busy and chat.paused_until <= now and (
+                chat.bucket is None or chat.bucket.full(now)
+            ):
+                del self._chats[chat_id]
+
+    async def _deliver(self, call: _Call) -> None:
+        chat = self._chats[call.chat_id]
+        wait = self._clock() - call.enqueued_at
+        if self.registry is not None:
+            self.registry.observe("telegram_api_queue_seconds", wait, priority=call.priority.name.lower())
+        done = True
+        try:
+            result = await self._request(call.bot, call.method, call.timeout)
+        except TelegramRetryAfter as e:
+            if call.attempts < self.max_retries:
+                call.attempts += 1
+                self.stats.retried += 1
+                chat.paused_until = self._clock() + e.retry_after
+                chat.calls.appendleft(call)
+                done = False
+            else:
+                self._fail(call, e)
+        except Exception as e:
+            self._fail(call, e)
+        else:
+            self.stats.sent += 1
+            self.stats.total_wait_seconds += wait
+            self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, wait)
+            if call.future is not None and not call.future.done():
+                call.future.set_result(result)
+        finally:
+            chat.busy = False
+            if chat.calls:
+                self._push_ready(call.chat_id, chat)
+            elif chat.bucket is None or chat.bucket.full(self._clock()):
+                # Nothing queued and no rate state worth keeping
+                del self._chats[call.chat_id]
+            if done:
+                self._pending -= 1
+                if not self._pending:
+                    self._idle.set()
+            self._wakeup.set()
+
+    def _fail(self, call: _Call, error: Exception) -> None:
+        self.stats.failed += 1
+        if call.future is not None:
+            if not call.future.done():
+                call.future.set_exception(error)
+        else:
+            logger.error("Failed to deliver %s to chat %s: %s", type(call.method).__name__, call.chat_id, error)
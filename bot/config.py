@@ -1,16 +1,111 @@
+from functools import lru_cache
+from typing import Any
+
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
-load_dotenv()
-
 class Settings(BaseSettings):
     BOT_TOKEN: str
     DATABASE_URL: str
+    # Optional read replica, see bot/db/routing.py
+    DATABASE_REPLICA_URL: str | None = None
+    # A user's reads stay on the primary this long after their own write
+    REPLICA_STICKY_SECONDS: float = 5.0
     WEBHOOK_ENABLED: bool = False
     WEBHOOK_URL: str | None = None
     WEBHOOK_PATH: str | None = None
     WEBAPP_HOST: str = "0.0.0.0"
     WEBAPP_PORT: int = 8000
+    WEBHOOK_WORKERS: int = 1
+    # Concurrent update handlers per worker, defaults to DB_POOL_SIZE
+    UPDATE_WORKERS: int | None = None
+    UPDATE_QUEUE_SIZE: int = 1000
+    # Outgoing Bot API calls, see bot/api/session.py
+    SEND_GLOBAL_RATE: float = 30.0
+    SEND_CHAT_RATE: float = 1.0
+    SEND_CHAT_BURST: int = 3
+    SEND_MAX_RETRIES: int = 3
     MAX_HABITS_PER_USER: int = 3
+    HABIT_CACHE_SIZE: int = 10000
+    HABIT_CACHE_TTL: float = 300.0
+    # "local", or "postgres" to share invalidations between processes (LISTEN/NOTIFY)
+    CACHE_INVALIDATION: str = "local"
+    ANALYTICS_CACHE_SIZE: int = 10000
+    ANALYTICS_CACHE_TTL: float = 3600.0
+
+    # FSM storage: "memory" or "sql"
+    FSM_STORAGE: str = "memory"
+    # 0 writes through without a cache, required with several webhook workers
+    FSM_FLUSH_INTERVAL: float = 0.5
+    FSM_STATE_TTL: int = 86400
+
+    # Daily check-ins, see bot/services/reminders.py
+    REMINDERS_ENABLED: bool = True
+    REMINDER_INTERVAL: float = 86400.0
+    REMINDER_POLL_INTERVAL: float = 60.0
+    REMINDER_BATCH_SIZE: int = 500
+    REMINDER_CONCURRENCY: int = 20
+
+    # Admin dashboard rollups, see bot/services/rollups.py
+    ADMIN_IDS: list[int] = []
+    ROLLUPS_ENABLED: bool = True
+    ROLLUP_INTERVAL: float = 300.0
+    ROLLUP_WINDOW: float = 86400.0
+    ROLLUP_LAG: float = 300.0
+
+    # Per-user flood control, see bot/middlewares/throttling.py
+    THROTTLE_ENABLED: bool = True
+    THROTTLE_RATE: float = 1.0
+    THROTTLE_BURST: int = 5
+    THROTTLE_COALESCE_WINDOW: float = 1.0
+    THROTTLE_MAX_USERS: int = 100_000
+
+    # Admin broadcasts, see bot/services/broadcast.py
+    BROADCAST_BATCH_SIZE: int = 500
+    BROADCAST_CONCURRENCY: int = 30
+
+    # Streak percentiles, see bot/services/percentiles.py
+    PERCENTILES_ENABLED: bool = True
+    SKETCH_K: int = 200
+    SKETCH_REFRESH_INTERVAL: float = 60.0
+    # Rebuild once closed periods outnumber this many times the open ones
+    SKETCH_REBUILD_CHURN: float = 1.0
+    # Older snapshots are rebuilt from the database
+    SKETCH_MAX_AGE: float = 900.0
+
+    # In-process metrics, see bot/misc/metrics.py
+    METRICS_ENABLED: bool = True
+    METRICS_SAMPLE_RATE: float = 1.0
+    # Off by default: served without auth on the public webhook app
+    METRICS_PATH: str | None = None
+    METRICS_DUMP_PATH: str | None = None
+    METRICS_DUMP_INTERVAL: float = 60.0
+
+    # Raise instead of logging when a query budget is exceeded, see bot/db/budget.py
+    QUERY_BUDGET_STRICT: bool = False
+
+    # Connection pool, ignored for SQLite
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Open the pool and compile the hot service statements at startup
+    DB_WARMUP: bool = True
+    # asyncpg only
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_STATEMENT_TIMEOUT_MS: int | None = None
+    DB_APPLICATION_NAME: str = "sw-telegram-bot"
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    # .env is read on first use, not on import
+    load_dotenv()
+    return Settings()
+
+class _LazySettings:
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_settings(), name)
 
-settings = Settings()
\ No newline at end of file
+# `settings.X` keeps working everywhere; Settings() is built on the first access
+settings: Settings = _LazySettings()  # type: ignore[assignment]
@@ -1,14 +1,129 @@
-from typing import AsyncGenerator
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import asyncio
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Iterable
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from bot.config import settings
+from sqlalchemy.sql.base import Executable
+from bot.db.pool import TimedAsyncQueuePool
+from bot.db.routing import create_session_maker
 
-engine = create_async_engine(settings.DATABASE_URL)
-async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+if TYPE_CHECKING:
+    # pydantic-settings is a sizeable import that models and Alembic don't need
+    from bot.config import Settings
+
+def engine_options(config: "Settings", url: str | None = None) -> dict[str, Any]:
+    """Engine keyword arguments for the configured database dialect."""
+    url = make_url(url or config.DATABASE_URL)
+    if url.get_backend_name() == "sqlite":
+        return {}
+
+    options: dict[str, Any] = {
+        "poolclass": TimedAsyncQueuePool,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+    }
+    if url.get_driver_name() == "asyncpg":
+        server_settings = {"application_name": config.DB_APPLICATION_NAME}
+        if config.DB_STATEMENT_TIMEOUT_MS is not None:
+            server_settings["statement_timeout"] = str(config.DB_STATEMENT_TIMEOUT_MS)
+        options["connect_args"] = {
+            "prepared_statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+            "server_settings": server_settings,
+        }
+    return options
+
+def create_engine_from_settings(config: "Settings", url: str | None = None) -> AsyncEngine:
+    return create_async_engine(url or config.DATABASE_URL, **engine_options(config, url))
+
+async def _open_pool(engine: AsyncEngine) -> None:
+    # Hold pool_size connections at once so each one is a new connection
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    connections = await asyncio.gather(*(engine.connect().start() for _ in range(size)))
+    await asyncio.gather(*(connection.close() for connection in connections))
+
+async def _precompile(engine: AsyncEngine, statements: Iterable[Executable]) -> None:
+    # Run in a transaction that is rolled back: the engine caches compiled
+    # statements by shape, so later executions with real values hit the cache
+    async with engine.connect() as connection:
+        for statement in statements:
+            await connection.execute(statement)
+        await connection.rollback()
+
+class Database:
+    """Engines and session maker of one process, created on first use.
+
+    Importing this module neither reads settings nor loads a DB driver. The
+    dispatcher warms the pool up at startup and disposes it at shutdown;
+    after dispose() the next use creates fresh engines.
+    """
+
+    def __init__(self, config: "Settings | None" = None):
+        self._config = config
+        self._engine: AsyncEngine | None = None
+        self._replica_engine: AsyncEngine | None = None
+        self._session_maker: async_sessionmaker[AsyncSession] | None = None
+
+    @property
+    def config(self) -> "Settings":
+        from bot.config import get_settings
+
+        return self._config or get_settings()
+
+    def configure(self, config: "Settings") -> None:
+        if self._engine is not None:
+            raise RuntimeError("Database is already in use, dispose() it first")
+        self._config = config
+
+    def _create_engines(self) -> None:
+        config = self.config
+        self._engine = create_engine_from_settings(config)
+        if config.DATABASE_REPLICA_URL:
+            self._replica_engine = create_engine_from_settings(config, config.DATABASE_REPLICA_URL)
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._create_engines()
+        return self._engine
+
+    @property
+    def replica_engine(self) -> AsyncEngine | None:
+        if self._engine is None:
+            self._create_engines()
+        return self._replica_engine
+
+    @property
+    def session_maker(self) -> async_sessionmaker[AsyncSession]:
+        if self._session_maker is None:
+            self._session_maker = create_session_maker(
+                self.engine, self.replica_engine, self.config.REPLICA_STICKY_SECONDS
+            )
+        return self._session_maker
+
+    async def warm_up(self, statements: Iterable[Executable] = ()) -> None:
+        """Open the pools, then compile statements so first requests hit the cache."""
+        statements = list(statements)
+        for engine in filter(None, (self.engine, self.replica_engine)):
+            # The dialect settles server-specific details on the first connect
+            await _open_pool(engine)
+            # The replica only serves reads, and refuses writes anyway
+            await _precompile(engine, [
+                statement for statement in statements if engine is self.engine or statement.is_select
+            ])
+
+    async def dispose(self) -> None:
+        for engine in filter(None, (self._engine, self._replica_engine)):
+            await engine.dispose()
+        self._engine = self._replica_engine = self._session_maker = None
+
+database = Database()
 
 class Base(DeclarativeBase):
     pass
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session_maker() as session:
-        yield session 
\ No newline at end of file
+    async with database.session_maker() as session:
+        yield session
@@ -0,0 +1,95 @@
+"""Query budgets: cap the number of SQL statements a unit of work may run.
+
+    @query_budget(1)
+    async def get_habit_stats(self, habit_id): ...
+
+    with query_budget(3, "history page"):
+        ...
+
+Statements are counted through engine events for the current task. With
+QUERY_BUDGET_STRICT (on in tests) the statement that goes over budget raises
+QueryBudgetExceeded, pointing straight at the N+1; otherwise the overrun is
+logged when the block exits.
+"""
+import functools
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from bot.config import settings
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+_active_budgets: ContextVar[tuple["query_budget", ...]] = ContextVar("active_query_budgets", default=())
+
+
+class query_budget:
+    def __init__(self, limit: int, name: str | None = None, strict: bool | None = None):
+        self.limit = limit
+        self.name = name
+        self._strict = strict
+        self.statements = 0
+        self._active = False
+        self._token = None
+
+    @property
+    def strict(self) -> bool:
+        # Read when the budget is checked, decorators are applied at import
+        return settings.QUERY_BUDGET_STRICT if self._strict is None else self._strict
+
+    def __enter__(self) -> "query_budget":
+        self.statements = 0
+        self._active = True
+        self._token = _active_budgets.set(_active_budgets.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._active = False
+        _active_budgets.reset(self._token)
+        if self.statements > self.limit and not self.strict:
+            logger.warning(
+                "Query budget exceeded by %s: %d statements, budget %d",
+                self.name, self.statements, self.limit
+            )
+
+    def __call__(self, func: F) -> F:
+        name = self.name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            # A fresh counter per call, so concurrent calls don't share one
+            with query_budget(self.limit, name, self._strict):
+                return await func(*args, **kwargs)
+
+        wrapper.query_budget = self.limit
+        return wrapper
+
+    def _count(self, statement: str) -> None:
+        # Tasks started inside the block inherit the context; ignore them after exit
+        if not self._active:
+            return
+        self.statements += 1
+        if self.statements > self.limit and self.strict:
+            raise QueryBudgetExceeded(
+                f"{self.name} ran {self.statements} statements, budget is {self.limit}: "
+                f"{statement.splitlines()[0][:200]}"
+            )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    for budget in _active_budgets.get():
+        budget._count(statement)
+
+
+if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
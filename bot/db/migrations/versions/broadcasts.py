@@ -0,0 +1,46 @@
+"""broadcasts
+
+Revision ID: broadcasts
+Revises: quantile_sketches
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'broadcasts'
+down_revision: Union[str, None] = 'quantile_sketches'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    # A constant default is stored in the catalog on PostgreSQL 11+, no table rewrite
+    op.add_column('users', sa.Column('is_blocked', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_table('broadcasts',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('text', sa.String(length=4096), nullable=False),
+        sa.Column('created_by', sa.BigInteger(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('status', sa.String(length=16), server_default='running', nullable=False),
+        sa.Column('cursor', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('sent', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('failed', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('blocked', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('broadcast_deliveries',
+        sa.Column('broadcast_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('status', sa.String(length=16), server_default='pending', nullable=False),
+        sa.ForeignKeyConstraint(['broadcast_id'], ['broadcasts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('broadcast_id', 'user_id')
+    )
+
+def downgrade() -> None:
+    op.drop_table('broadcast_deliveries')
+    op.drop_table('broadcasts')
+    op.drop_column('users', 'is_blocked')
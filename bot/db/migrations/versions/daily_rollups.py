@@ -0,0 +1,52 @@
+"""daily rollups
+
+Revision ID: daily_rollups
+Revises: history_index
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'daily_rollups'
+down_revision: Union[str, None] = 'history_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STREAK_COLUMNS = ('streaks_under_1d', 'streaks_1_3d', 'streaks_3_7d', 'streaks_7_30d', 'streaks_30d_plus')
+
+def upgrade() -> None:
+    op.create_table('daily_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        *(
+            sa.Column(name, sa.Integer(), server_default='0', nullable=False)
+            for name in ('new_users', 'active_users', 'habits_created', 'relapses', *STREAK_COLUMNS)
+        ),
+        sa.PrimaryKeyConstraint('day')
+    )
+    op.create_table('daily_active_users',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'user_id')
+    )
+    op.create_table('rollup_watermarks',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('watermark', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    # The rollup job reads new events by timestamp ranges
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_created_at', 'users', ['created_at'], postgresql_concurrently=True)
+        op.create_index('ix_habits_created_at', 'habits', ['created_at'], postgresql_concurrently=True)
+        op.create_index('ix_relapses_occurred_at', 'relapses', ['occurred_at'], postgresql_concurrently=True)
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_relapses_occurred_at', table_name='relapses', postgresql_concurrently=True)
+        op.drop_index('ix_habits_created_at', table_name='habits', postgresql_concurrently=True)
+        op.drop_index('ix_users_created_at', table_name='users', postgresql_concurrently=True)
+    op.drop_table('rollup_watermarks')
+    op.drop_table('daily_active_users')
+    op.drop_table('daily_stats')
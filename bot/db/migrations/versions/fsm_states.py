@@ -0,0 +1,30 @@
+"""fsm states
+
+Revision ID: fsm_states
+Revises: hot_indexes
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'fsm_states'
+down_revision: Union[str, None] = 'hot_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.create_table('fsm_states',
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('state', sa.String(length=255), nullable=True),
+        sa.Column('data', sa.JSON(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_fsm_states_updated_at', 'fsm_states', ['updated_at'])
+
+def downgrade() -> None:
+    op.drop_index('ix_fsm_states_updated_at', table_name='fsm_states')
+    op.drop_table('fsm_states')
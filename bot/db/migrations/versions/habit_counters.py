@@ -0,0 +1,49 @@
+"""habit counters
+
+Revision ID: habit_counters
+Revises: initial
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'habit_counters'
+down_revision: Union[str, None] = 'initial'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.add_column('habits', sa.Column('relapse_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('habits', sa.Column('total_completed_seconds', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('habits', sa.Column('longest_period_seconds', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('habits', sa.Column('current_period_start', sa.DateTime(timezone=True), nullable=True))
+
+    # Backfill counters from existing periods
+    duration = "ROUND(EXTRACT(EPOCH FROM p.end_at) - EXTRACT(EPOCH FROM p.start_at))"
+    op.execute(f"""
+        UPDATE habits SET
+            relapse_count = (
+                SELECT COUNT(p.end_at) FROM periods p WHERE p.habit_id = habits.id
+            ),
+            total_completed_seconds = (
+                SELECT COALESCE(SUM({duration}), 0) FROM periods p
+                WHERE p.habit_id = habits.id AND p.end_at IS NOT NULL
+            ),
+            longest_period_seconds = (
+                SELECT COALESCE(MAX({duration}), 0) FROM periods p
+                WHERE p.habit_id = habits.id AND p.end_at IS NOT NULL
+            ),
+            current_period_start = (
+                SELECT MAX(p.start_at) FROM periods p
+                WHERE p.habit_id = habits.id AND p.end_at IS NULL
+            )
+    """)
+
+def downgrade() -> None:
+    op.drop_column('habits', 'current_period_start')
+    op.drop_column('habits', 'longest_period_seconds')
+    op.drop_column('habits', 'total_completed_seconds')
+    op.drop_column('habits', 'relapse_count')
@@ -0,0 +1,33 @@
+"""history index
+
+Revision ID: history_index
+Revises: reminders
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'history_index'
+down_revision: Union[str, None] = 'reminders'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    # The wider index serves every query of the old one, build it before dropping
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_periods_habit_id_start_at_id', 'periods', ['habit_id', 'start_at', 'id'],
+            postgresql_concurrently=True
+        )
+        op.drop_index('ix_periods_habit_id_start_at', table_name='periods', postgresql_concurrently=True)
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_periods_habit_id_start_at', 'periods', ['habit_id', 'start_at'],
+            postgresql_concurrently=True
+        )
+        op.drop_index('ix_periods_habit_id_start_at_id', table_name='periods', postgresql_concurrently=True)
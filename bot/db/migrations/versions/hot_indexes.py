@@ -0,0 +1,46 @@
+"""hot indexes
+
+Revision ID: hot_indexes
+Revises: habit_counters
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'hot_indexes'
+down_revision: Union[str, None] = 'habit_counters'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    # Build without blocking writes; CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_habits_user_id_is_active', 'habits', ['user_id', 'is_active'],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_periods_habit_id_start_at', 'periods', ['habit_id', 'start_at'],
+            postgresql_concurrently=True
+        )
+        # Fails if some habit already has several open periods; close them first
+        op.create_index(
+            'uq_periods_open_per_habit', 'periods', ['habit_id'],
+            unique=True,
+            postgresql_where=sa.text('end_at IS NULL'),
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_relapses_period_id', 'relapses', ['period_id'],
+            postgresql_concurrently=True
+        )
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_relapses_period_id', table_name='relapses', postgresql_concurrently=True)
+        op.drop_index('uq_periods_open_per_habit', table_name='periods', postgresql_concurrently=True)
+        op.drop_index('ix_periods_habit_id_start_at', table_name='periods', postgresql_concurrently=True)
+        op.drop_index('ix_habits_user_id_is_active', table_name='habits', postgresql_concurrently=True)
@@ -0,0 +1,27 @@
+"""quantile sketches
+
+Revision ID: quantile_sketches
+Revises: daily_rollups
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'quantile_sketches'
+down_revision: Union[str, None] = 'daily_rollups'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.create_table('quantile_sketches',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.JSON(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+def downgrade() -> None:
+    op.drop_table('quantile_sketches')
@@ -0,0 +1,36 @@
+"""reminders
+
+Revision ID: reminders
+Revises: fsm_states
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'reminders'
+down_revision: Union[str, None] = 'fsm_states'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('next_reminder_at', sa.DateTime(timezone=True), nullable=True))
+    # Existing users with active habits get their first check-in within a day
+    op.execute("""
+        UPDATE users SET next_reminder_at = now() + interval '1 day'
+        WHERE EXISTS (
+            SELECT 1 FROM habits WHERE habits.user_id = users.id AND habits.is_active
+        )
+    """)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_next_reminder_at', 'users', ['next_reminder_at'],
+            postgresql_concurrently=True
+        )
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_next_reminder_at', table_name='users', postgresql_concurrently=True)
+    op.drop_column('users', 'next_reminder_at')
@@ -1,6 +1,6 @@
 import uuid
-from datetime import datetime
-from sqlalchemy import String, ForeignKey, DateTime, Boolean, func
+from datetime import date, datetime
+from sqlalchemy import String, ForeignKey, Date, DateTime, Boolean, Integer, BigInteger, Index, JSON, func, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import expression
 from .base import Base
@@ -11,12 +11,27 @@ class User(Base):
     id: Mapped[int] = mapped_column(primary_key=True)  # Telegram user ID
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), 
-        server_default=func.now()
+        server_default=func.now(),
+        index=True
+    )
+    # Next daily check-in, NULL while the user has no active habits
+    next_reminder_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+        index=True
     )
-    habits: Mapped[list["Habit"]] = relationship(back_populates="user", cascade="all, delete-orphan")
+    # Set when the user blocks the bot, broadcasts skip them
+    is_blocked: Mapped[bool] = mapped_column(Boolean, default=False, server_default=expression.false())
+    # Relationships never lazy load (implicit IO fails under asyncio and hides
+    # N+1 queries); load them explicitly with selectinload() when needed
+    habits: Mapped[list["Habit"]] = relationship(back_populates="user", cascade="all, delete-orphan", lazy="raise")
 
 class Habit(Base):
     __tablename__ = "habits"
+    __table_args__ = (
+        Index("ix_habits_user_id_is_active", "user_id", "is_active"),
+        Index("ix_habits_created_at", "created_at"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
@@ -27,11 +42,32 @@ class Habit(Base):
         server_default=func.now()
     )
 
-    user: Mapped[User] = relationship(back_populates="habits")
-    periods: Mapped[list["Period"]] = relationship(back_populates="habit", cascade="all, delete-orphan")
+    # Running counters maintained by HabitService, see bot/services/consistency.py
+    relapse_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    total_completed_seconds: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
+    longest_period_seconds: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
+    current_period_start: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True
+    )
+
+    user: Mapped[User] = relationship(back_populates="habits", lazy="raise")
+    periods: Mapped[list["Period"]] = relationship(back_populates="habit", cascade="all, delete-orphan", lazy="raise")
 
 class Period(Base):
     __tablename__ = "periods"
+    __table_args__ = (
+        # id breaks start_at ties for the keyset pagination of /history
+        Index("ix_periods_habit_id_start_at_id", "habit_id", "start_at", "id"),
+        # At most one open period per habit
+        Index(
+            "uq_periods_open_per_habit",
+            "habit_id",
+            unique=True,
+            postgresql_where=text("end_at IS NULL"),
+            sqlite_where=text("end_at IS NULL"),
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     habit_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("habits.id", ondelete="CASCADE"))
@@ -44,11 +80,15 @@ class Period(Base):
         nullable=True
     )
 
-    habit: Mapped[Habit] = relationship(back_populates="periods")
-    relapse: Mapped["Relapse | None"] = relationship(back_populates="period", uselist=False, cascade="all, delete-orphan")
+    habit: Mapped[Habit] = relationship(back_populates="periods", lazy="raise")
+    relapse: Mapped["Relapse | None"] = relationship(back_populates="period", uselist=False, cascade="all, delete-orphan", lazy="raise")
 
 class Relapse(Base):
     __tablename__ = "relapses"
+    __table_args__ = (
+        Index("ix_relapses_period_id", "period_id"),
+        Index("ix_relapses_occurred_at", "occurred_at"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     period_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("periods.id", ondelete="CASCADE"))
@@ -58,4 +98,78 @@ class Relapse(Base):
     )
     reason: Mapped[str | None] = mapped_column(String(500), nullable=True)
 
-    period: Mapped[Period] = relationship(back_populates="relapse") 
\ No newline at end of file
+    period: Mapped[Period] = relationship(back_populates="relapse", lazy="raise")
+
+class FSMState(Base):
+    __tablename__ = "fsm_states"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, default=dict)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+
+# Rollups maintained by bot/services/rollups.py
+
+class DailyStats(Base):
+    __tablename__ = "daily_stats"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)  # UTC
+    new_users: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    active_users: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    habits_created: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    relapses: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # Lengths of the periods the day's relapses ended
+    streaks_under_1d: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    streaks_1_3d: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    streaks_3_7d: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    streaks_7_30d: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    streaks_30d_plus: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+class DailyActiveUser(Base):
+    __tablename__ = "daily_active_users"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # Events up to and including this time have been folded
+    watermark: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+class QuantileSketch(Base):
+    __tablename__ = "quantile_sketches"
+
+    # Serialised sketches, see bot/services/percentiles.py
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    data: Mapped[dict] = mapped_column(JSON)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+# Announcements sent by bot/services/broadcast.py
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    text: Mapped[str] = mapped_column(String(4096))
+    created_by: Mapped[int] = mapped_column(BigInteger)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # "running" until every user has been claimed, then "done"
+    status: Mapped[str] = mapped_column(String(16), default="running", server_default="running")
+    # Users are claimed in id order; everyone up to this id has a delivery row
+    cursor: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
+    sent: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    failed: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    blocked: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+class BroadcastDelivery(Base):
+    __tablename__ = "broadcast_deliveries"
+
+    broadcast_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("broadcasts.id", ondelete="CASCADE"), primary_key=True
+    )
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # "pending" from the claim until the send returns; a crash leaves it pending
+    status: Mapped[str] = mapped_column(String(16), default="pending", server_default="pending")
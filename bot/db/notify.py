@@ -0,0 +1,82 @@
+"""Cache invalidations shared between processes through PostgreSQL.
+
+Each process keeps one dedicated asyncpg connection that LISTENs on the
+channel and also sends the NOTIFYs, outside the SQLAlchemy pool, so a
+notification neither takes a pool slot nor counts against a query budget.
+Other processes drop the key within a round trip of the committing write;
+if the listening connection is lost, entries live at most for the cache TTL.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Hashable
+
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+
+async def _asyncpg_connect(dsn: str) -> Any:
+    import asyncpg
+
+    return await asyncpg.connect(dsn)
+
+
+class PostgresInvalidationBackend:
+    """InvalidationBackend over LISTEN/NOTIFY; keys must be JSON values."""
+
+    def __init__(
+        self,
+        url: str,
+        channel: str,
+        connect: Callable[[str], Awaitable[Any]] = _asyncpg_connect
+    ):
+        # asyncpg takes a plain libpq URL
+        self.dsn = make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self._connect = connect
+        self._connection: Any = None
+        self._callbacks: list[Callable[[Hashable], None]] = []
+        # One asyncpg connection runs one query at a time
+        self._lock = asyncio.Lock()
+        self.published = 0
+        self.received = 0
+
+    def subscribe(self, callback: Callable[[Hashable], None]) -> None:
+        self._callbacks.append(callback)
+
+    async def start(self) -> None:
+        self._connection = await self._connect(self.dsn)
+        await self._connection.add_listener(self.channel, self._on_notification)
+        self._connection.add_termination_listener(self._on_termination)
+
+    async def close(self) -> None:
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            await connection.close()
+
+    async def publish(self, key: Hashable) -> None:
+        # The write is already committed; a lost notification only leaves other
+        # processes with a stale entry until its TTL, so don't fail the update
+        if self._connection is None:
+            # Not started yet, or closed while queued updates are drained
+            logger.warning("Invalidation of %r not published, the backend is not running", key)
+            return
+        try:
+            async with self._lock:
+                await self._connection.execute("SELECT pg_notify($1, $2)", self.channel, json.dumps(key))
+            self.published += 1
+        except Exception:
+            logger.exception("Could not publish invalidation of %r", key)
+
+    def _on_notification(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        # Our own invalidations were applied before they were published
+        if pid == connection.get_server_pid():
+            return
+        self.received += 1
+        key = json.loads(payload)
+        for callback in self._callbacks:
+            callback(key)
+
+    def _on_termination(self, connection: Any) -> None:
+        logger.error("Lost the cache invalidation connection, entries expire by TTL only")
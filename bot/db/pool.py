@@ -0,0 +1,45 @@
+import time
+from dataclasses import dataclass
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from bot.misc.metrics import record_pool_wait
+
+
+@dataclass
+class PoolWaitStats:
+    """Time spent waiting for a connection to be checked out of the pool."""
+
+    checkouts: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    @property
+    def average_seconds(self) -> float:
+        return self.total_seconds / self.checkouts if self.checkouts else 0.0
+
+    def reset(self) -> None:
+        self.checkouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+
+pool_wait_stats = PoolWaitStats()
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records checkout wait times in pool_wait_stats and metrics."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            pool_wait_stats.record(waited)
+            record_pool_wait(waited)
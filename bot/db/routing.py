@@ -0,0 +1,88 @@
+"""Read/write splitting between a primary and a read replica.
+
+RoutingSession sends ORM flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE
+and selects with data-modifying CTEs to the primary, other reads to the
+replica. Once a session has written, it stays on the primary. After a commit
+with writes, the session's user (session.info["user_id"], set by
+DatabaseMiddleware) reads from the primary for the sticky window, so their
+next updates see their own relapse despite replication lag. The window is
+tracked per process: with several webhook workers an update can land on a
+worker that didn't see the write.
+"""
+from typing import Any
+
+from sqlalchemy import Engine, Select, TextClause
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import visitors
+
+from bot.misc.cache import TTLCache
+
+# Users who wrote within the window; only the least recent are forgotten early
+STICKY_USERS = 100_000
+
+
+def writes(clause: Any) -> bool:
+    if clause.is_dml:
+        return True
+    if not isinstance(clause, Select):
+        # Raw SQL can't be inspected
+        return isinstance(clause, TextClause)
+    if clause._for_update_arg is not None:
+        return True
+    return any(getattr(element, "is_dml", False) for element in visitors.iterate(clause))
+
+
+class RoutingSession(Session):
+    def __init__(
+        self,
+        *args: Any,
+        replica: Engine | None = None,
+        recent_writers: TTLCache[int, bool] | None = None,
+        **kwargs: Any
+    ):
+        super().__init__(*args, **kwargs)
+        self.replica = replica
+        self.recent_writers = recent_writers
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = super().get_bind(mapper, clause=clause, **kwargs)
+        if self.replica is None or self.info.get("primary"):
+            return primary
+        # Flushes ask for a bind by mapper only
+        if self._flushing or (clause is not None and writes(clause)):
+            self.info["primary"] = True
+            return primary
+        # No clause: a caller asking for the dialect
+        if clause is None:
+            return primary
+        user_id = self.info.get("user_id")
+        if user_id is not None and self.recent_writers is not None and self.recent_writers.get(user_id):
+            return primary
+        return self.replica
+
+    def commit(self) -> None:
+        super().commit()
+        user_id = self.info.get("user_id")
+        if self.info.get("primary") and user_id is not None and self.recent_writers is not None:
+            self.recent_writers.set(user_id, True, self.recent_writers.token())
+
+
+def create_session_maker(
+    primary: AsyncEngine,
+    replica: AsyncEngine | None = None,
+    sticky_seconds: float = 5.0,
+    recent_writers: TTLCache[int, bool] | None = None
+) -> async_sessionmaker[AsyncSession]:
+    if replica is None:
+        return async_sessionmaker(primary, class_=AsyncSession, expire_on_commit=False)
+    if recent_writers is None:
+        recent_writers = TTLCache(maxsize=STICKY_USERS, ttl=sticky_seconds)
+    return async_sessionmaker(
+        primary,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        sync_session_class=RoutingSession,
+        replica=replica.sync_engine,
+        recent_writers=recent_writers,
+    )
@@ -0,0 +1,65 @@
+from sqlalchemy import Date, Float, cast, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class epoch(FunctionElement):
+    """Seconds since the Unix epoch for a timestamp expression."""
+
+    type = Float()
+    inherit_cache = True
+    name = "epoch"
+
+
+@compiles(epoch)
+def _compile_epoch(element, compiler, **kw):
+    (arg,) = element.clauses
+    return "EXTRACT(EPOCH FROM %s)" % compiler.process(arg, **kw)
+
+
+@compiles(epoch, "sqlite")
+def _compile_epoch_sqlite(element, compiler, **kw):
+    (arg,) = element.clauses
+    return "((julianday(%s) - 2440587.5) * 86400.0)" % compiler.process(arg, **kw)
+
+
+def dialect_insert(dialect_name: str, table):
+    """INSERT construct with the dialect's ON CONFLICT support."""
+    if dialect_name == "postgresql":
+        return postgresql.insert(table)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upserts are not supported on {dialect_name}")
+
+
+def typed_literal(model, column: str, value, dialect_name: str = "postgresql"):
+    """Bound value typed like model.column.
+
+    PostgreSQL can't infer parameter types where no column gives them away
+    (the select list of INSERT ... SELECT, CASE branches), so it gets a cast.
+    """
+    type_ = model.__table__.c[column].type
+    bound = literal(value, type_=type_)
+    return cast(bound, type_) if dialect_name == "postgresql" else bound
+
+
+class utc_date(FunctionElement):
+    """Calendar date in UTC of a timestamp expression."""
+
+    type = Date()
+    inherit_cache = True
+    name = "utc_date"
+
+
+@compiles(utc_date)
+def _compile_utc_date(element, compiler, **kw):
+    (arg,) = element.clauses
+    return "CAST((%s AT TIME ZONE 'UTC') AS DATE)" % compiler.process(arg, **kw)
+
+
+@compiles(utc_date, "sqlite")
+def _compile_utc_date_sqlite(element, compiler, **kw):
+    # Timestamps are stored as UTC text
+    (arg,) = element.clauses
+    return "date(%s)" % compiler.process(arg, **kw)
@@ -0,0 +1,245 @@
+import logging
+from datetime import timedelta
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from sqlalchemy.exc import SQLAlchemyError
+
+from bot.api.session import RateLimitedSession
+from bot.config import settings
+from bot.db.base import database
+from bot.db.notify import PostgresInvalidationBackend
+from bot.db.pool import pool_wait_stats
+from bot.fsm.storage import create_storage
+from bot.handlers.admin import router as admin_router
+from bot.handlers.common import router as common_router
+from bot.handlers.export import router as export_router
+from bot.handlers.habit_create import router as habit_create_router
+from bot.handlers.habit_manage import router as habit_manage_router
+from bot.middlewares.db import DatabaseMiddleware
+from bot.middlewares.metrics import ApiMetricsMiddleware, HandlerMetricsMiddleware, MetricsMiddleware
+from bot.middlewares.throttling import ThrottlingMiddleware
+from bot.misc.metrics import instrument_engines, metrics
+from bot.services.broadcast import BroadcastService
+from bot.services.habit import get_user_habits_cache
+from bot.services.percentiles import create_percentiles_scheduler, get_streak_percentiles, restore_percentiles
+from bot.services.reminders import ReminderService, create_reminder_scheduler
+from bot.services.rollups import RollupService, create_rollup_scheduler
+from bot.services.warmup import hot_statements
+
+logger = logging.getLogger(__name__)
+
+def create_bot(session: BaseSession | None = None) -> Bot:
+    if session is None:
+        session = RateLimitedSession(
+            global_rate=settings.SEND_GLOBAL_RATE,
+            chat_rate=settings.SEND_CHAT_RATE,
+            chat_burst=settings.SEND_CHAT_BURST,
+            max_retries=settings.SEND_MAX_RETRIES
+        )
+    if settings.METRICS_ENABLED:
+        if isinstance(session, RateLimitedSession) and session.registry is None:
+            session.registry = metrics
+        session.middleware(ApiMetricsMiddleware())
+    return Bot(
+        token=settings.BOT_TOKEN,
+        session=session,
+        default=DefaultBotProperties(parse_mode="HTML")
+    )
+
+def _attach(parent: Router, *routers: Router) -> None:
+    # Handler routers are module singletons; a second dispatcher in the same
+    # process (tests, benchmarks) takes them over from the previous one
+    for router in routers:
+        if router.parent_router is not None:
+            router.parent_router.sub_routers.remove(router)
+            router._parent_router = None
+        parent.include_router(router)
+
+def _setup_database(dp: Dispatcher) -> None:
+    @dp.startup()
+    async def warm_up_database() -> None:
+        # Only saves the first updates some latency, the bot starts without it
+        try:
+            await database.warm_up(hot_statements(database.engine.dialect.name))
+        except (SQLAlchemyError, OSError):
+            logger.exception("Could not warm up the database pool")
+
+def _setup_cache_invalidation(dp: Dispatcher) -> None:
+    @dp.startup()
+    async def share_invalidations() -> None:
+        backend = PostgresInvalidationBackend(settings.DATABASE_URL, channel="user_habits_cache")
+        await backend.start()
+        get_user_habits_cache().use_backend(backend)
+        dp["invalidation_backend"] = backend
+
+    @dp.shutdown()
+    async def stop_invalidations() -> None:
+        backend = dp.workflow_data.pop("invalidation_backend", None)
+        if backend is not None:
+            await backend.close()
+
+def _setup_reminders(dp: Dispatcher) -> None:
+    @dp.startup()
+    async def start_reminders(bot: Bot) -> None:
+        service = ReminderService(
+            database.session_maker,
+            bot,
+            interval=timedelta(seconds=settings.REMINDER_INTERVAL),
+            batch_size=settings.REMINDER_BATCH_SIZE,
+            concurrency=settings.REMINDER_CONCURRENCY
+        )
+        scheduler = create_reminder_scheduler(service, settings.REMINDER_POLL_INTERVAL)
+        scheduler.start()
+        dp["reminder_scheduler"] = scheduler
+
+    @dp.shutdown()
+    async def stop_reminders() -> None:
+        scheduler = dp.workflow_data.pop("reminder_scheduler", None)
+        if scheduler is not None:
+            scheduler.shutdown(wait=False)
+
+def _setup_rollups(dp: Dispatcher) -> None:
+    @dp.startup()
+    async def start_rollups() -> None:
+        service = RollupService(
+            database.session_maker,
+            window=timedelta(seconds=settings.ROLLUP_WINDOW),
+            lag=timedelta(seconds=settings.ROLLUP_LAG)
+        )
+        scheduler = create_rollup_scheduler(service, settings.ROLLUP_INTERVAL)
+        scheduler.start()
+        dp["rollup_scheduler"] = scheduler
+
+    @dp.shutdown()
+    async def stop_rollups() -> None:
+        scheduler = dp.workflow_data.pop("rollup_scheduler", None)
+        if scheduler is not None:
+            scheduler.shutdown(wait=False)
+
+def _setup_percentiles(dp: Dispatcher, persist: bool) -> None:
+    @dp.startup()
+    async def start_percentiles() -> None:
+        # Percentiles are optional, the bot starts without them
+        try:
+            async with database.session_maker() as session:
+                await restore_percentiles(session, get_streak_percentiles())
+        except SQLAlchemyError:
+            logger.exception("Could not restore streak percentiles, starting empty")
+        scheduler = create_percentiles_scheduler(
+            database.session_maker, get_streak_percentiles(), settings.SKETCH_REFRESH_INTERVAL, save=persist
+        )
+        scheduler.start()
+        dp["percentiles_scheduler"] = scheduler
+
+    @dp.shutdown()
+    async def stop_percentiles() -> None:
+        # Nothing to save, the sketches of one process are not the snapshot
+        scheduler = dp.workflow_data.pop("percentiles_scheduler", None)
+        if scheduler is not None:
+            scheduler.shutdown(wait=False)
+
+def _setup_broadcasts(dp: Dispatcher, resume: bool) -> None:
+    @dp.startup()
+    async def resume_broadcasts(bot: Bot) -> None:
+        service = BroadcastService(
+            database.session_maker,
+            batch_size=settings.BROADCAST_BATCH_SIZE,
+            concurrency=settings.BROADCAST_CONCURRENCY
+        )
+        dp["broadcasts"] = service
+        if not resume:
+            return
+        try:
+            resumed = await service.resume(bot)
+        except SQLAlchemyError:
+            logger.exception("Could not resume broadcasts")
+            return
+        if resumed:
+            logger.info("Resumed %d broadcast(s)", len(resumed))
+
+    @dp.shutdown()
+    async def stop_broadcasts() -> None:
+        service = dp.workflow_data.pop("broadcasts", None)
+        if service is not None:
+            await service.stop()
+
+def create_dispatcher(db_middleware: DatabaseMiddleware | None = None, jobs: bool = True) -> Dispatcher:
+    """jobs=False leaves background jobs (check-ins, rollups, saving sketches,
+    resuming broadcasts) to another process, e.g. the first webhook worker."""
+    # Dispatcher is a root router
+    dp = Dispatcher(storage=create_storage(settings, database.engine))
+    if settings.DB_WARMUP:
+        _setup_database(dp)
+
+    # Metrics wrap everything else, including closing the DB session
+    if settings.METRICS_ENABLED:
+        instrument_engines()
+        dp.update.outer_middleware(MetricsMiddleware(settings.METRICS_SAMPLE_RATE))
+        dp.message.middleware(HandlerMetricsMiddleware())
+        dp.callback_query.middleware(HandlerMetricsMiddleware())
+
+    # Flooded updates are dropped before they get a DB session or reach a handler
+    throttling = None
+    if settings.THROTTLE_ENABLED:
+        throttling = ThrottlingMiddleware(
+            rate=settings.THROTTLE_RATE,
+            burst=settings.THROTTLE_BURST,
+            coalesce_window=settings.THROTTLE_COALESCE_WINDOW,
+            max_users=settings.THROTTLE_MAX_USERS
+        )
+        dp.update.outer_middleware(throttling)
+
+    # Register database middleware
+    db_middleware = db_middleware or DatabaseMiddleware()
+    dp.update.middleware(db_middleware)
+
+    # Register all routers
+    _attach(dp, common_router, habit_create_router, habit_manage_router, export_router, admin_router)
+
+    if settings.CACHE_INVALIDATION == "postgres":
+        _setup_cache_invalidation(dp)
+    if settings.REMINDERS_ENABLED and jobs:
+        _setup_reminders(dp)
+    if settings.ROLLUPS_ENABLED and jobs:
+        _setup_rollups(dp)
+    if settings.PERCENTILES_ENABLED:
+        _setup_percentiles(dp, persist=jobs)
+    _setup_broadcasts(dp, resume=jobs)
+
+    @dp.shutdown()
+    async def log_db_usage() -> None:
+        logger.info(
+            "DB sessions used: %d, skipped: %d",
+            db_middleware.sessions_used,
+            db_middleware.sessions_skipped
+        )
+        logger.info(
+            "DB pool checkouts: %d, average wait: %.1f ms, max wait: %.1f ms",
+            pool_wait_stats.checkouts,
+            pool_wait_stats.average_seconds * 1000,
+            pool_wait_stats.max_seconds * 1000
+        )
+        habits_cache = get_user_habits_cache()
+        logger.info(
+            "Habit cache hits: %d, misses: %d, evictions: %d",
+            habits_cache.hits,
+            habits_cache.misses,
+            habits_cache.evictions
+        )
+        if throttling is not None:
+            # Before the bot session is closed
+            await throttling.answered()
+            logger.info(
+                "Updates throttled: %d dropped, %d coalesced",
+                throttling.dropped,
+                throttling.coalesced
+            )
+
+    # Registered last, so it runs after every other shutdown hook
+    @dp.shutdown()
+    async def dispose_database() -> None:
+        await database.dispose()
+
+    return dp
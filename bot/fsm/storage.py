@@ -0,0 +1,234 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+from copy import copy
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Coroutine, Dict, Optional, TypeVar
+
+import pytz
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from bot.config import Settings
+from bot.db.models import FSMState
+from bot.db.sql import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _isolated(coro: Coroutine[Any, Any, T]) -> "asyncio.Task[T]":
+    # Storage I/O serves aiogram, not the handler: a fresh context keeps it out
+    # of the update's query budgets and metrics
+    return asyncio.create_task(coro, context=contextvars.Context())
+
+
+@dataclass
+class SQLStorageRecord:
+    data: Dict[str, Any] = field(default_factory=dict)
+    state: Optional[str] = None
+    touched_at: float = field(default_factory=time.monotonic)
+
+
+class SQLStorage(BaseStorage):
+    """
+    FSM storage persisted in the ``fsm_states`` table.
+
+    Reads are served from an in-process cache. Writes update the cache and
+    mark the key dirty; a background task upserts every dirty key once per
+    ``flush_interval``, so a burst of ``set_state``/``update_data`` calls for
+    one update costs a single write. States untouched for ``state_ttl`` are
+    swept from the table and the cache.
+
+    The cache assumes a user's updates are handled by one process at a time.
+    With ``flush_interval=0`` nothing is cached: every read goes to the table
+    and every write is upserted before it returns, so several processes can
+    serve the same users.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        flush_interval: float = 0.5,
+        state_ttl: timedelta = timedelta(days=1),
+        sweep_interval: float = 600.0,
+        cache_size: int = 10000,
+        key_builder: KeyBuilder | None = None
+    ) -> None:
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.state_ttl = state_ttl
+        self.sweep_interval = sweep_interval
+        self.cache_size = cache_size
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.write_through = flush_interval <= 0
+        self._cache: OrderedDict[str, SQLStorageRecord] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self._last_sweep = time.monotonic()
+        self.flushes = 0
+        self.rows_written = 0
+
+    async def _load(self, storage_key: str) -> SQLStorageRecord:
+        return await _isolated(self._select(storage_key))
+
+    async def _select(self, storage_key: str) -> SQLStorageRecord:
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(
+                select(FSMState.state, FSMState.data).where(FSMState.key == storage_key)
+            )).one_or_none()
+        return SQLStorageRecord(data=dict(row.data or {}), state=row.state) if row else SQLStorageRecord()
+
+    async def _record(self, key: StorageKey) -> SQLStorageRecord:
+        storage_key = self.key_builder.build(key)
+        if self.write_through:
+            return await self._load(storage_key)
+        record = self._cache.get(storage_key)
+        if record is None:
+            loaded = await self._load(storage_key)
+            record = self._cache.get(storage_key)  # filled while we were waiting
+            if record is None:
+                record = loaded
+                self._cache[storage_key] = record
+                self._evict()
+        self._cache.move_to_end(storage_key)
+        return record
+
+    def _evict(self) -> None:
+        # Dirty records stay until they are flushed
+        for storage_key in list(self._cache):
+            if len(self._cache) <= self.cache_size:
+                break
+            if storage_key not in self._dirty:
+                del self._cache[storage_key]
+
+    async def _touch(self, key: StorageKey, record: SQLStorageRecord) -> None:
+        record.touched_at = time.monotonic()
+        if self.write_through:
+            await _isolated(self._write({self.key_builder.build(key): record}))
+            if time.monotonic() - self._last_sweep >= self.sweep_interval:
+                await _isolated(self.sweep())
+            return
+        self._dirty.add(self.key_builder.build(key))
+        if self._flush_task is None or self._flush_task.done():
+            # The loop outlives this update and writes for other updates too
+            self._flush_task = _isolated(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        await self._touch(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._record(key)
+        record.data = data.copy()
+        await self._touch(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key)).data.copy()
+
+    async def get_value(
+        self, storage_key: StorageKey, dict_key: str, default: Optional[Any] = None
+    ) -> Optional[Any]:
+        data = (await self._record(storage_key)).data
+        return copy(data.get(dict_key, default))
+
+    async def _flush_loop(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_sweep >= self.sweep_interval:
+                    await self.sweep()
+            except Exception:
+                logger.exception("Failed to flush FSM states")
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            try:
+                await self._write({storage_key: self._cache[storage_key] for storage_key in keys})
+            except Exception:
+                self._dirty |= keys
+                raise
+            self._evict()
+
+    async def _write(self, records: Dict[str, SQLStorageRecord]) -> None:
+        now = datetime.now(pytz.UTC)
+        upserts, deletes = [], []
+        for storage_key, record in records.items():
+            if record.state is None and not record.data:
+                deletes.append(storage_key)
+            else:
+                upserts.append({
+                    "key": storage_key,
+                    "state": record.state,
+                    "data": record.data.copy(),
+                    "updated_at": now,
+                })
+
+        async with self.engine.begin() as conn:
+            if upserts:
+                statement = dialect_insert(conn.dialect.name, FSMState.__table__)
+                await conn.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=[FSMState.__table__.c.key],
+                        set_={
+                            "state": statement.excluded.state,
+                            "data": statement.excluded.data,
+                            "updated_at": statement.excluded.updated_at,
+                        }
+                    ),
+                    upserts
+                )
+            if deletes:
+                await conn.execute(delete(FSMState).where(FSMState.key.in_(deletes)))
+        self.flushes += 1
+        self.rows_written += len(records)
+
+    async def sweep(self) -> int:
+        """Drop states that have not been written for state_ttl."""
+        self._last_sweep = time.monotonic()
+        cutoff = datetime.now(pytz.UTC) - self.state_ttl
+        async with self.engine.begin() as conn:
+            result = await conn.execute(delete(FSMState).where(FSMState.updated_at < cutoff))
+
+        expired = time.monotonic() - self.state_ttl.total_seconds()
+        for storage_key, record in list(self._cache.items()):
+            if storage_key not in self._dirty and record.touched_at < expired:
+                del self._cache[storage_key]
+        return result.rowcount
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+
+def create_storage(config: Settings, engine: AsyncEngine) -> BaseStorage:
+    if config.FSM_STORAGE == "sql":
+        return SQLStorage(
+            engine,
+            flush_interval=config.FSM_FLUSH_INTERVAL,
+            state_ttl=timedelta(seconds=config.FSM_STATE_TTL)
+        )
+    if config.FSM_STORAGE == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown FSM storage: {config.FSM_STORAGE}")
@@ -0,0 +1,101 @@
+import uuid
+from html import escape
+
+from aiogram import Bot, Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.api.session import delivered
+from bot.config import settings
+from bot.db.budget import query_budget
+from bot.models.schemas import StatsDashboard
+from bot.services.broadcast import BroadcastService
+from bot.services.rollups import StatsService
+
+router = Router()
+
+def _is_admin(message: Message) -> bool:
+    # Read per message, so importing the router needs no settings
+    return message.from_user is not None and message.from_user.id in settings.ADMIN_IDS
+
+# Commands of this router are silently ignored for everyone else
+router.message.filter(_is_admin)
+
+STREAK_LABELS = (
+    ("streaks_under_1d", "до 1д"),
+    ("streaks_1_3d", "1-3д"),
+    ("streaks_3_7d", "3-7д"),
+    ("streaks_7_30d", "7-30д"),
+    ("streaks_30d_plus", "30д+"),
+)
+
+def _format_dashboard(dashboard: StatsDashboard) -> str:
+    lines = ["Дата   Новые Актив Прив. Срывы"]
+    for day in dashboard.days:
+        lines.append(
+            f"{day.day:%d.%m} {day.new_users:>6} {day.active_users:>5} "
+            f"{day.habits_created:>5} {day.relapses:>5}"
+        )
+    totals = dashboard.totals
+    lines.append(
+        f"Всего  {totals.new_users:>5} {'':>5} {totals.habits_created:>5} {totals.relapses:>5}"
+    )
+
+    streaks = sum(getattr(totals, column) for column, _ in STREAK_LABELS)
+    lines.append("\nСерии до срыва:")
+    for column, label in STREAK_LABELS:
+        count = getattr(totals, column)
+        share = 100 * count / streaks if streaks else 0
+        lines.append(f"{label:>6} {count:>7} {share:5.1f}%")
+
+    updated = (
+        f"Данные по {dashboard.updated_to:%d.%m.%Y %H:%M} UTC"
+        if dashboard.updated_to else "Сводка еще не собрана"
+    )
+    return f"📊 Статистика за 7 дней\n<pre>{chr(10).join(lines)}</pre>\n{updated}"
+
+@router.message(Command("admin_stats"))
+@query_budget(3)
+async def admin_stats(message: Message, session: AsyncSession):
+    dashboard = await StatsService(session).get_dashboard(days=7)
+    await message.answer(_format_dashboard(dashboard))
+
+@router.message(Command("broadcast"))
+@query_budget(1)
+async def start_broadcast(
+    message: Message,
+    command: CommandObject,
+    session: AsyncSession,
+    bot: Bot,
+    broadcasts: BroadcastService
+):
+    if not command.args:
+        await message.answer("Использование: /broadcast текст сообщения (HTML-разметка)")
+        return
+    # The preview shows exactly what users get and catches broken markup
+    # first, so it waits for Telegram's answer instead of being queued
+    try:
+        with delivered():
+            await message.answer(command.args)
+    except TelegramBadRequest as e:
+        await message.answer(f"❌ Сообщение не отправлено: {escape(e.message)}")
+        return
+    broadcast_id = await broadcasts.create(session, command.args, message.from_user.id)
+    broadcasts.start(bot, broadcast_id)
+    await message.answer("📣 Рассылка запущена, по завершении придет отчет.")
+
+@router.message(Command("broadcast_retry"))
+async def retry_broadcast(message: Message, command: CommandObject, bot: Bot, broadcasts: BroadcastService):
+    try:
+        broadcast_id = uuid.UUID(command.args or "")
+    except ValueError:
+        await message.answer("Использование: /broadcast_retry id рассылки (из отчета)")
+        return
+    _, user_ids = await broadcasts.stranded(broadcast_id)
+    if not user_ids:
+        await message.answer("Повторять нечего: рассылка еще идет или все отправки учтены.")
+        return
+    broadcasts.start(bot, broadcast_id, retry=True)
+    await message.answer(f"🔁 Повторная отправка запущена ({len(user_ids)} получателей), по завершении придет отчет.")
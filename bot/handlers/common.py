@@ -1,10 +1,13 @@
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.enums import ChatMemberStatus
+from aiogram.types import ChatMemberUpdated, Message
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from bot.keyboards.common import get_main_keyboard, get_habit_list_keyboard
 from bot.fsm.habit import HabitCreation
+from bot.db.budget import query_budget
+from bot.services.broadcast import set_blocked
 from bot.services.habit import HabitService
 
 
@@ -25,6 +28,13 @@ async def cmd_start(message: Message):
         reply_markup=get_main_keyboard()
     )
 
+@router.my_chat_member(F.chat.type == "private")
+@query_budget(1)
+async def track_blocking(event: ChatMemberUpdated, session: AsyncSession):
+    # Broadcasts skip users who blocked the bot until they unblock it
+    blocked = event.new_chat_member.status == ChatMemberStatus.KICKED
+    await set_blocked(session, event.from_user.id, blocked)
+
 @router.message(Command("help"))
 async def cmd_help(message: Message):
     await message.answer(
@@ -34,7 +44,8 @@ async def cmd_help(message: Message):
         "/habit_add - Create new habit\n"
         "/habits - List your habits\n"
         "/relapse - Log a relapse\n"
-        "/history - View history\n\n"
+        "/history - View history\n"
+        "/export - Download your data (csv or ndjson)\n\n"
         "Or use the buttons below 👇",
         reply_markup=get_main_keyboard()
     )
@@ -54,6 +65,7 @@ async def start_new_habit(message: Message, state: FSMContext):
     await state.set_state(HabitCreation.waiting_for_name)
 
 @router.message(F.text == "📈 Progress")
+@query_budget(1)
 async def show_progress(message: Message, session: AsyncSession):
     habit_service = HabitService(session)
     habits = await habit_service.get_user_habits(message.from_user.id)
@@ -0,0 +1,42 @@
+import tempfile
+from pathlib import Path
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, FSInputFile
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.db.budget import query_budget
+from bot.services.export import EXPORT_FORMATS, Exporter
+
+router = Router()
+
+@router.message(Command("export"))
+@query_budget(1)
+async def export_data(
+    message: Message,
+    command: CommandObject,
+    session: AsyncSession
+):
+    fmt = (command.args or "csv").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        await message.answer(
+            "Неизвестный формат. Используйте /export csv или /export ndjson"
+        )
+        return
+
+    user_id = message.from_user.id
+    # The file is written and uploaded from disk, never held in memory
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / f"strong_will_{user_id}.{fmt}.gz"
+        with open(path, "wb") as fileobj, Exporter(fileobj, fmt) as exporter:
+            await exporter.write_users(session, [user_id])
+
+        if not exporter.rows:
+            await message.answer("У вас пока нет данных для выгрузки!")
+            return
+
+        await message.answer_document(
+            FSInputFile(path),
+            caption=f"📦 Ваши данные: привычки, серии и срывы ({exporter.rows} записей)"
+        )
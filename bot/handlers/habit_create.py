@@ -5,6 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.db.base import get_async_session
 from bot.fsm.habit import HabitCreation, HabitDeletion
+from bot.db.budget import query_budget
 from bot.services.habit import HabitService
 from bot.models.schemas import HabitCreate
 from bot.keyboards.common import get_habit_actions_keyboard, get_confirm_keyboard
@@ -14,6 +15,7 @@ router = Router()
 user_data = {}  # Временное хранилище данных в памяти
 
 @router.message(HabitCreation.waiting_for_name)
+@query_budget(3)
 async def process_habit_name(
     message: Message,
     state: FSMContext,
@@ -50,6 +52,7 @@ async def process_delete_request(callback: CallbackQuery, state: FSMContext):
     await state.set_state(HabitDeletion.waiting_for_confirmation)
 
 @router.callback_query(HabitDeletion.waiting_for_confirmation, F.data == "confirm")
+@query_budget(1)
 async def confirm_habit_deletion(
     callback: CallbackQuery,
     state: FSMContext,
@@ -1,16 +1,26 @@
+from datetime import datetime
+from html import escape
+from uuid import UUID
+
 from aiogram import Router, F
+from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.db.base import get_async_session
 from bot.fsm.habit import RelapseLogging
+from bot.db.budget import query_budget
+from bot.services.analytics import AnalyticsService
 from bot.services.habit import HabitService
 from bot.keyboards.common import get_habit_list_keyboard, get_habit_actions_keyboard
+from bot.keyboards.history import HistoryCursor, get_history_keyboard
+from bot.models.schemas import HistoryPage, RelapseAnalytics
 
 router = Router()
 
 @router.message(F.text == "📊 My Habits")
+@query_budget(1)
 async def show_habits(
     message: Message,
     session: AsyncSession
@@ -33,6 +43,7 @@ async def show_habits(
 
 @router.callback_query(F.data.startswith("habit:"))
 @router.callback_query(F.data.startswith("stats:"))
+@query_budget(1)
 async def show_habit_details(
     callback: CallbackQuery,
     session: AsyncSession
@@ -46,17 +57,30 @@ async def show_habit_details(
     
     avg_period = stats.average_period
     avg_period_text = f"{avg_period.days}д {avg_period.hours}ч {avg_period.minutes}м {avg_period.seconds}с"
+
+    longest = stats.longest_streak
+    longest_text = f"{longest.days}д {longest.hours}ч {longest.minutes}м {longest.seconds}с"
     
+    ranking_text = ""
+    if stats.streak_percentile is not None:
+        ranking_text = f"🏅 Ваша серия длиннее, чем у {stats.streak_percentile:.0f}% тех, кто сейчас держится\n"
+    if stats.completed_percentile is not None:
+        ranking_text += f"И длиннее {stats.completed_percentile:.0f}% всех завершенных серий\n"
+
     await callback.message.edit_text(
         f"📊 Статистика:\n\n"
         f"Текущая серия: {streak_text}\n"
+        f"Лучшая серия: {longest_text}\n"
         f"Всего срывов: {stats.total_relapses}\n"
-        f"Средняя продолжительность: {avg_period_text}\n\n"
+        f"Средняя продолжительность: {avg_period_text}\n"
+        f"{ranking_text}\n"
         f"Что бы вы хотели сделать?",
         reply_markup=get_habit_actions_keyboard(habit_id)
     )
 
+@router.message(Command("relapse"))
 @router.message(F.text == "📝 Log Relapse")
+@query_budget(1)
 async def start_relapse_logging(
     message: Message,
     state: FSMContext,
@@ -100,6 +124,7 @@ async def process_relapse_habit(callback: CallbackQuery, state: FSMContext):
     await state.set_state(RelapseLogging.waiting_for_reason)
 
 @router.message(RelapseLogging.waiting_for_reason)
+@query_budget(4)
 async def process_relapse_reason(
     message: Message,
     state: FSMContext,
@@ -110,10 +135,143 @@ async def process_relapse_reason(
     reason = None if message.text == "/skip" else message.text
     
     habit_service = HabitService(session)
-    await habit_service.log_relapse(habit_id, reason)
+    try:
+        await habit_service.log_relapse(habit_id, reason)
+    except ValueError:
+        # A concurrent duplicate (double tap, second device) closed the period first
+        await message.answer("Этот срыв уже отмечен. Ваша новая серия уже идет 💪")
+        await state.clear()
+        return
     
     await message.answer(
         "Срыв отмечен. Не расстраивайтесь, каждая неудача - это шаг к успеху! 💪\n"
         "Ваша новая серия начинается прямо сейчас."
     )
-    await state.clear() 
\ No newline at end of file
+    await state.clear()
+
+
+def _format_seconds(total_seconds: int) -> str:
+    days, remaining = divmod(int(total_seconds), 24 * 3600)
+    hours, remaining = divmod(remaining, 3600)
+    return f"{days}д {hours}ч {remaining // 60}м"
+
+def _format_duration(start_at: datetime, end_at: datetime) -> str:
+    return _format_seconds((end_at - start_at).total_seconds())
+
+def _format_history(page: HistoryPage) -> str:
+    lines = [f"📜 История: {escape(page.habit_name)}\n"]
+    for entry in page.entries:
+        started = entry.start_at.strftime("%d.%m.%Y %H:%M")
+        if entry.end_at is None:
+            duration = _format_duration(entry.start_at, datetime.now(entry.start_at.tzinfo))
+            lines.append(f"🟢 {started} — сейчас ({duration})")
+            continue
+        ended = entry.end_at.strftime("%d.%m.%Y %H:%M")
+        lines.append(f"🔴 {started} — {ended} ({_format_duration(entry.start_at, entry.end_at)})")
+        if entry.relapse_reason:
+            lines.append(f"    Причина: {escape(entry.relapse_reason)}")
+    return "\n".join(lines)
+
+@router.message(Command("history"))
+@query_budget(2)
+async def show_history(message: Message, session: AsyncSession):
+    habit_service = HabitService(session)
+    habits = await habit_service.get_user_habits(message.from_user.id)
+
+    if not habits:
+        await message.answer("У вас пока нет привычек, история пуста!")
+        return
+
+    if len(habits) > 1:
+        await message.answer(
+            "Выберите привычку для просмотра истории:",
+            reply_markup=get_habit_list_keyboard(habits, prefix="history")
+        )
+        return
+
+    page = await habit_service.get_history_page(message.from_user.id, str(habits[0].id))
+    await message.answer(
+        _format_history(page),
+        reply_markup=get_history_keyboard(habits[0].id, page)
+    )
+
+@router.callback_query(F.data.startswith("history:"))
+@router.callback_query(F.data.startswith("h:"))
+@query_budget(1)
+async def show_history_page(callback: CallbackQuery, session: AsyncSession):
+    if callback.data.startswith("history:"):
+        habit_id, cursor = UUID(callback.data.split(":")[1]), None
+    else:
+        try:
+            cursor = HistoryCursor.unpack(callback.data)
+        except ValueError:
+            await callback.answer("Не удалось открыть страницу истории")
+            return
+        habit_id = cursor.habit_id
+
+    habit_service = HabitService(session)
+    page = await habit_service.get_history_page(
+        callback.from_user.id,
+        str(habit_id),
+        cursor=(cursor.start_at, cursor.period_id) if cursor else None,
+        newer=cursor.newer if cursor else False
+    )
+    if not page.entries:
+        await callback.answer("Эта страница истории пуста")
+        return
+
+    await callback.message.edit_text(
+        _format_history(page),
+        reply_markup=get_history_keyboard(habit_id, page)
+    )
+
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+def _format_analytics(analytics: RelapseAnalytics) -> str:
+    if not analytics.total_relapses:
+        return "🔍 Срывов пока не было, анализировать нечего 💪"
+
+    lines = ["🔍 Триггеры срывов\n", f"Всего срывов: {analytics.total_relapses}"]
+    if analytics.median_gap_seconds is not None:
+        lines.append(f"Обычный интервал между срывами: {_format_seconds(analytics.median_gap_seconds)}")
+    if analytics.median_period_seconds is not None:
+        lines.append(f"Обычная серия: {_format_seconds(analytics.median_period_seconds)}")
+    trend = analytics.trend_seconds_per_period
+    if trend is not None:
+        if abs(trend) < 3600:
+            lines.append("Тренд: длина серий стабильна")
+        else:
+            direction, icon = ("длиннее", "📈") if trend > 0 else ("короче", "📉")
+            lines.append(f"Тренд: серии становятся {direction} на {_format_seconds(abs(trend))} за срыв {icon}")
+
+    peak = max(analytics.by_weekday)
+    lines.append("\nПо дням недели (UTC):")
+    for day, count in zip(WEEKDAYS, analytics.by_weekday):
+        bar = "▇" * round(10 * count / peak) if count else ""
+        lines.append(f"{day} {bar} {count}")
+
+    hours = sorted(range(24), key=lambda hour: analytics.by_hour[hour], reverse=True)[:3]
+    hours = [hour for hour in hours if analytics.by_hour[hour]]
+    lines.append(
+        "\nОпасные часы (UTC): "
+        + ", ".join(f"{hour:02d}:00 ({analytics.by_hour[hour]})" for hour in hours)
+    )
+
+    if analytics.top_reasons:
+        reasons = ", ".join(f"{escape(word)} ({count})" for word, count in analytics.top_reasons)
+        lines.append(f"\nЧастые причины: {reasons}")
+    return "\n".join(lines)
+
+@router.callback_query(F.data.startswith("analytics:"))
+@query_budget(2)
+async def show_relapse_analytics(callback: CallbackQuery, session: AsyncSession):
+    habit_id = callback.data.split(":")[1]
+    try:
+        analytics = await AnalyticsService(session).get_relapse_analytics(callback.from_user.id, habit_id)
+    except ValueError:
+        await callback.answer("Привычка не найдена")
+        return
+    await callback.message.edit_text(
+        _format_analytics(analytics),
+        reply_markup=get_habit_actions_keyboard(habit_id)
+    )
@@ -8,10 +8,10 @@ def get_main_keyboard() -> ReplyKeyboardMarkup:
     ]
     return ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
 
-def get_habit_list_keyboard(habits: list) -> InlineKeyboardMarkup:
+def get_habit_list_keyboard(habits: list, prefix: str = "habit") -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     for habit in habits:
-        builder.button(text=habit.name, callback_data=f"habit:{habit.id}")
+        builder.button(text=habit.name, callback_data=f"{prefix}:{habit.id}")
     builder.adjust(1)
     return builder.as_markup()
 
@@ -19,8 +19,10 @@ def get_habit_actions_keyboard(habit_id: str) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="📊 View Stats", callback_data=f"stats:{habit_id}")
     builder.button(text="📝 Log Relapse", callback_data=f"relapse:{habit_id}")
+    builder.button(text="📜 History", callback_data=f"history:{habit_id}")
+    builder.button(text="🔍 Triggers", callback_data=f"analytics:{habit_id}")
     builder.button(text="❌ Delete", callback_data=f"delete:{habit_id}")
-    builder.adjust(2, 1)
+    builder.adjust(2, 2, 1)
     return builder.as_markup()
 
 def get_confirm_keyboard() -> InlineKeyboardMarkup:
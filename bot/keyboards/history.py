@@ -0,0 +1,68 @@
+import base64
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from bot.models.schemas import HistoryPage
+
+CURSOR_PREFIX = "h"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+def _pack_uuid(value: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(value.bytes).rstrip(b"=").decode()
+
+def _unpack_uuid(value: str) -> uuid.UUID:
+    return uuid.UUID(bytes=base64.urlsafe_b64decode(value + "=="))
+
+@dataclass(frozen=True)
+class HistoryCursor:
+    """Position in a habit's history, packed into at most 64 bytes of callback data"""
+    habit_id: uuid.UUID
+    start_at: datetime
+    period_id: uuid.UUID
+    newer: bool
+
+    def pack(self) -> str:
+        # Base64 UUIDs and hex microseconds: h:<22>:<n|o>:<13>:<22>, 63 bytes
+        micros = (self.start_at - EPOCH) // MICROSECOND
+        return ":".join((
+            CURSOR_PREFIX,
+            _pack_uuid(self.habit_id),
+            "n" if self.newer else "o",
+            format(micros, "x"),
+            _pack_uuid(self.period_id),
+        ))
+
+    @classmethod
+    def unpack(cls, data: str) -> "HistoryCursor":
+        try:
+            prefix, habit_id, direction, micros, period_id = data.split(":")
+            if prefix != CURSOR_PREFIX or direction not in ("n", "o"):
+                raise ValueError
+            return cls(
+                habit_id=_unpack_uuid(habit_id),
+                start_at=EPOCH + int(micros, 16) * MICROSECOND,
+                period_id=_unpack_uuid(period_id),
+                newer=direction == "n",
+            )
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid history cursor: {data!r}") from e
+
+def get_history_keyboard(habit_id: uuid.UUID, page: HistoryPage) -> InlineKeyboardMarkup | None:
+    builder = InlineKeyboardBuilder()
+    if page.has_newer:
+        first = page.entries[0]
+        cursor = HistoryCursor(habit_id, first.start_at, first.period_id, newer=True)
+        builder.button(text="◀️", callback_data=cursor.pack())
+    if page.has_older:
+        last = page.entries[-1]
+        cursor = HistoryCursor(habit_id, last.start_at, last.period_id, newer=False)
+        builder.button(text="▶️", callback_data=cursor.pack())
+    if not page.has_newer and not page.has_older:
+        return None
+    builder.adjust(2)
+    return builder.as_markup()
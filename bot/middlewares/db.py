@@ -1,19 +1,54 @@
 from typing import Any, Awaitable, Callable, Dict
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from bot.db.base import get_async_session
+from bot.db.base import database
+
+class LazySession:
+    """Stands in for an AsyncSession and creates the real one on first use."""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], info: dict[str, Any] | None = None):
+        self._session_factory = session_factory
+        self._info = info
+        self._session: AsyncSession | None = None
+
+    @property
+    def used(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._session is None:
+            self._session = self._session_factory()
+            if self._info:
+                self._session.info.update(self._info)
+        return getattr(self._session, name)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
 
 class DatabaseMiddleware(BaseMiddleware):
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession] | None = None):
+        self.session_factory = session_factory or database.session_maker
+        self.sessions_used = 0
+        self.sessions_skipped = 0
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
         event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
-        async for session in get_async_session():
-            data["session"] = session
-            try:
-                return await handler(event, data)
-            finally:
-                await session.close() 
\ No newline at end of file
+        # The user lets a replica-routing session keep them on the primary after their writes
+        user = data.get("event_from_user")
+        session = LazySession(self.session_factory, info={"user_id": user.id} if user else None)
+        data["session"] = session
+        try:
+            return await handler(event, data)
+        finally:
+            if session.used:
+                self.sessions_used += 1
+            else:
+                self.sessions_skipped += 1
+            await session.close()
@@ -0,0 +1,118 @@
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+
+from bot.misc.metrics import COUNT_BUCKETS, MetricsRegistry, UpdateMetrics, current_update, metrics
+
+def handler_name(handler: HandlerObject) -> str:
+    # "habit_manage.show_habit_details": router module and handler function
+    callback = handler.callback
+    module = getattr(callback, "__module__", "") or ""
+    return f"{module.rsplit('.', 1)[-1]}.{getattr(callback, '__name__', type(callback).__name__)}"
+
+class MetricsMiddleware(BaseMiddleware):
+    """Outer update middleware: times sampled updates end to end and records
+    their statement count, DB time, pool wait and Bot API calls."""
+
+    def __init__(
+        self,
+        sample_rate: float = 1.0,
+        registry: MetricsRegistry | None = None,
+        random_: Callable[[], float] = random.random
+    ):
+        self.sample_rate = sample_rate
+        self.registry = registry or metrics
+        self._random = random_
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        self.registry.inc("updates_total")
+        if self.sample_rate < 1.0 and self._random() >= self.sample_rate:
+            return await handler(event, data)
+
+        update_metrics = UpdateMetrics()
+        token = current_update.set(update_metrics)
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            current_update.reset(token)
+            name = update_metrics.handler or "unhandled"
+            registry = self.registry
+            registry.inc("updates_sampled_total")
+            if failed:
+                registry.inc("update_errors_total", handler=name)
+            registry.observe("update_seconds", elapsed, handler=name)
+            registry.observe("update_db_statements", update_metrics.statements, COUNT_BUCKETS, handler=name)
+            registry.observe("update_db_seconds", update_metrics.db_seconds, handler=name)
+            registry.observe("update_pool_wait_seconds", update_metrics.pool_wait_seconds, handler=name)
+            registry.observe("update_api_calls", update_metrics.api_calls, COUNT_BUCKETS, handler=name)
+            registry.observe("update_api_seconds", update_metrics.api_seconds, handler=name)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: names the handler of a sampled update and times it."""
+
+    def __init__(self, registry: MetricsRegistry | None = None):
+        self.registry = registry or metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        update_metrics = current_update.get()
+        if update_metrics is None:
+            return await handler(event, data)
+
+        name = update_metrics.handler = handler_name(data["handler"])
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.registry.observe("handler_seconds", time.perf_counter() - started, handler=name)
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware counting Bot API calls and the time each update
+    waits on them (about 0 for deferred sends).
+
+    Per-method latency is measured here only for sessions that don't time their
+    own HTTP calls; RateLimitedSession does, including deferred deliveries.
+    """
+
+    def __init__(self, registry: MetricsRegistry | None = None):
+        self.registry = registry or metrics
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            elapsed = time.perf_counter() - started
+            if getattr(bot.session, "registry", None) is None:
+                self.registry.observe("telegram_api_seconds", elapsed, method=method.__api_method__)
+            update_metrics = current_update.get()
+            if update_metrics is not None:
+                update_metrics.api_calls += 1
+                update_metrics.api_seconds += elapsed
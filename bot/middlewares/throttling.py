@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject, Update
+
+from bot.misc.metrics import MetricsRegistry, metrics
+from bot.misc.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = float("inf")
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Outer update middleware against flooding users.
+
+    A second tap on the same button (identical callback_data) while the first
+    is handled, or within coalesce_window seconds after it, is dropped; beyond
+    that every user gets a token bucket of burst updates refilled at rate per
+    second. Dropped callbacks are answered so the client stops its spinner,
+    dropped messages are ignored. Neither opens a DB session.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: int = 5,
+        coalesce_window: float = 1.0,
+        max_users: int = 100_000,
+        registry: MetricsRegistry | None = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.coalesce_window = coalesce_window
+        self.max_users = max_users
+        self.registry = registry or metrics
+        self._clock = clock
+        # Least recently active first. A full bucket is the same as none, so
+        # idle users expire after burst / rate seconds
+        self._buckets: OrderedDict[int, TokenBucket] = OrderedDict()
+        # (user, callback_data) -> when a repeat is allowed again
+        self._callbacks: OrderedDict[tuple[int, str], float] = OrderedDict()
+        self.dropped = 0
+        self.coalesced = 0
+        # Answers to dropped callbacks still in flight
+        self._answers: set[asyncio.Task] = set()
+
+    def _bucket(self, user_id: int, now: float) -> TokenBucket:
+        bucket = self._buckets.pop(user_id, None)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, now)
+        self._buckets[user_id] = bucket
+        while len(self._buckets) > 1:
+            oldest = next(iter(self._buckets.values()))
+            if len(self._buckets) <= self.max_users and not oldest.full(now):
+                break
+            self._buckets.popitem(last=False)
+        return bucket
+
+    def _expire_callbacks(self, now: float) -> None:
+        while self._callbacks:
+            allowed_at = next(iter(self._callbacks.values()))
+            if len(self._callbacks) <= self.max_users and allowed_at > now:
+                break
+            self._callbacks.popitem(last=False)
+
+    async def _answer(self, event: Update) -> None:
+        try:
+            await event.callback_query.answer()
+        except TelegramAPIError as e:
+            # Only stops a spinner, e.g. the query may have expired meanwhile
+            logger.debug("Could not answer a dropped callback: %s", e)
+
+    async def answered(self) -> None:
+        """Wait for the answers to dropped callbacks sent so far."""
+        await asyncio.gather(*self._answers, return_exceptions=True)
+
+    def _drop(self, event: Update, counter: str) -> None:
+        self.registry.inc("updates_throttled_total", reason=counter)
+        if event.callback_query is not None:
+            # AnswerCallbackQuery has no chat_id, so the bot session sends it
+            # right away instead of queueing it; don't hold the update for it
+            task = asyncio.create_task(self._answer(event))
+            self._answers.add(task)
+            task.add_done_callback(self._answers.discard)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or not isinstance(event, Update):
+            return await handler(event, data)
+
+        now = self._clock()
+        self._expire_callbacks(now)
+        callback = event.callback_query
+        key = (user.id, callback.data) if callback is not None and callback.data else None
+        if key is not None and self._callbacks.get(key, now) > now:
+            self.coalesced += 1
+            self._drop(event, "coalesced")
+            return None
+
+        bucket = self._bucket(user.id, now)
+        if bucket.delay(now) > 0:
+            self.dropped += 1
+            self._drop(event, "dropped")
+            return None
+        bucket.take(now)
+
+        if key is None:
+            return await handler(event, data)
+        self._callbacks[key] = IN_FLIGHT
+        try:
+            return await handler(event, data)
+        finally:
+            # Ordered by insertion, so an in-flight key can keep expired ones
+            # behind it for a while; they are bounded and no longer match
+            self._callbacks.pop(key, None)
+            self._callbacks[key] = self._clock() + self.coalesce_window
+            while len(self._callbacks) > self.max_users:
+                self._callbacks.popitem(last=False)
@@ -0,0 +1,110 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Protocol, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class InvalidationBackend(Protocol):
+    """Fans cache invalidations out to other processes (e.g. Redis pub/sub)."""
+
+    async def publish(self, key: Hashable) -> None: ...
+
+    def subscribe(self, callback: Callable[[Hashable], None]) -> None: ...
+
+
+class LocalInvalidationBackend:
+    """Single-process backend: invalidations are already applied locally."""
+
+    async def publish(self, key: Hashable) -> None:
+        pass
+
+    def subscribe(self, callback: Callable[[Hashable], None]) -> None:
+        pass
+
+
+class TTLCache(Generic[K, V]):
+    """Bounded LRU cache with per-entry TTL and race-safe fills.
+
+    Readers take a token() before querying the database and pass it to set().
+    A fill is dropped if the key was invalidated after the token was taken, so
+    a slow read can never put pre-write data back into the cache.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        backend: InvalidationBackend | None = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend or LocalInvalidationBackend()
+        self.backend.subscribe(self._invalidate_local)
+        self._clock = clock
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        # Last invalidation epoch per key, bounded like the entries
+        self._invalidations: OrderedDict[K, int] = OrderedDict()
+        self._epoch = 0
+        self._forgotten_epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def use_backend(self, backend: InvalidationBackend) -> None:
+        # Entries filled before the switch may have missed other processes' writes
+        self.backend = backend
+        backend.subscribe(self._invalidate_local)
+        self.clear()
+
+    def get(self, key: K) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def token(self) -> int:
+        return self._epoch
+
+    def set(self, key: K, value: V, token: int) -> bool:
+        if token < self._forgotten_epoch or self._invalidations.get(key, -1) > token:
+            return False
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return True
+
+    def _invalidate_local(self, key: K) -> None:
+        self._epoch += 1
+        self._entries.pop(key, None)
+        self._invalidations[key] = self._epoch
+        self._invalidations.move_to_end(key)
+        while len(self._invalidations) > self.maxsize:
+            _, epoch = self._invalidations.popitem(last=False)
+            self._forgotten_epoch = max(self._forgotten_epoch, epoch)
+
+    async def invalidate(self, key: K) -> None:
+        self._invalidate_local(key)
+        await self.backend.publish(key)
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._forgotten_epoch = self._epoch
+        self._entries.clear()
+        self._invalidations.clear()
+        self.hits = self.misses = self.evictions = 0
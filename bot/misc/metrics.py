@@ -0,0 +1,169 @@
+"""In-process metrics: histograms and counters with Prometheus text output.
+
+Per-update figures (statements, DB time, API calls) are collected into an
+UpdateMetrics bound to a context variable by MetricsMiddleware, so engine
+and session hooks attribute work to the update that caused it without
+passing anything around.
+"""
+import bisect
+import json
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Seconds, roughly logarithmic
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 7, 10, 15, 20, 30, 50, 100)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+
+    def observe(self, name: str, value: float, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def clear(self) -> None:
+        self.histograms.clear()
+        self.counters.clear()
+        self.gauges.clear()
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        for (name, labels), value in sorted({**self.counters, **self.gauges}.items()):
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict[str, Any]:
+        """Compact JSON-friendly summary with estimated quantiles."""
+        return {
+            "counters": {
+                f"{name}{_format_labels(labels)}": value
+                for (name, labels), value in sorted(self.counters.items())
+            },
+            "gauges": {
+                f"{name}{_format_labels(labels)}": value
+                for (name, labels), value in sorted(self.gauges.items())
+            },
+            "histograms": {
+                f"{name}{_format_labels(labels)}": {
+                    "count": histogram.count,
+                    "sum": round(histogram.sum, 6),
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                }
+                for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0])
+            },
+        }
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+metrics = MetricsRegistry()
+
+
+@dataclass
+class UpdateMetrics:
+    handler: str | None = None
+    statements: int = 0
+    db_seconds: float = 0.0
+    pool_wait_seconds: float = 0.0
+    api_calls: int = 0
+    api_seconds: float = 0.0
+    _statement_started: list[float] = field(default_factory=list)
+
+
+current_update: ContextVar[UpdateMetrics | None] = ContextVar("current_update", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    update_metrics = current_update.get()
+    if update_metrics is not None:
+        update_metrics._statement_started.append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    update_metrics = current_update.get()
+    if update_metrics is not None and update_metrics._statement_started:
+        update_metrics.statements += 1
+        update_metrics.db_seconds += time.perf_counter() - update_metrics._statement_started.pop()
+
+
+def instrument_engines() -> None:
+    """Count statements and DB time of every engine for the current update."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def record_pool_wait(seconds: float) -> None:
+    update_metrics = current_update.get()
+    if update_metrics is not None:
+        update_metrics.pool_wait_seconds += seconds
+        metrics.observe("db_pool_wait_seconds", seconds)
@@ -0,0 +1,117 @@
+"""KLL quantile sketch (Karnin, Lang, Liberty 2016).
+
+Keeps O(k log(n/k)) of n streamed values, answers rank and quantile queries
+with an additive rank error around 1.7/k * n, and merges with other sketches
+of the same k. Queries binary search a sorted, weighted view of the retained
+items that is rebuilt lazily after updates.
+"""
+import math
+import random
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Any, Iterable
+
+
+class KLLSketch:
+    __slots__ = ("k", "n", "_compactors", "_max_size", "_size", "_rng", "_view")
+
+    def __init__(self, k: int = 200, seed: int | None = None):
+        if k < 8:
+            raise ValueError("k must be at least 8")
+        self.k = k
+        self.n = 0
+        # Level h holds items of weight 2**h
+        self._compactors: list[list[float]] = [[]]
+        self._size = 0
+        self._max_size = self._capacity(0)
+        self._rng = random.Random(seed)
+        self._view: tuple[list[float], list[int]] | None = None
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self._compactors) - level - 1
+        return math.ceil(self.k * (2 / 3) ** depth) + 1
+
+    def _grow(self) -> None:
+        self._compactors.append([])
+        self._max_size = sum(self._capacity(level) for level in range(len(self._compactors)))
+
+    def update(self, value: float) -> None:
+        self._compactors[0].append(value)
+        self.n += 1
+        self._size += 1
+        self._view = None
+        if self._size >= self._max_size:
+            self._compress()
+
+    def extend(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.update(value)
+
+    def _compress(self) -> None:
+        for level in range(len(self._compactors)):
+            items = self._compactors[level]
+            if len(items) < self._capacity(level):
+                continue
+            if level + 1 == len(self._compactors):
+                self._grow()
+            items.sort()
+            # Keep every other item at twice the weight; an odd one stays behind
+            leftover = [items.pop()] if len(items) % 2 else []
+            self._compactors[level + 1].extend(items[self._rng.random() < 0.5::2])
+            self._compactors[level] = leftover
+            self._size = sum(len(compactor) for compactor in self._compactors)
+            if self._size < self._max_size:
+                break
+
+    def merge(self, other: "KLLSketch") -> None:
+        if other.k != self.k:
+            raise ValueError("Only sketches with the same k can be merged")
+        while len(self._compactors) < len(other._compactors):
+            self._grow()
+        for level, items in enumerate(other._compactors):
+            self._compactors[level].extend(items)
+        self.n += other.n
+        self._size = sum(len(compactor) for compactor in self._compactors)
+        self._view = None
+        while self._size >= self._max_size:
+            before = self._size
+            self._compress()
+            if self._size == before:
+                self._grow()
+
+    def _sorted_view(self) -> tuple[list[float], list[int]]:
+        if self._view is None:
+            weighted = sorted(
+                (value, 1 << level)
+                for level, compactor in enumerate(self._compactors)
+                for value in compactor
+            )
+            values = [value for value, _ in weighted]
+            self._view = (values, list(accumulate(weight for _, weight in weighted)))
+        return self._view
+
+    def rank(self, value: float) -> int:
+        """Estimated number of values <= value"""
+        values, cumulative = self._sorted_view()
+        index = bisect_right(values, value)
+        return cumulative[index - 1] if index else 0
+
+    def quantile(self, q: float) -> float | None:
+        values, cumulative = self._sorted_view()
+        if not values:
+            return None
+        target = q * cumulative[-1]
+        index = bisect_right(cumulative, target)
+        return values[min(index, len(values) - 1)]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"k": self.k, "n": self.n, "compactors": self._compactors}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "KLLSketch":
+        sketch = cls(k=data["k"])
+        sketch._compactors = [list(compactor) for compactor in data["compactors"]] or [[]]
+        sketch.n = data["n"]
+        sketch._size = sum(len(compactor) for compactor in sketch._compactors)
+        sketch._max_size = sum(sketch._capacity(level) for level in range(len(sketch._compactors)))
+        return sketch
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from uuid import UUID
 from pydantic import BaseModel, Field
 
@@ -66,4 +66,69 @@ class TimeProgress(BaseModel):
 class HabitStats(BaseModel):
     total_relapses: int
     average_period: TimeProgress
-    current_streak: TimeProgress 
\ No newline at end of file
+    current_streak: TimeProgress
+    longest_streak: TimeProgress = TimeProgress(days=0, hours=0, minutes=0, seconds=0)
+    total_completed_seconds: int = 0
+    current_period_start: datetime | None = None
+    # Percent of current streaks shorter than this one, and of completed
+    # streaks no longer than it; None while too few streaks are known
+    streak_percentile: float | None = None
+    completed_percentile: float | None = None
+
+class HistoryEntry(BaseModel):
+    period_id: UUID
+    start_at: datetime
+    end_at: datetime | None
+    relapse_reason: str | None = None
+
+class HistoryPage(BaseModel):
+    habit_name: str | None
+    entries: list[HistoryEntry]
+    has_newer: bool = False
+    has_older: bool = False
+
+class RelapseAnalytics(BaseModel):
+    total_relapses: int
+    # Counts per UTC hour (0-23) and weekday (Monday first)
+    by_hour: list[int]
+    by_weekday: list[int]
+    median_gap_seconds: int | None = None
+    median_period_seconds: int | None = None
+    # Change of a completed period's length from one period to the next
+    trend_seconds_per_period: float | None = None
+    top_reasons: list[tuple[str, int]] = []
+
+class DayStats(BaseModel):
+    day: date | None = None
+    new_users: int = 0
+    active_users: int = 0
+    habits_created: int = 0
+    relapses: int = 0
+    streaks_under_1d: int = 0
+    streaks_1_3d: int = 0
+    streaks_3_7d: int = 0
+    streaks_7_30d: int = 0
+    streaks_30d_plus: int = 0
+
+    class Config:
+        from_attributes = True
+
+class StatsDashboard(BaseModel):
+    days: list[DayStats]
+    # Sums over all days; active users are not additive and stay 0
+    totals: DayStats
+    # Events up to this time are included
+    updated_to: datetime | None = None
+
+class BroadcastSummary(BaseModel):
+    id: UUID
+    created_by: int
+    status: str
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    # Claimed but not recorded: in flight, or lost to a crash
+    pending: int = 0
+
+    class Config:
+        from_attributes = True
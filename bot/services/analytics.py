@@ -0,0 +1,140 @@
+import re
+import uuid
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings
+from bot.db.budget import query_budget
+from bot.db.models import Habit, Period, Relapse
+from bot.db.sql import epoch
+from bot.misc.cache import TTLCache
+from bot.models.schemas import RelapseAnalytics
+from bot.services.timeline import PeriodTimeline
+
+WORD = re.compile(r"[^\W\d_]{3,}")
+# Words that say nothing about a trigger
+STOP_WORDS = frozenset({
+    "and", "the", "was", "with", "for", "after", "that", "this", "from",
+    "без", "был", "была", "было", "были", "все", "всё", "где", "для", "его",
+    "еще", "ещё", "как", "меня", "мне", "над", "него", "нет", "она", "они",
+    "очень", "после", "потом", "потому", "при", "просто", "что", "чтобы", "это",
+})
+TOP_REASONS = 5
+
+
+def _latest_relapse_statement(user_id: int, habit_id: uuid.UUID):
+    # The newest closed period carries the latest relapse; walks
+    # ix_periods_habit_id_start_at_id backwards instead of scanning relapses.
+    # No row at all unless the habit belongs to the user
+    latest = (
+        select(Relapse.id)
+        .join(Period, Period.id == Relapse.period_id)
+        .where(Period.habit_id == Habit.id, Period.end_at.is_not(None))
+        .order_by(Period.start_at.desc(), Period.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return select(latest).where(Habit.id == habit_id, Habit.user_id == user_id)
+
+
+def _history_columns_statement(user_id: int, habit_id: uuid.UUID):
+    return (
+        select(
+            epoch(Period.start_at).label("start_at"),
+            epoch(Period.end_at).label("end_at"),
+            epoch(Relapse.occurred_at).label("occurred_at"),
+            Relapse.reason,
+        )
+        .join(Habit, Habit.id == Period.habit_id)
+        .outerjoin(Relapse, Relapse.period_id == Period.id)
+        .where(Period.habit_id == habit_id, Habit.user_id == user_id)
+    )
+
+
+def reason_keywords(reasons, limit: int = TOP_REASONS) -> list[tuple[str, int]]:
+    words = Counter(
+        word
+        for reason in reasons if reason
+        for word in WORD.findall(reason.lower())
+        if word not in STOP_WORDS
+    )
+    return words.most_common(limit)
+
+
+def compute_relapse_analytics(
+    timeline: PeriodTimeline,
+    occurred_at: np.ndarray,
+    reasons: list[str | None]
+) -> RelapseAnalytics:
+    """Bulk statistics over epoch-second arrays, NaN marks a missing value"""
+    occurred = np.sort(occurred_at[~np.isnan(occurred_at)])
+    # Timestamps are UTC; 1970-01-01 was a Thursday, weekday 3 counting from Monday
+    seconds = occurred.astype(np.int64)
+    by_hour = np.bincount(seconds // 3600 % 24, minlength=24)
+    by_weekday = np.bincount((seconds // 86400 + 3) % 7, minlength=7)
+
+    gaps = np.diff(occurred)
+    median_gap = int(np.median(gaps)) if gaps.size else None
+
+    # Slope of completed period lengths against their order, seconds per period
+    lengths = timeline.durations
+    trend = None
+    if lengths.size >= 3:
+        slope, _ = np.polyfit(np.arange(lengths.size), lengths, 1)
+        trend = float(slope)
+
+    return RelapseAnalytics(
+        total_relapses=int(occurred.size),
+        by_hour=by_hour.tolist(),
+        by_weekday=by_weekday.tolist(),
+        median_gap_seconds=median_gap,
+        median_period_seconds=int(np.median(lengths)) if lengths.size else None,
+        trend_seconds_per_period=trend,
+        top_reasons=reason_keywords(reasons),
+    )
+
+
+# Per habit: (latest relapse id, analytics). A new relapse changes the id,
+# so an entry is stale exactly when the id no longer matches
+@lru_cache(maxsize=1)
+def get_analytics_cache() -> TTLCache[uuid.UUID, tuple[uuid.UUID | None, RelapseAnalytics]]:
+    return TTLCache(maxsize=settings.ANALYTICS_CACHE_SIZE, ttl=settings.ANALYTICS_CACHE_TTL)
+
+
+class AnalyticsService:
+    def __init__(
+        self,
+        session: AsyncSession,
+        cache: TTLCache[uuid.UUID, tuple[uuid.UUID | None, RelapseAnalytics]] | None = None
+    ):
+        self.session = session
+        self.cache = cache if cache is not None else get_analytics_cache()
+
+    # Latest relapse lookup, plus the column pull on a cache miss
+    @query_budget(2)
+    async def get_relapse_analytics(self, user_id: int, habit_id: str | uuid.UUID) -> RelapseAnalytics:
+        habit_id = habit_id if isinstance(habit_id, uuid.UUID) else uuid.UUID(habit_id)
+        # Checks ownership before the cache, which is keyed by habit only
+        owned = (await self.session.execute(_latest_relapse_statement(user_id, habit_id))).one_or_none()
+        if owned is None:
+            raise ValueError("Habit not found")
+        latest = owned[0]
+
+        cached = self.cache.get(habit_id)
+        if cached is not None and cached[0] == latest:
+            return cached[1]
+
+        token = self.cache.token()
+        result = await self.session.execute(_history_columns_statement(user_id, habit_id))
+        rows = result.all()
+        columns = list(zip(*rows)) if rows else [(), (), (), ()]
+        start_at, end_at, occurred_at = (np.array(column, dtype=float) for column in columns[:3])
+        analytics = compute_relapse_analytics(
+            PeriodTimeline.from_epochs(start_at, end_at), occurred_at, list(columns[3])
+        )
+        self.cache.set(habit_id, (latest, analytics), token)
+        return analytics
@@ -0,0 +1,270 @@
+"""Announcements to every user.
+
+A broadcast walks users in id order. Each page is claimed in one transaction
+that locks the broadcast row, adds a pending delivery per user and moves the
+cursor past them, so after a crash the broadcast resumes at the next page,
+and several processes running it share the pages. Sends go through
+bulk_sends(): the bot session keeps them under Telegram's global and
+per-chat limits and lets interactive replies go first, while a semaphore
+bounds the messages in flight.
+
+Delivery is at most once, like check-ins: deliveries still pending after a
+crash are not retried on their own, since they may have been sent. Once the
+broadcast is done, an admin can retry them explicitly. Stopping the process
+lets the page being sent finish and be recorded. Users who blocked the bot
+are marked and skipped by later broadcasts until they unblock it.
+"""
+import asyncio
+import contextvars
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+import pytz
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.api.session import bulk_sends
+from bot.db.budget import query_budget
+from bot.db.models import Broadcast, BroadcastDelivery, User
+from bot.models.schemas import BroadcastSummary
+
+logger = logging.getLogger(__name__)
+
+SENT, FAILED, BLOCKED = "sent", "failed", "blocked"
+
+
+def _next_page_statement(cursor: int, batch_size: int):
+    # Keyset on the primary key, every page costs the same
+    return (
+        select(User.id)
+        .where(User.id > cursor, User.is_blocked == False)
+        .order_by(User.id)
+        .limit(batch_size)
+    )
+
+
+def format_summary(summary: BroadcastSummary) -> str:
+    lines = [
+        "📣 Рассылка завершена",
+        f"Доставлено: {summary.sent}",
+        f"Заблокировали бота: {summary.blocked}",
+        f"Ошибки: {summary.failed}",
+    ]
+    if summary.pending:
+        lines.append(f"Неизвестно (сбой во время отправки): {summary.pending}")
+        lines.append(f"Отправить им еще раз: /broadcast_retry {summary.id}")
+    return "\n".join(lines)
+
+
+@query_budget(1)
+async def set_blocked(session: AsyncSession, user_id: int, blocked: bool) -> None:
+    # Blocked users get no check-ins; unblocking schedules one now, and the
+    # claim unschedules users who have no active habits
+    next_reminder_at = None if blocked else func.coalesce(User.next_reminder_at, datetime.now(pytz.UTC))
+    await session.execute(
+        update(User.__table__)
+        .where(User.id == user_id, User.is_blocked != blocked)
+        .values(is_blocked=blocked, next_reminder_at=next_reminder_at)
+    )
+    await session.commit()
+
+
+class BroadcastService:
+    def __init__(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        batch_size: int = 500,
+        concurrency: int = 30
+    ):
+        self.session_maker = session_maker
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: dict[uuid.UUID, asyncio.Task] = {}
+        self._stopping = False
+
+    @query_budget(1)
+    async def create(self, session: AsyncSession, text: str, created_by: int) -> uuid.UUID:
+        broadcast_id = uuid.uuid4()
+        await session.execute(
+            insert(Broadcast.__table__).values(id=broadcast_id, text=text, created_by=created_by)
+        )
+        await session.commit()
+        return broadcast_id
+
+    # Lock the broadcast, read the page, add its deliveries, move the cursor
+    @query_budget(4)
+    async def claim(self, broadcast_id: uuid.UUID) -> tuple[str | None, list[int]]:
+        """Next page of users; no text once the broadcast is no longer running."""
+        async with self.session_maker() as session:
+            broadcast = (await session.execute(
+                select(Broadcast.text, Broadcast.status, Broadcast.cursor)
+                .where(Broadcast.id == broadcast_id)
+                .with_for_update()
+            )).one_or_none()
+            if broadcast is None or broadcast.status != "running":
+                return None, []
+
+            user_ids = list((await session.execute(
+                _next_page_statement(broadcast.cursor, self.batch_size)
+            )).scalars())
+            progress = update(Broadcast.__table__).where(Broadcast.id == broadcast_id)
+            if user_ids:
+                await session.execute(
+                    insert(BroadcastDelivery.__table__),
+                    [{"broadcast_id": broadcast_id, "user_id": user_id} for user_id in user_ids]
+                )
+                await session.execute(progress.values(cursor=user_ids[-1]))
+            else:
+                await session.execute(progress.values(status="done", finished_at=datetime.now(pytz.UTC)))
+            await session.commit()
+        return broadcast.text, user_ids
+
+    @query_budget(1)
+    async def stranded(self, broadcast_id: uuid.UUID) -> tuple[str | None, list[int]]:
+        """Deliveries left pending by a crash; no text unless the broadcast is done."""
+        async with self.session_maker() as session:
+            rows = (await session.execute(
+                select(Broadcast.text, BroadcastDelivery.user_id)
+                .join(BroadcastDelivery, BroadcastDelivery.broadcast_id == Broadcast.id)
+                .where(
+                    Broadcast.id == broadcast_id,
+                    Broadcast.status == "done",
+                    BroadcastDelivery.status == "pending"
+                )
+                .order_by(BroadcastDelivery.user_id)
+            )).all()
+        return (rows[0].text if rows else None), [row.user_id for row in rows]
+
+    async def send(self, bot: Bot, user_id: int, text: str) -> str:
+        async with self._semaphore:
+            try:
+                with bulk_sends():
+                    await bot.send_message(user_id, text)
+                return SENT
+            except TelegramForbiddenError:
+                return BLOCKED
+            except TelegramAPIError as e:
+                logger.warning("Failed to send broadcast to %d: %s", user_id, e)
+                return FAILED
+
+    # A delivery update per outcome, the blocked users, the counters
+    @query_budget(5)
+    async def record(self, broadcast_id: uuid.UUID, outcomes: dict[int, str]) -> None:
+        by_status: dict[str, list[int]] = defaultdict(list)
+        for user_id, status in outcomes.items():
+            by_status[status].append(user_id)
+
+        async with self.session_maker() as session:
+            for status, user_ids in by_status.items():
+                await session.execute(
+                    update(BroadcastDelivery.__table__)
+                    .where(BroadcastDelivery.broadcast_id == broadcast_id, BroadcastDelivery.user_id.in_(user_ids))
+                    .values(status=status)
+                )
+            if by_status[BLOCKED]:
+                await session.execute(
+                    update(User.__table__)
+                    .where(User.id.in_(by_status[BLOCKED]))
+                    .values(is_blocked=True, next_reminder_at=None)
+                )
+            await session.execute(
+                update(Broadcast.__table__)
+                .where(Broadcast.id == broadcast_id)
+                .values(
+                    sent=Broadcast.sent + len(by_status[SENT]),
+                    failed=Broadcast.failed + len(by_status[FAILED]),
+                    blocked=Broadcast.blocked + len(by_status[BLOCKED])
+                )
+            )
+            await session.commit()
+
+    @query_budget(1)
+    async def summary(self, broadcast_id: uuid.UUID) -> BroadcastSummary | None:
+        pending = (
+            select(func.count())
+            .where(BroadcastDelivery.broadcast_id == broadcast_id, BroadcastDelivery.status == "pending")
+            .scalar_subquery()
+        )
+        async with self.session_maker() as session:
+            row = (await session.execute(
+                select(
+                    Broadcast.id, Broadcast.created_by, Broadcast.status,
+                    Broadcast.sent, Broadcast.failed, Broadcast.blocked, pending.label("pending")
+                ).where(Broadcast.id == broadcast_id)
+            )).one_or_none()
+        return BroadcastSummary.model_validate(row) if row else None
+
+    async def _send_page(self, bot: Bot, broadcast_id: uuid.UUID, text: str, user_ids: list[int]) -> None:
+        outcomes = await asyncio.gather(*(self.send(bot, user_id, text) for user_id in user_ids))
+        await self.record(broadcast_id, dict(zip(user_ids, outcomes)))
+
+    async def run(self, bot: Bot, broadcast_id: uuid.UUID) -> bool:
+        """Send until no users are left; True if this call finished the broadcast."""
+        while not self._stopping:
+            text, user_ids = await self.claim(broadcast_id)
+            if not user_ids:
+                return text is not None
+            await self._send_page(bot, broadcast_id, text, user_ids)
+        return False
+
+    async def retry(self, bot: Bot, broadcast_id: uuid.UUID) -> bool:
+        """Send the stranded deliveries again; False if there are none.
+
+        They may have been sent before the crash, so users can get a
+        duplicate. A page still in flight in another process looks stranded
+        too, so this is for an admin to run after the crash, not automatically.
+        """
+        text, user_ids = await self.stranded(broadcast_id)
+        for start in range(0, len(user_ids), self.batch_size):
+            if self._stopping:
+                break
+            await self._send_page(bot, broadcast_id, text, user_ids[start:start + self.batch_size])
+        return bool(user_ids)
+
+    async def _run_and_report(self, bot: Bot, broadcast_id: uuid.UUID, retry: bool = False) -> None:
+        try:
+            finished = await (self.retry if retry else self.run)(bot, broadcast_id)
+            if not finished or self._stopping:
+                return
+            summary = await self.summary(broadcast_id)
+            with bulk_sends():
+                await bot.send_message(summary.created_by, format_summary(summary))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Broadcast %s stopped, it resumes on the next start", broadcast_id)
+
+    def start(self, bot: Bot, broadcast_id: uuid.UUID, retry: bool = False) -> asyncio.Task:
+        """Run (or retry) the broadcast in the background and report to its author."""
+        task = self._tasks.get(broadcast_id)
+        if task is None:
+            # Started from a handler, but not part of its update: a fresh
+            # context leaves the handler's query budget and metrics behind
+            task = asyncio.create_task(
+                self._run_and_report(bot, broadcast_id, retry),
+                name=f"broadcast-{broadcast_id}",
+                context=contextvars.Context()
+            )
+            self._tasks[broadcast_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+        return task
+
+    @query_budget(1)
+    async def resume(self, bot: Bot) -> list[uuid.UUID]:
+        """Start every broadcast a previous process left running."""
+        async with self.session_maker() as session:
+            result = await session.execute(select(Broadcast.id).where(Broadcast.status == "running"))
+            broadcast_ids = list(result.scalars())
+        for broadcast_id in broadcast_ids:
+            self.start(bot, broadcast_id)
+        return broadcast_ids
+
+    async def stop(self) -> None:
+        # The pages being sent are finished and recorded, no new ones are
+        # claimed; the next start carries on after them
+        self._stopping = True
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
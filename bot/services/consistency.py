@@ -0,0 +1,123 @@
+"""Recompute habit counters from period history and report drift.
+
+    python -m bot.services.consistency [--fix]
+"""
+import argparse
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+
+import pytz
+from sqlalchemy import select, func, case, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.db.models import Habit, Period
+from bot.db.sql import epoch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CounterDrift:
+    habit_id: uuid.UUID
+    field: str
+    stored: int | float | None
+    actual: int | float | None
+
+
+def history_aggregates_query():
+    duration = func.round(epoch(Period.end_at) - epoch(Period.start_at))
+    return (
+        select(
+            Period.habit_id,
+            func.count(Period.end_at).label("relapse_count"),
+            func.coalesce(func.sum(duration), 0).label("total_completed_seconds"),
+            func.coalesce(func.max(duration), 0).label("longest_period_seconds"),
+            func.max(case((Period.end_at.is_(None), epoch(Period.start_at)))).label("current_start"),
+        )
+        .group_by(Period.habit_id)
+    )
+
+
+async def find_counter_drift(
+    session: AsyncSession,
+    habit_id: uuid.UUID | None = None,
+    fix: bool = False
+) -> list[CounterDrift]:
+    habits_query = select(
+        Habit.id,
+        Habit.relapse_count,
+        Habit.total_completed_seconds,
+        Habit.longest_period_seconds,
+        epoch(Habit.current_period_start).label("current_start"),
+    )
+    history_query = history_aggregates_query()
+    if habit_id is not None:
+        habits_query = habits_query.where(Habit.id == habit_id)
+        history_query = history_query.where(Period.habit_id == habit_id)
+
+    history = {row.habit_id: row for row in (await session.execute(history_query)).all()}
+
+    drift = []
+    for habit in (await session.execute(habits_query)).all():
+        actual = history.get(habit.id)
+        expected = {
+            "relapse_count": actual.relapse_count if actual else 0,
+            "total_completed_seconds": int(actual.total_completed_seconds) if actual else 0,
+            "longest_period_seconds": int(actual.longest_period_seconds) if actual else 0,
+            "current_start": float(actual.current_start) if actual and actual.current_start is not None else None,
+        }
+        habit_drift = []
+        for field in ("relapse_count", "total_completed_seconds", "longest_period_seconds"):
+            if getattr(habit, field) != expected[field]:
+                habit_drift.append(CounterDrift(habit.id, field, getattr(habit, field), expected[field]))
+
+        stored_start = float(habit.current_start) if habit.current_start is not None else None
+        if (stored_start is None) != (expected["current_start"] is None) or (
+            stored_start is not None and abs(stored_start - expected["current_start"]) >= 1
+        ):
+            habit_drift.append(CounterDrift(habit.id, "current_period_start", stored_start, expected["current_start"]))
+
+        if habit_drift and fix:
+            current_start = expected["current_start"]
+            await session.execute(
+                update(Habit)
+                .where(Habit.id == habit.id)
+                .values(
+                    relapse_count=expected["relapse_count"],
+                    total_completed_seconds=expected["total_completed_seconds"],
+                    longest_period_seconds=expected["longest_period_seconds"],
+                    current_period_start=(
+                        datetime.fromtimestamp(current_start, pytz.UTC) if current_start is not None else None
+                    ),
+                )
+            )
+        drift.extend(habit_drift)
+
+    if fix:
+        await session.commit()
+    return drift
+
+
+async def main(fix: bool) -> None:
+    from bot.db.base import database
+
+    async with database.session_maker() as session:
+        drift = await find_counter_drift(session, fix=fix)
+
+    for item in drift:
+        logger.warning(
+            "Habit %s: %s stored=%s actual=%s", item.habit_id, item.field, item.stored, item.actual
+        )
+    logger.info("%d drifted counters%s", len(drift), " fixed" if fix and drift else "")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fix", action="store_true", help="overwrite drifted counters with recomputed values")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.fix))
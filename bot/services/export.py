@@ -0,0 +1,167 @@
+"""Export habits, periods and relapses as gzip-compressed CSV or NDJSON.
+
+    python -m bot.services.export OUTPUT [--format csv|ndjson] [--batch-size 500]
+
+Rows are streamed from a server-side cursor and compressed chunk by chunk,
+so memory stays flat however long a user's history is. The CLI dumps every
+user, walking the users table in batches.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import BinaryIO, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.db.models import User, Habit, Period, Relapse
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+EXPORT_COLUMNS = (
+    "user_id",
+    "habit_id",
+    "habit_name",
+    "habit_is_active",
+    "habit_created_at",
+    "period_id",
+    "period_start_at",
+    "period_end_at",
+    "relapse_id",
+    "relapse_occurred_at",
+    "relapse_reason",
+)
+
+
+def export_query(user_ids: Sequence[int]):
+    # One row per period with its habit and relapse, deleted habits included
+    return (
+        select(
+            Habit.user_id,
+            Habit.id.label("habit_id"),
+            Habit.name.label("habit_name"),
+            Habit.is_active.label("habit_is_active"),
+            Habit.created_at.label("habit_created_at"),
+            Period.id.label("period_id"),
+            Period.start_at.label("period_start_at"),
+            Period.end_at.label("period_end_at"),
+            Relapse.id.label("relapse_id"),
+            Relapse.occurred_at.label("relapse_occurred_at"),
+            Relapse.reason.label("relapse_reason"),
+        )
+        .join(Period, Period.habit_id == Habit.id)
+        .outerjoin(Relapse, Relapse.period_id == Period.id)
+        .where(Habit.user_id.in_(user_ids))
+        .order_by(Habit.user_id, Habit.created_at, Habit.id, Period.start_at, Period.id)
+    )
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _encode_csv(rows) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(["" if value is None else _value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def _encode_ndjson(rows) -> str:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, map(_value, row))), ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+class Exporter:
+    """Writes export rows of any number of users into one gzip stream"""
+
+    def __init__(self, fileobj: BinaryIO, fmt: str = "csv", chunk_size: int = 1000):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self._encode = _encode_csv if fmt == "csv" else _encode_ndjson
+        self._out = gzip.GzipFile(fileobj=fileobj, mode="wb")
+        if fmt == "csv":
+            self._out.write(_encode_csv([EXPORT_COLUMNS]).encode())
+
+    async def write_users(self, session: AsyncSession, user_ids: Sequence[int]) -> int:
+        result = await session.stream(
+            export_query(user_ids).execution_options(yield_per=self.chunk_size)
+        )
+        written = 0
+        async for partition in result.partitions():
+            # Compression runs off the event loop, one chunk at a time
+            await asyncio.to_thread(self._out.write, self._encode(partition).encode())
+            written += len(partition)
+        self.rows += written
+        return written
+
+    def close(self) -> None:
+        self._out.close()
+
+    def __enter__(self) -> "Exporter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+async def export_all(
+    session_maker: async_sessionmaker,
+    fileobj: BinaryIO,
+    fmt: str = "csv",
+    batch_size: int = 500
+) -> tuple[int, int]:
+    """Export every user, `batch_size` users per query; returns (users, rows)"""
+    users = 0
+    last_id = None
+    with Exporter(fileobj, fmt) as exporter:
+        while True:
+            # Each batch gets its own session, so no transaction spans the dump
+            async with session_maker() as session:
+                query = select(User.id).order_by(User.id).limit(batch_size)
+                if last_id is not None:
+                    query = query.where(User.id > last_id)
+                user_ids = (await session.execute(query)).scalars().all()
+                if not user_ids:
+                    break
+                await exporter.write_users(session, user_ids)
+            users += len(user_ids)
+            last_id = user_ids[-1]
+            logger.info("Exported %d users, %d rows", users, exporter.rows)
+    return users, exporter.rows
+
+
+async def main(output: str, fmt: str, batch_size: int) -> None:
+    from bot.db.base import database
+
+    with open(output, "wb") as fileobj:
+        users, rows = await export_all(database.session_maker, fileobj, fmt, batch_size)
+    logger.info("Wrote %d rows of %d users to %s", rows, users, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("output", help="path of the .gz file to write")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--batch-size", type=int, default=500, help="users per query")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.output, args.format, args.batch_size))
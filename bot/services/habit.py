@@ -1,85 +1,294 @@
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
 import pytz
 from typing import List
-from sqlalchemy import select, func
+from sqlalchemy import select, insert, update, literal, case, func, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from bot.config import settings
+from bot.db.budget import query_budget
 from bot.db.models import User, Habit, Period, Relapse
-from bot.models.schemas import HabitCreate, HabitStats, TimeProgress
+from bot.db.sql import epoch, dialect_insert, typed_literal
+from bot.misc.cache import TTLCache
+from bot.services.percentiles import StreakPercentiles, get_streak_percentiles
+from bot.models.schemas import (
+    HabitCreate, HabitStats, TimeProgress, HistoryEntry, HistoryPage, Habit as HabitSchema
+)
+
+def _as_uuid(value: str | uuid.UUID) -> uuid.UUID:
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(value)
+
+def _ensure_utc(value: datetime) -> datetime:
+    # SQLite hands back naive timestamps
+    return value if value.tzinfo else pytz.UTC.localize(value)
+
+def _attach(session: AsyncSession, instance):
+    # Register a row written with Core statements without reading it back
+    make_transient_to_detached(instance)
+    session.add(instance)
+    return instance
+
+def _user_habits_statement(user_id: int):
+    return select(Habit).where(Habit.user_id == user_id, Habit.is_active == True)
+
+def _habit_stats_statement(habit_id: uuid.UUID):
+    return select(
+        Habit.relapse_count,
+        Habit.total_completed_seconds,
+        Habit.longest_period_seconds,
+        Habit.current_period_start,
+    ).where(Habit.id == habit_id)
+
+def _delete_habit_statement(habit_id: uuid.UUID):
+    return (
+        update(Habit.__table__)
+        .where(Habit.id == habit_id, Habit.is_active == True)
+        .values(is_active=False)
+        .returning(Habit.__table__.c.user_id, Habit.__table__.c.current_period_start)
+    )
+
+def _upsert_user_statement(dialect: str, user_id: int, next_reminder_at: datetime):
+    upsert = dialect_insert(dialect, User.__table__).values(id=user_id, next_reminder_at=next_reminder_at)
+    # Keep a scheduled check-in, start one for users who had none; a user
+    # writing to the bot has unblocked it
+    return upsert.on_conflict_do_update(
+        index_elements=[User.__table__.c.id],
+        set_={
+            "next_reminder_at": func.coalesce(User.__table__.c.next_reminder_at, upsert.excluded.next_reminder_at),
+            "is_blocked": False,
+        }
+    )
+
+def _guarded_habit_insert(values: dict, limit: int, dialect: str):
+    active_habits = (
+        select(func.count())
+        .select_from(Habit.__table__)
+        .where(Habit.user_id == values["user_id"], Habit.is_active == True)
+        .scalar_subquery()
+    )
+    return insert(Habit.__table__).from_select(
+        list(values),
+        select(*(typed_literal(Habit, column, value, dialect) for column, value in values.items()))
+        .where(active_habits < limit)
+    )
+
+def _counters_update(duration, now: datetime):
+    return update(Habit.__table__).values(
+        relapse_count=Habit.relapse_count + 1,
+        total_completed_seconds=Habit.total_completed_seconds + duration,
+        longest_period_seconds=case(
+            (Habit.longest_period_seconds < duration, duration),
+            else_=Habit.longest_period_seconds
+        ),
+        current_period_start=now
+    )
+
+def _create_habit_statement(habit_insert, now: datetime):
+    new_habit = habit_insert.returning(Habit.__table__.c.id).cte("new_habit")
+    return insert(Period.__table__).from_select(
+        ["id", "habit_id", "start_at"],
+        select(typed_literal(Period, "id", uuid.uuid4()), new_habit.c.id, typed_literal(Period, "start_at", now))
+    )
+
+def _log_relapse_statement(habit_id: uuid.UUID, relapse_id: uuid.UUID, reason: str | None, now: datetime):
+    closed = (
+        update(Period.__table__)
+        .where(Period.habit_id == habit_id, Period.end_at.is_(None))
+        .values(end_at=now)
+        .returning(Period.__table__.c.id, Period.__table__.c.start_at, Period.__table__.c.end_at)
+        .cte("closed_period")
+    )
+    duration = func.round(epoch(closed.c.end_at) - epoch(closed.c.start_at))
+    # Selecting from closed_period orders these writes after the close
+    reopened = insert(Period.__table__).from_select(
+        ["id", "habit_id", "start_at"],
+        select(
+            typed_literal(Period, "id", uuid.uuid4()),
+            typed_literal(Period, "habit_id", habit_id),
+            typed_literal(Period, "start_at", now)
+        ).select_from(closed)
+    ).cte("new_period")
+    counters = (
+        _counters_update(duration, now)
+        .where(Habit.id == habit_id)
+        .cte("habit_counters")
+    )
+    relapse = insert(Relapse.__table__).from_select(
+        ["id", "period_id", "occurred_at", "reason"],
+        select(
+            typed_literal(Relapse, "id", relapse_id),
+            closed.c.id,
+            typed_literal(Relapse, "occurred_at", now),
+            typed_literal(Relapse, "reason", reason)
+        )
+    ).cte("new_relapse")
+    # Data-modifying CTEs run whether or not the final SELECT reads them
+    return select(closed.c.id, closed.c.start_at).add_cte(reopened, counters, relapse)
+
+def _history_page_statement(
+    user_id: int,
+    habit_id: uuid.UUID,
+    cursor: tuple[datetime, uuid.UUID] | None,
+    newer: bool,
+    limit: int
+):
+    # Keyset on (start_at, id) walks ix_periods_habit_id_start_at_id from the
+    # cursor, so a deep page costs the same as the first one
+    key = tuple_(Period.start_at, Period.id)
+    statement = (
+        select(Period.id, Period.start_at, Period.end_at, Relapse.reason, Habit.name)
+        .join(Habit, Habit.id == Period.habit_id)
+        .outerjoin(Relapse, Relapse.period_id == Period.id)
+        .where(Period.habit_id == habit_id, Habit.user_id == user_id)
+    )
+    if cursor is not None:
+        statement = statement.where(key > tuple_(*cursor) if newer else key < tuple_(*cursor))
+    if newer:
+        statement = statement.order_by(Period.start_at.asc(), Period.id.asc())
+    else:
+        statement = statement.order_by(Period.start_at.desc(), Period.id.desc())
+    # One extra row tells whether another page follows
+    return statement.limit(limit + 1)
+
+@lru_cache(maxsize=1)
+def get_user_habits_cache() -> TTLCache[int, tuple[HabitSchema, ...]]:
+    """Active habits per user, invalidated by create_habit and delete_habit."""
+    return TTLCache(maxsize=settings.HABIT_CACHE_SIZE, ttl=settings.HABIT_CACHE_TTL)
 
 class HabitService:
-    def __init__(self, session: AsyncSession):
+    def __init__(
+        self,
+        session: AsyncSession,
+        cache: TTLCache[int, tuple[HabitSchema, ...]] | None = None,
+        percentiles: StreakPercentiles | None = None
+    ):
         self.session = session
+        self.cache = cache if cache is not None else get_user_habits_cache()
+        self.percentiles = percentiles if percentiles is not None else get_streak_percentiles()
 
-    async def get_user_habits(self, user_id: int) -> List[Habit]:
-        result = await self.session.execute(
-            select(Habit).where(Habit.user_id == user_id, Habit.is_active == True)
-        )
-        return list(result.scalars().all())
+    @query_budget(1)
+    async def get_user_habits(self, user_id: int) -> List[HabitSchema]:
+        cached = self.cache.get(user_id)
+        if cached is not None:
+            return list(cached)
+
+        token = self.cache.token()
+        result = await self.session.execute(_user_habits_statement(user_id))
+        habits = tuple(HabitSchema.model_validate(habit) for habit in result.scalars())
+        self.cache.set(user_id, habits, token)
+        return list(habits)
 
+    # Upsert user, insert habit, insert period; the last two are one CTE on PostgreSQL
+    @query_budget(3)
     async def create_habit(self, user_id: int, habit_data: HabitCreate) -> Habit:
-        # Check if user exists, create if not
-        user = await self.session.get(User, user_id)
-        if not user:
-            user = User(id=user_id)
-            self.session.add(user)
-
-        # Check habit limit
-        habits_count = await self.session.scalar(
-            select(func.count()).where(
-                Habit.user_id == user_id,
-                Habit.is_active == True
-            )
-        )
-        if habits_count >= 3:
-            raise ValueError("Maximum number of active habits reached (3)")
+        dialect = self.session.get_bind().dialect.name
+        limit = settings.MAX_HABITS_PER_USER
+        now = datetime.now(pytz.UTC)
+        values = {
+            "id": uuid.uuid4(),
+            "user_id": user_id,
+            "name": habit_data.name,
+            "is_active": True,
+            "created_at": now,
+            "relapse_count": 0,
+            "total_completed_seconds": 0,
+            "longest_period_seconds": 0,
+            "current_period_start": now,
+        }
+
+        # Create the user if needed. The update locks the user row, so
+        # concurrent requests of the same user pass the limit check one by one
+        next_reminder_at = now + timedelta(seconds=settings.REMINDER_INTERVAL)
+        await self.session.execute(_upsert_user_statement(dialect, user_id, next_reminder_at))
 
-        # Create habit
-        habit = Habit(user_id=user_id, name=habit_data.name)
-        self.session.add(habit)
-        await self.session.flush()
+        # Create habit only while the user is below the limit
+        habit_insert = _guarded_habit_insert(values, limit, dialect)
+        if dialect == "postgresql":
+            # Insert habit and its initial period in one statement
+            result = await self.session.execute(_create_habit_statement(habit_insert, now))
+            created = result.rowcount == 1
+        else:
+            result = await self.session.execute(habit_insert)
+            created = result.rowcount == 1
+            if created:
+                await self.session.execute(
+                    insert(Period.__table__).values(id=uuid.uuid4(), habit_id=values["id"], start_at=now)
+                )
 
-        # Create initial period
-        period = Period(habit_id=habit.id)
-        self.session.add(period)
+        if not created:
+            await self.session.rollback()
+            raise ValueError(f"Maximum number of active habits reached ({limit})")
         await self.session.commit()
+        await self.cache.invalidate(user_id)
+        self.percentiles.record_start(now)
 
-        return habit
+        return _attach(self.session, Habit(**values))
 
+    @query_budget(1)
     async def delete_habit(self, habit_id: str) -> None:
-        # Get the habit
-        habit = await self.session.get(Habit, habit_id)
-        if not habit:
-            raise ValueError("Habit not found")
-
         # Soft delete by marking as inactive
-        habit.is_active = False
+        result = await self.session.execute(_delete_habit_statement(_as_uuid(habit_id)))
+        deleted = result.one_or_none()
+        if deleted is None:
+            raise ValueError("Habit not found")
         await self.session.commit()
+        await self.cache.invalidate(deleted.user_id)
+        if deleted.current_period_start is not None:
+            self.percentiles.record_removed(deleted.current_period_start)
 
+    # One CTE on PostgreSQL, four statements on SQLite
+    @query_budget(4)
     async def log_relapse(self, habit_id: str, reason: str | None = None) -> Relapse:
-        # Get current period
-        result = await self.session.execute(
-            select(Period)
-            .where(Period.habit_id == habit_id, Period.end_at.is_(None))
-        )
-        current_period = result.scalar_one_or_none()
-        if not current_period:
-            raise ValueError("No active period found for this habit")
-
+        dialect = self.session.get_bind().dialect.name
+        habit_id = _as_uuid(habit_id)
         now = datetime.now(pytz.UTC)
+        relapse_id = uuid.uuid4()
 
-        # End current period
-        current_period.end_at = now
-
-        # Create relapse
-        relapse = Relapse(period_id=current_period.id, reason=reason)
-        self.session.add(relapse)
-
-        # Start new period
-        new_period = Period(habit_id=habit_id, start_at=now)
-        self.session.add(new_period)
+        if dialect == "postgresql":
+            # Close the open period, record the relapse, open a new period and
+            # update the counters in one statement. A concurrent duplicate blocks
+            # on the period row and then finds it already closed, so it does nothing
+            result = await self.session.execute(
+                _log_relapse_statement(habit_id, relapse_id, reason, now)
+            )
+            closed = result.one_or_none()
+            period_id = closed.id if closed else None
+        else:
+            # SQLite serialises writers, the first UPDATE holds the write lock
+            result = await self.session.execute(
+                update(Period.__table__)
+                .where(Period.habit_id == habit_id, Period.end_at.is_(None))
+                .values(end_at=now)
+                .returning(Period.__table__.c.id, Period.__table__.c.start_at)
+            )
+            closed = result.one_or_none()
+            period_id = closed.id if closed else None
+            if closed:
+                duration = round((now - _ensure_utc(closed.start_at)).total_seconds())
+                await self.session.execute(
+                    insert(Relapse.__table__).values(
+                        id=relapse_id, period_id=period_id, occurred_at=now, reason=reason
+                    )
+                )
+                await self.session.execute(
+                    insert(Period.__table__).values(id=uuid.uuid4(), habit_id=habit_id, start_at=now)
+                )
+                await self.session.execute(
+                    _counters_update(literal(duration), now).where(Habit.id == habit_id)
+                )
 
+        if period_id is None:
+            await self.session.rollback()
+            raise ValueError("No active period found for this habit")
         await self.session.commit()
-        return relapse
+        self.percentiles.record_close(closed.start_at, now)
+        self.percentiles.record_start(now)
+
+        return _attach(
+            self.session,
+            Relapse(id=relapse_id, period_id=period_id, occurred_at=now, reason=reason)
+        )
 
     def _seconds_to_time_progress(self, total_seconds: int) -> TimeProgress:
         days = total_seconds // (24 * 3600)
@@ -100,44 +309,78 @@ class HabitService:
 
     def _calculate_time_progress(self, start_time: datetime) -> TimeProgress:
         now = datetime.now(pytz.UTC)
-        if not start_time.tzinfo:
-            start_time = pytz.UTC.localize(start_time)
-        
-        total_seconds = int((now - start_time).total_seconds())
+        total_seconds = int((now - _ensure_utc(start_time)).total_seconds())
         return self._seconds_to_time_progress(total_seconds)
 
+    @query_budget(1)
     async def get_habit_stats(self, habit_id: str) -> HabitStats:
-        # Get all periods
-        result = await self.session.execute(
-            select(Period).where(Period.habit_id == habit_id)
-        )
-        periods = result.scalars().all()
+        # Counters are maintained on the habit row, so this is a primary key lookup
+        result = await self.session.execute(_habit_stats_statement(_as_uuid(habit_id)))
+        row = result.one_or_none()
 
-        # Calculate stats
-        completed_periods = [p for p in periods if p.end_at is not None]
-        total_relapses = len(completed_periods)  # Remove the -1 adjustment
-        
-        # Calculate average period length
-        total_seconds = 0
-        for period in completed_periods:
-            if not period.start_at.tzinfo:
-                period.start_at = pytz.UTC.localize(period.start_at)
-            if not period.end_at.tzinfo:
-                period.end_at = pytz.UTC.localize(period.end_at)
-            duration = period.end_at - period.start_at
-            total_seconds += int(duration.total_seconds())
-
-        avg_period_seconds = total_seconds // len(completed_periods) if completed_periods else 0
+        total_relapses = row.relapse_count if row else 0
+        total_seconds = row.total_completed_seconds if row else 0
+        longest_seconds = row.longest_period_seconds if row else 0
+
+        avg_period_seconds = total_seconds // total_relapses if total_relapses else 0
         avg_period_progress = self._seconds_to_time_progress(avg_period_seconds)
 
         # Calculate current streak
-        current_period = next((p for p in periods if p.end_at is None), None)
+        current_period_start = None
         current_streak = TimeProgress(days=0, hours=0, minutes=0, seconds=0)
-        if current_period:
-            current_streak = self._calculate_time_progress(current_period.start_at)
+        streak_percentile = completed_percentile = None
+        if row and row.current_period_start is not None:
+            current_period_start = _ensure_utc(row.current_period_start)
+            current_streak = self._calculate_time_progress(current_period_start)
+            current_seconds = int((datetime.now(pytz.UTC) - current_period_start).total_seconds())
+            longest_seconds = max(longest_seconds, current_seconds)
+            # Binary searches over the in-memory sketches, no query
+            streak_percentile = self.percentiles.current_percentile(current_period_start)
+            completed_percentile = self.percentiles.completed_percentile(current_seconds)
 
         return HabitStats(
             total_relapses=total_relapses,
             average_period=avg_period_progress,
-            current_streak=current_streak
-        ) 
\ No newline at end of file
+            current_streak=current_streak,
+            longest_streak=self._seconds_to_time_progress(longest_seconds),
+            total_completed_seconds=total_seconds,
+            current_period_start=current_period_start,
+            streak_percentile=streak_percentile,
+            completed_percentile=completed_percentile
+        )
+
+    # Newest first; `cursor` is the (start_at, id) of the edge entry of the
+    # page the user is leaving, `newer` picks the direction from it
+    @query_budget(1)
+    async def get_history_page(
+        self,
+        user_id: int,
+        habit_id: str,
+        cursor: tuple[datetime, uuid.UUID] | None = None,
+        newer: bool = False,
+        limit: int = 5
+    ) -> HistoryPage:
+        result = await self.session.execute(
+            _history_page_statement(user_id, _as_uuid(habit_id), cursor, newer, limit)
+        )
+        rows = result.all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if newer:
+            rows.reverse()
+
+        entries = [
+            HistoryEntry(
+                period_id=row.id,
+                start_at=_ensure_utc(row.start_at),
+                end_at=_ensure_utc(row.end_at) if row.end_at else None,
+                relapse_reason=row.reason
+            )
+            for row in rows
+        ]
+        return HistoryPage(
+            habit_name=rows[0].name if rows else None,
+            entries=entries,
+            has_newer=more if newer else cursor is not None,
+            has_older=cursor is not None if newer else more
+        )
@@ -0,0 +1,205 @@
+"""Streak percentiles from KLL quantile sketches, see bot/misc/quantiles.py.
+
+A current streak that started earlier is longer, so current streaks are
+ranked by the start of their open period. Sketches can't forget values, so
+open periods are two sketches: starts added (new periods) and starts removed
+(closed periods, deleted habits); the rank among open periods is the
+difference of the two ranks. Completed period lengths are only ever added.
+
+The errors of both sketches add up and grow with every closed period while
+the open population stays the same, so once the removed starts outnumber
+SKETCH_REBUILD_CHURN times the open ones, the sketches are rebuilt from the
+periods table with one streaming scan, which leaves nothing removed.
+
+HabitService updates the sketches from its own writes, so a process doesn't
+see the writes of other processes. The snapshot in quantile_sketches is
+therefore only ever written from a scan, by the process running the jobs,
+whenever it is older than SKETCH_MAX_AGE; the other processes load each new
+snapshot, and every process loads a recent one at startup.
+"""
+import logging
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import pytz
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings
+from bot.db.models import Habit, Period, QuantileSketch
+from bot.db.sql import dialect_insert, epoch
+from bot.misc.quantiles import KLLSketch
+
+logger = logging.getLogger(__name__)
+
+SKETCH_NAME = "streaks"
+
+
+def _ensure_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else pytz.UTC.localize(value)
+
+
+class StreakPercentiles:
+    def __init__(self, k: int = 200, min_population: int = 10):
+        self.k = k
+        # Below this many streaks a percentile says more about chance than the user
+        self.min_population = min_population
+        self.started = KLLSketch(k)
+        self.ended = KLLSketch(k)
+        self.completed = KLLSketch(k)
+        # When the periods table was scanned for these sketches
+        self.updated_at: datetime | None = None
+
+    @property
+    def open_count(self) -> int:
+        return self.started.n - self.ended.n
+
+    def drifted(self, churn: float) -> bool:
+        """Whether the removed starts outnumber `churn` times the open ones."""
+        return self.ended.n > churn * max(self.open_count, self.min_population)
+
+    def record_start(self, start_at: datetime) -> None:
+        self.started.update(_ensure_utc(start_at).timestamp())
+
+    def record_close(self, start_at: datetime, end_at: datetime) -> None:
+        start_at = _ensure_utc(start_at)
+        self.ended.update(start_at.timestamp())
+        self.completed.update((_ensure_utc(end_at) - start_at).total_seconds())
+
+    def record_removed(self, start_at: datetime) -> None:
+        self.ended.update(_ensure_utc(start_at).timestamp())
+
+    def current_percentile(self, start_at: datetime) -> float | None:
+        """Share of open streaks, in percent, shorter than one started at start_at"""
+        population = self.open_count
+        if population < self.min_population:
+            return None
+        value = _ensure_utc(start_at).timestamp()
+        longer_or_equal = self.started.rank(value) - self.ended.rank(value)
+        return min(max(100 * (population - longer_or_equal) / population, 0.0), 100.0)
+
+    def completed_percentile(self, seconds: float) -> float | None:
+        """Share of completed streaks, in percent, no longer than `seconds`"""
+        if self.completed.n < self.min_population:
+            return None
+        return 100 * self.completed.rank(seconds) / self.completed.n
+
+    def replace(self, other: "StreakPercentiles") -> None:
+        self.started, self.ended, self.completed = other.started, other.ended, other.completed
+        self.updated_at = other.updated_at
+
+    def to_dict(self) -> dict:
+        return {
+            "started": self.started.to_dict(),
+            "ended": self.ended.to_dict(),
+            "completed": self.completed.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, min_population: int = 10) -> "StreakPercentiles":
+        percentiles = cls(data["started"]["k"], min_population)
+        percentiles.started = KLLSketch.from_dict(data["started"])
+        percentiles.ended = KLLSketch.from_dict(data["ended"])
+        percentiles.completed = KLLSketch.from_dict(data["completed"])
+        return percentiles
+
+    @classmethod
+    async def rebuild(cls, session: AsyncSession, k: int = 200, min_population: int = 10) -> "StreakPercentiles":
+        percentiles = cls(k, min_population)
+        # Writes committed during the scan may be missed until the next one
+        percentiles.updated_at = datetime.now(pytz.UTC)
+        result = await session.stream(
+            select(epoch(Period.start_at), epoch(Period.end_at), Habit.is_active)
+            .join(Habit, Habit.id == Period.habit_id)
+            .execution_options(yield_per=10000)
+        )
+        async for start_at, end_at, is_active in result:
+            if end_at is not None:
+                percentiles.completed.update(float(end_at) - float(start_at))
+            elif is_active:
+                # Closed periods would be added and removed again, leave them out
+                percentiles.started.update(float(start_at))
+        return percentiles
+
+    async def save(self, session: AsyncSession) -> None:
+        dialect = session.get_bind().dialect.name
+        upsert = dialect_insert(dialect, QuantileSketch.__table__).values(
+            name=SKETCH_NAME, data=self.to_dict(), updated_at=self.updated_at or datetime.now(pytz.UTC)
+        )
+        await session.execute(upsert.on_conflict_do_update(
+            index_elements=[QuantileSketch.__table__.c.name],
+            set_={"data": upsert.excluded.data, "updated_at": upsert.excluded.updated_at}
+        ))
+        await session.commit()
+
+    @classmethod
+    async def load(
+        cls,
+        session: AsyncSession,
+        max_age: timedelta,
+        min_population: int = 10
+    ) -> "StreakPercentiles | None":
+        row = (await session.execute(
+            select(QuantileSketch.data, QuantileSketch.updated_at)
+            .where(QuantileSketch.name == SKETCH_NAME)
+        )).one_or_none()
+        if row is None or datetime.now(pytz.UTC) - _ensure_utc(row.updated_at) > max_age:
+            return None
+        percentiles = cls.from_dict(row.data, min_population)
+        percentiles.updated_at = _ensure_utc(row.updated_at)
+        return percentiles
+
+
+@lru_cache(maxsize=1)
+def get_streak_percentiles() -> StreakPercentiles:
+    """Shared by every HabitService of the process."""
+    return StreakPercentiles(settings.SKETCH_K)
+
+
+async def _rebuild(session: AsyncSession, percentiles: StreakPercentiles, save: bool) -> None:
+    rebuilt = await StreakPercentiles.rebuild(session, percentiles.k, percentiles.min_population)
+    if save:
+        await rebuilt.save(session)
+    percentiles.replace(rebuilt)
+    logger.info("Rebuilt streak sketches from %d open periods", rebuilt.open_count)
+
+
+async def restore_percentiles(session: AsyncSession, percentiles: StreakPercentiles) -> None:
+    snapshot = await StreakPercentiles.load(
+        session, timedelta(seconds=settings.SKETCH_MAX_AGE), percentiles.min_population
+    )
+    if snapshot is None:
+        await _rebuild(session, percentiles, save=True)
+    else:
+        percentiles.replace(snapshot)
+
+
+async def refresh_percentiles(session: AsyncSession, percentiles: StreakPercentiles, save: bool) -> None:
+    """Rebuild drifted sketches. The process that saves also rebuilds an old
+    snapshot; the others load a snapshot newer than their sketches."""
+    max_age = timedelta(seconds=settings.SKETCH_MAX_AGE)
+    if percentiles.drifted(settings.SKETCH_REBUILD_CHURN):
+        await _rebuild(session, percentiles, save)
+    elif save:
+        if percentiles.updated_at is None or datetime.now(pytz.UTC) - percentiles.updated_at > max_age:
+            await _rebuild(session, percentiles, save)
+    else:
+        snapshot = await StreakPercentiles.load(session, max_age, percentiles.min_population)
+        if snapshot is not None and (percentiles.updated_at is None or snapshot.updated_at > percentiles.updated_at):
+            percentiles.replace(snapshot)
+
+
+def create_percentiles_scheduler(
+    session_maker,
+    percentiles: StreakPercentiles,
+    interval: float,
+    save: bool
+) -> AsyncIOScheduler:
+    async def refresh() -> None:
+        async with session_maker() as session:
+            await refresh_percentiles(session, percentiles, save)
+
+    scheduler = AsyncIOScheduler(timezone=pytz.UTC)
+    scheduler.add_job(refresh, "interval", seconds=interval, max_instances=1, coalesce=True, id="percentiles")
+    return scheduler
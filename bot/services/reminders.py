@@ -0,0 +1,205 @@
+"""Daily check-in reminders.
+
+Each user's next check-in time is kept in users.next_reminder_at. Workers
+claim due users in batches and move their next check-in forward in the same
+statement; on PostgreSQL the claim uses FOR UPDATE SKIP LOCKED, so any
+number of bot processes can drain the backlog without sending twice. The
+claim also returns the start of every open period, which is all a check-in
+message needs.
+
+Delivery is at most once: a claimed user whose message fails is retried on
+the next interval, not immediately. Users who blocked the bot are marked and
+unscheduled until they unblock it.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from html import escape
+
+import pytz
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import and_, case, exists, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.api.session import bulk_sends
+from bot.db.budget import query_budget
+from bot.db.models import User, Habit, Period
+from bot.db.sql import typed_literal
+
+logger = logging.getLogger(__name__)
+
+MILESTONE_DAYS = {1, 3, 7, 14, 21, 30, 60, 90, 100, 180, 365}
+
+
+@dataclass(frozen=True)
+class CheckIn:
+    habit_name: str
+    period_start: datetime
+
+
+def days_word(days: int) -> str:
+    if days % 10 == 1 and days % 100 != 11:
+        return "день"
+    if 2 <= days % 10 <= 4 and not 12 <= days % 100 <= 14:
+        return "дня"
+    return "дней"
+
+
+def is_milestone(days: int) -> bool:
+    return days in MILESTONE_DAYS or (days > 0 and days % 365 == 0)
+
+
+def format_check_in(check_ins: list[CheckIn], now: datetime) -> str:
+    lines = ["⏰ Ежедневная проверка\n"]
+    for check_in in check_ins:
+        start = check_in.period_start
+        days = (now - (start if start.tzinfo else pytz.UTC.localize(start))).days
+        name = escape(check_in.habit_name)
+        if is_milestone(days):
+            lines.append(f"🏆 {days} {days_word(days)} без срывов: «{name}»!")
+        elif days > 0:
+            lines.append(f"🔥 «{name}»: день {days}")
+        else:
+            lines.append(f"🌱 «{name}»: новый старт, держитесь!")
+    lines.append("\nЕсли был срыв, отметьте его через /relapse.")
+    return "\n".join(lines)
+
+
+def _claim_statement(now: datetime, next_at: datetime, batch_size: int, dialect: str):
+    due = (
+        select(User.id)
+        .where(User.next_reminder_at <= now, User.is_blocked == False)
+        .order_by(User.next_reminder_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    has_active_habits = exists().where(Habit.user_id == User.id, Habit.is_active == True)
+    # Users without active habits drop out until they create one again
+    return (
+        update(User.__table__)
+        .where(User.id.in_(due.scalar_subquery()))
+        .values(next_reminder_at=case(
+            (has_active_habits, typed_literal(User, "next_reminder_at", next_at, dialect)),
+            else_=None
+        ))
+        .returning(User.__table__.c.id)
+    )
+
+
+def _open_periods(user_ids):
+    return (
+        select(Habit.user_id, Habit.name, Period.start_at)
+        .join(Period, and_(Period.habit_id == Habit.id, Period.end_at.is_(None)))
+        .where(Habit.user_id.in_(user_ids), Habit.is_active == True)
+        .order_by(Habit.user_id, Habit.created_at)
+    )
+
+
+class ReminderService:
+    def __init__(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        bot: Bot,
+        interval: timedelta = timedelta(days=1),
+        batch_size: int = 500,
+        concurrency: int = 20
+    ):
+        self.session_maker = session_maker
+        self.bot = bot
+        self.interval = interval
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+
+    @query_budget(2)
+    async def claim(self, now: datetime) -> tuple[int, dict[int, list[CheckIn]]]:
+        """Claim one batch of due users; returns the claimed count and their check-ins."""
+        async with self.session_maker() as session:
+            dialect = session.get_bind().dialect.name
+            claim = _claim_statement(now, now + self.interval, self.batch_size, dialect)
+            if dialect == "postgresql":
+                # Claim and read the open periods in one statement
+                claimed = claim.cte("claimed")
+                result = await session.execute(
+                    select(claimed.c.id, Habit.name, Period.start_at)
+                    .select_from(claimed)
+                    .outerjoin(Habit, and_(Habit.user_id == claimed.c.id, Habit.is_active == True))
+                    .outerjoin(Period, and_(Period.habit_id == Habit.id, Period.end_at.is_(None)))
+                    .order_by(claimed.c.id, Habit.created_at)
+                )
+                rows = result.all()
+                claimed_count = len({row[0] for row in rows})
+            else:
+                # SQLite has no DML in CTEs; the UPDATE holds the write lock
+                user_ids = (await session.execute(claim)).scalars().all()
+                rows = (await session.execute(_open_periods(user_ids))).all() if user_ids else []
+                claimed_count = len(user_ids)
+            await session.commit()
+
+        check_ins: dict[int, list[CheckIn]] = defaultdict(list)
+        for user_id, name, start_at in rows:
+            if start_at is not None:
+                check_ins[user_id].append(CheckIn(name, start_at))
+        return claimed_count, check_ins
+
+    async def send(self, user_id: int, text: str) -> bool:
+        """False if the user has blocked the bot."""
+        async with self._semaphore:
+            try:
+                with bulk_sends():
+                    await self.bot.send_message(user_id, text)
+                self.sent += 1
+            except TelegramForbiddenError:
+                self.blocked += 1
+                return False
+            except TelegramAPIError as e:
+                self.failed += 1
+                logger.warning("Failed to send check-in to %d: %s", user_id, e)
+            return True
+
+    @query_budget(1)
+    async def mark_blocked(self, user_ids: list[int]) -> None:
+        async with self.session_maker() as session:
+            await session.execute(
+                update(User.__table__)
+                .where(User.id.in_(user_ids))
+                .values(is_blocked=True, next_reminder_at=None)
+            )
+            await session.commit()
+
+    async def run_once(self, now: datetime | None = None) -> int:
+        """Drain every due reminder; returns the number of users claimed."""
+        now = now or datetime.now(pytz.UTC)
+        total = 0
+        while True:
+            claimed, check_ins = await self.claim(now)
+            total += claimed
+            delivered = await asyncio.gather(*(
+                self.send(user_id, format_check_in(items, now))
+                for user_id, items in check_ins.items()
+            ))
+            blocked = [user_id for user_id, ok in zip(check_ins, delivered) if not ok]
+            if blocked:
+                await self.mark_blocked(blocked)
+            if claimed < self.batch_size:
+                return total
+
+
+def create_reminder_scheduler(service: ReminderService, poll_interval: float) -> AsyncIOScheduler:
+    scheduler = AsyncIOScheduler(timezone=pytz.UTC)
+    # One drain at a time per process; other processes share the load via SKIP LOCKED
+    scheduler.add_job(
+        service.run_once,
+        "interval",
+        seconds=poll_interval,
+        max_instances=1,
+        coalesce=True,
+        id="reminders"
+    )
+    return scheduler
@@ -0,0 +1,243 @@
+"""Daily rollups behind the admin dashboard.
+
+The job folds events (sign-ups, habit creations, relapses) stamped in
+(watermark, upper] into daily_stats and moves the watermark to upper in the
+same transaction. A run that crashes rolls back whole and the next one folds
+the same window again, so runs are idempotent and resume from the last
+commit. The watermark row is locked while folding, so concurrent processes
+take turns. Every query is a range scan on an event timestamp index.
+
+upper trails now() by `lag`: rows are stamped before their transaction
+commits, and a row that commits behind the watermark would be missed.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import pytz
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import and_, case, func, select, union, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.db.budget import query_budget
+from bot.db.models import User, Habit, Period, Relapse, DailyStats, DailyActiveUser, RollupWatermark
+from bot.db.sql import dialect_insert, epoch, utc_date
+from bot.models.schemas import DayStats, StatsDashboard
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = "daily_stats"
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.UTC)
+
+# Column and upper bound in seconds of each streak length bucket
+STREAK_BUCKETS = (
+    ("streaks_under_1d", 86400),
+    ("streaks_1_3d", 3 * 86400),
+    ("streaks_3_7d", 7 * 86400),
+    ("streaks_7_30d", 30 * 86400),
+    ("streaks_30d_plus", None),
+)
+COUNTERS = ("new_users", "habits_created", "relapses", *(column for column, _ in STREAK_BUCKETS))
+
+
+def _ensure_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else pytz.UTC.localize(value)
+
+
+def _in_window(column, lower: datetime, upper: datetime):
+    return and_(column > lower, column <= upper)
+
+
+def _relapse_counts_query(lower: datetime, upper: datetime):
+    length = epoch(Period.end_at) - epoch(Period.start_at)
+    buckets = []
+    low = 0
+    for column, high in STREAK_BUCKETS:
+        condition = length >= low if high is None else and_(length >= low, length < high)
+        # Counting ids keeps the CASE free of untyped parameters on PostgreSQL
+        buckets.append(func.count(case((condition, Relapse.id))).label(column))
+        low = high
+    day = utc_date(Relapse.occurred_at)
+    return (
+        select(day.label("day"), func.count().label("relapses"), *buckets)
+        .join(Period, Period.id == Relapse.period_id)
+        .where(_in_window(Relapse.occurred_at, lower, upper))
+        .group_by(day)
+    )
+
+
+def _count_by_day_query(column, label: str, lower: datetime, upper: datetime):
+    day = utc_date(column)
+    return (
+        select(day.label("day"), func.count().label(label))
+        .where(_in_window(column, lower, upper))
+        .group_by(day)
+    )
+
+
+def _active_users_insert(dialect: str, lower: datetime, upper: datetime):
+    events = union(
+        select(utc_date(User.created_at), User.id)
+        .where(_in_window(User.created_at, lower, upper)),
+        select(utc_date(Habit.created_at), Habit.user_id)
+        .where(_in_window(Habit.created_at, lower, upper)),
+        select(utc_date(Relapse.occurred_at), Habit.user_id)
+        .join(Period, Period.id == Relapse.period_id)
+        .join(Habit, Habit.id == Period.habit_id)
+        .where(_in_window(Relapse.occurred_at, lower, upper)),
+    )
+    return (
+        dialect_insert(dialect, DailyActiveUser.__table__)
+        .from_select(["day", "user_id"], events)
+        .on_conflict_do_nothing()
+    )
+
+
+def _daily_stats_upsert(dialect: str):
+    table = DailyStats.__table__
+    upsert = dialect_insert(dialect, table)
+    return upsert.on_conflict_do_update(
+        index_elements=[table.c.day],
+        set_={column: table.c[column] + upsert.excluded[column] for column in COUNTERS}
+    )
+
+
+class RollupService:
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        window: timedelta = timedelta(days=1),
+        lag: timedelta = timedelta(minutes=5)
+    ):
+        self.session_maker = session_maker
+        self.window = window
+        self.lag = lag
+
+    async def fold_once(self, now: datetime | None = None) -> datetime | None:
+        """Fold the next window, returns the new watermark or None when caught up"""
+        now = now or datetime.now(pytz.UTC)
+        async with self.session_maker() as session:
+            dialect = session.get_bind().dialect.name
+            # The row has to exist to be locked
+            await session.execute(
+                dialect_insert(dialect, RollupWatermark.__table__)
+                .values(name=ROLLUP_NAME, watermark=EPOCH)
+                .on_conflict_do_nothing()
+            )
+            watermark = _ensure_utc((await session.execute(
+                select(RollupWatermark.watermark)
+                .where(RollupWatermark.name == ROLLUP_NAME)
+                .with_for_update()
+            )).scalar_one())
+
+            if watermark == EPOCH:
+                # First run: skip the empty years before the first user
+                first = (await session.execute(select(func.min(User.created_at)))).scalar_one_or_none()
+                if first is None:
+                    await session.rollback()
+                    return None
+                watermark = _ensure_utc(first) - timedelta(microseconds=1)
+
+            upper = min(watermark + self.window, now - self.lag)
+            if upper <= watermark:
+                await session.rollback()
+                return None
+
+            days = await self._fold(session, dialect, watermark, upper)
+            await session.execute(
+                update(RollupWatermark)
+                .where(RollupWatermark.name == ROLLUP_NAME)
+                .values(watermark=upper)
+            )
+            await session.commit()
+
+        logger.debug("Folded events up to %s into %d days", upper, days)
+        return upper
+
+    async def _fold(self, session: AsyncSession, dialect: str, lower: datetime, upper: datetime) -> int:
+        rows: defaultdict[date, dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+        queries = (
+            _count_by_day_query(User.created_at, "new_users", lower, upper),
+            _count_by_day_query(Habit.created_at, "habits_created", lower, upper),
+            _relapse_counts_query(lower, upper),
+        )
+        for query in queries:
+            for row in (await session.execute(query)).mappings():
+                counts = rows[row["day"]]
+                for column, value in row.items():
+                    if column != "day":
+                        counts[column] += int(value or 0)
+        if not rows:
+            return 0
+
+        await session.execute(
+            _daily_stats_upsert(dialect),
+            [{"day": day, **counts} for day, counts in rows.items()]
+        )
+        # Distinct users can't be summed across windows, so count them per day
+        await session.execute(_active_users_insert(dialect, lower, upper))
+        await session.execute(
+            update(DailyStats)
+            .where(DailyStats.day.in_(list(rows)))
+            .values(
+                active_users=select(func.count())
+                .where(DailyActiveUser.day == DailyStats.day)
+                .scalar_subquery()
+            )
+        )
+        return len(rows)
+
+    async def run_once(self, now: datetime | None = None) -> int:
+        """Fold windows until caught up, returns how many were folded"""
+        # Pinned, or a short lag leaves a sliver of new time to fold forever
+        now = now or datetime.now(pytz.UTC)
+        folded = 0
+        while await self.fold_once(now) is not None:
+            folded += 1
+        if folded:
+            logger.info("Rolled up %d windows of events", folded)
+        return folded
+
+
+class StatsService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    # Reads rollups only: a primary key range, a sum over daily_stats, the watermark
+    @query_budget(3)
+    async def get_dashboard(self, days: int = 7, today: date | None = None) -> StatsDashboard:
+        today = today or datetime.now(pytz.UTC).date()
+        result = await self.session.execute(
+            select(DailyStats)
+            .where(DailyStats.day > today - timedelta(days=days))
+            .order_by(DailyStats.day.desc())
+        )
+        recent = [DayStats.model_validate(row) for row in result.scalars()]
+
+        totals = (await self.session.execute(
+            select(*(func.coalesce(func.sum(DailyStats.__table__.c[column]), 0).label(column) for column in COUNTERS))
+        )).mappings().one()
+
+        watermark = (await self.session.execute(
+            select(RollupWatermark.watermark).where(RollupWatermark.name == ROLLUP_NAME)
+        )).scalar_one_or_none()
+
+        return StatsDashboard(
+            days=recent,
+            totals=DayStats(**{column: int(value) for column, value in totals.items()}),
+            updated_to=_ensure_utc(watermark) if watermark and _ensure_utc(watermark) > EPOCH else None
+        )
+
+
+def create_rollup_scheduler(service: RollupService, interval: float) -> AsyncIOScheduler:
+    scheduler = AsyncIOScheduler(timezone=pytz.UTC)
+    # Processes serialise on the watermark row lock
+    scheduler.add_job(
+        service.run_once,
+        "interval",
+        seconds=interval,
+        max_instances=1,
+        coalesce=True,
+        id="rollups"
+    )
+    return scheduler
@@ -0,0 +1,103 @@
+"""Read-only, array-backed view of a habit's periods for analytics.
+
+Completed periods are kept as two contiguous float64 arrays of epoch seconds
+in start order, plus the start of the open period. Counts, totals and the
+longest streak are precomputed, so they cost O(1); range queries binary
+search the start array and use prefix sums.
+"""
+import uuid
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.db.models import Period
+from bot.db.sql import epoch
+
+
+class PeriodTimeline:
+    __slots__ = ("start_at", "end_at", "open_start", "_cumulative", "_longest")
+
+    def __init__(self, start_at: np.ndarray, end_at: np.ndarray, open_start: float | None = None):
+        """start_at and end_at of completed periods, sorted by start"""
+        self.start_at = np.ascontiguousarray(start_at, dtype=np.float64)
+        self.end_at = np.ascontiguousarray(end_at, dtype=np.float64)
+        self.open_start = open_start
+        durations = self.end_at - self.start_at
+        self._cumulative = np.concatenate(([0.0], np.cumsum(durations)))
+        self._longest = float(durations.max()) if durations.size else 0.0
+
+    @classmethod
+    def from_epochs(cls, start_at, end_at) -> "PeriodTimeline":
+        """Build from unsorted epoch columns where NaN end_at marks the open period"""
+        start_at = np.asarray(start_at, dtype=np.float64)
+        end_at = np.asarray(end_at, dtype=np.float64)
+        completed = ~np.isnan(end_at)
+        order = np.argsort(start_at[completed], kind="stable")
+        open_starts = start_at[~completed]
+        return cls(
+            start_at[completed][order],
+            end_at[completed][order],
+            float(open_starts.max()) if open_starts.size else None
+        )
+
+    @classmethod
+    async def load(cls, session: AsyncSession, habit_id: uuid.UUID) -> "PeriodTimeline":
+        # Two float columns in index order, no ORM instances
+        result = await session.execute(
+            select(epoch(Period.start_at), epoch(Period.end_at))
+            .where(Period.habit_id == habit_id)
+            .order_by(Period.start_at)
+        )
+        # Transposing in Python first is far faster than numpy walking Row objects
+        rows = result.all()
+        start_at, end_at = zip(*rows) if rows else ((), ())
+        return cls.from_epochs(start_at, end_at)
+
+    def __len__(self) -> int:
+        return self.start_at.size
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self.end_at - self.start_at
+
+    @property
+    def total_seconds(self) -> float:
+        return float(self._cumulative[-1])
+
+    @property
+    def longest_seconds(self) -> float:
+        return self._longest
+
+    def current_seconds(self, now: float) -> float:
+        return max(now - self.open_start, 0.0) if self.open_start is not None else 0.0
+
+    def longest_streak(self, now: float) -> float:
+        return max(self._longest, self.current_seconds(now))
+
+    def _slice(self, since: float, until: float) -> tuple[int, int]:
+        # Periods that started in [since, until)
+        return (
+            int(np.searchsorted(self.start_at, since, side="left")),
+            int(np.searchsorted(self.start_at, until, side="left"))
+        )
+
+    def count_between(self, since: float, until: float) -> int:
+        first, last = self._slice(since, until)
+        return last - first
+
+    def total_between(self, since: float, until: float) -> float:
+        first, last = self._slice(since, until)
+        return float(self._cumulative[last] - self._cumulative[first])
+
+    def between(self, since: float, until: float) -> "PeriodTimeline":
+        """Completed periods that started in [since, until); the arrays are views"""
+        first, last = self._slice(since, until)
+        return PeriodTimeline(self.start_at[first:last], self.end_at[first:last])
+
+    def period_at(self, moment: float) -> int | None:
+        """Index of the completed period covering moment, None between periods"""
+        index = int(np.searchsorted(self.start_at, moment, side="right")) - 1
+        if index >= 0 and moment < self.end_at[index]:
+            return index
+        return None
@@ -0,0 +1,57 @@
+"""Statements compiled at startup, see Database.warm_up().
+
+One representative of each statement shape the handlers run. Bound values
+are placeholders: compiled statements are cached by shape, not by value.
+They are executed in a transaction that is rolled back, so they must not
+fail on an empty or a busy database; writes match no rows or are undone.
+"""
+import uuid
+from datetime import datetime
+
+import pytz
+from sqlalchemy.sql.base import Executable
+
+from bot.services.analytics import _history_columns_statement, _latest_relapse_statement
+from bot.services.habit import (
+    _create_habit_statement, _delete_habit_statement, _guarded_habit_insert, _habit_stats_statement,
+    _history_page_statement, _log_relapse_statement, _upsert_user_statement, _user_habits_statement
+)
+
+PAGE_SIZE = 5
+
+
+def hot_statements(dialect: str) -> list[Executable]:
+    now = datetime.now(pytz.UTC)
+    habit_id = uuid.uuid4()
+    cursor = (now, uuid.uuid4())
+    values = {
+        "id": habit_id,
+        "user_id": 0,
+        "name": "",
+        "is_active": True,
+        "created_at": now,
+        "relapse_count": 0,
+        "total_completed_seconds": 0,
+        "longest_period_seconds": 0,
+        "current_period_start": now,
+    }
+    statements = [
+        _user_habits_statement(0),
+        _habit_stats_statement(habit_id),
+        _delete_habit_statement(habit_id),
+        _upsert_user_statement(dialect, 0, now),
+        _history_page_statement(0, habit_id, None, False, PAGE_SIZE),
+        _history_page_statement(0, habit_id, cursor, False, PAGE_SIZE),
+        _history_page_statement(0, habit_id, cursor, True, PAGE_SIZE),
+        _latest_relapse_statement(0, habit_id),
+        _history_columns_statement(0, habit_id),
+    ]
+    habit_insert = _guarded_habit_insert(values, 0, dialect)
+    if dialect == "postgresql":
+        statements += [
+            _create_habit_statement(habit_insert, now),
+            _log_relapse_statement(habit_id, uuid.uuid4(), None, now),
+        ]
+    else:
+        statements.append(habit_insert)
+    return statements
@@ -1,18 +1,9 @@
 import asyncio
 import logging
-from datetime import datetime
-
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
-from aiogram.client.default import DefaultBotProperties
-from aiohttp import web
 
 from bot.config import settings
-from bot.handlers.common import router as common_router
-from bot.handlers.habit_create import router as habit_create_router
-from bot.handlers.habit_manage import router as habit_manage_router
-from bot.middlewares.db import DatabaseMiddleware
+from bot.dispatcher import create_bot, create_dispatcher
+from bot.misc.metrics import metrics
 
 # Configure logging
 logging.basicConfig(
@@ -21,53 +12,40 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-# Initialize bot and dispatcher
-async def main() -> None:
-    # Initialize Bot instance with default properties
-    bot = Bot(
-        token=settings.BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode="HTML")
-    )
-    
-    # Dispatcher is a root router
-    dp = Dispatcher(storage=MemoryStorage())
+async def dump_metrics(path: str, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        metrics.dump(path)
 
-    # Register database middleware
-    dp.update.middleware(DatabaseMiddleware())
+async def run_polling() -> None:
+    bot = create_bot()
+    dp = create_dispatcher()
 
-    # Register all routers
-    dp.include_router(common_router)
-    dp.include_router(habit_create_router)
-    dp.include_router(habit_manage_router)
+    # Without a webhook server there is no /metrics endpoint; dump to a file instead
+    dumper = None
+    if settings.METRICS_ENABLED and settings.METRICS_DUMP_PATH:
+        dumper = asyncio.create_task(dump_metrics(settings.METRICS_DUMP_PATH, settings.METRICS_DUMP_INTERVAL))
 
-    # Start bot
-    if settings.WEBHOOK_ENABLED:
-        # Webhook mode
-        app = web.Application()
-        webhook_requests_handler = SimpleRequestHandler(
-            dispatcher=dp,
-            bot=bot,
-        )
-        webhook_requests_handler.register(app, path=settings.WEBHOOK_PATH)
-        setup_application(app, dp, bot=bot)
+    await bot.delete_webhook(drop_pending_updates=True)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if dumper is not None:
+            dumper.cancel()
+            metrics.dump(settings.METRICS_DUMP_PATH)
 
-        await bot.set_webhook(
-            url=settings.WEBHOOK_URL + settings.WEBHOOK_PATH,
-            drop_pending_updates=True
-        )
+def main() -> None:
+    if settings.WEBHOOK_ENABLED:
+        # Webhook mode, see bot/api/server.py
+        from bot.api.server import run_webhook
 
-        web.run_app(
-            app,
-            host=settings.WEBAPP_HOST,
-            port=settings.WEBAPP_PORT
-        )
+        run_webhook()
     else:
         # Polling mode
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot)
+        asyncio.run(run_polling())
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        main()
     except (KeyboardInterrupt, SystemExit):
-        logging.info("Bot stopped!") 
\ No newline at end of file
+        logging.info("Bot stopped!")
@@ -0,0 +1,47 @@
+import os
+
+# Settings are read from the environment on import
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("QUERY_BUDGET_STRICT", "true")
+# Scripted updates come faster than any user could tap
+os.environ.setdefault("THROTTLE_ENABLED", "false")
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from bot.db.base import Base
+
+# Use an in-memory SQLite database for testing
+TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+
+@pytest.fixture
+async def engine():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+@pytest.fixture
+async def session(engine):
+    async_session = sessionmaker(
+        engine, class_=AsyncSession, expire_on_commit=False
+    )
+    async with async_session() as session:
+        yield session
+
+@pytest.fixture
+def user_id():
+    return 12345
+
+@pytest.fixture(autouse=True)
+def clear_habit_cache():
+    from bot.services.habit import get_user_habits_cache
+
+    get_user_habits_cache().clear()
+    yield
+    get_user_habits_cache().clear()
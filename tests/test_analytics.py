@@ -0,0 +1,127 @@
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+import pytz
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from benchmarks.fakes import FakeBotSession, callback_update
+from bot.db.models import User, Habit, Period, Relapse
+from bot.dispatcher import create_bot, create_dispatcher
+from bot.middlewares.db import DatabaseMiddleware
+from bot.misc.cache import TTLCache
+from bot.services.analytics import AnalyticsService, compute_relapse_analytics, reason_keywords
+from bot.services.habit import HabitService
+from bot.services.timeline import PeriodTimeline
+from bot.models.schemas import HabitCreate
+
+MONDAY = datetime(2026, 10, 12, tzinfo=pytz.UTC)
+
+
+def test_compute_relapse_analytics():
+    # Periods of 1, 2 and 3 days ending on Monday, Wednesday and Saturday at 22:00
+    starts, ends = [], []
+    start = MONDAY - timedelta(hours=2)
+    for days in (1, 2, 3):
+        end = start + timedelta(days=days)
+        starts.append(start.timestamp())
+        ends.append(end.timestamp())
+        start = end
+    starts.append(start.timestamp())
+    ends.append(np.nan)
+
+    analytics = compute_relapse_analytics(
+        PeriodTimeline.from_epochs(starts, ends), np.array(ends), ["стресс", "Стресс на работе", None, None]
+    )
+    assert analytics.total_relapses == 3
+    assert analytics.by_hour[22] == 3 and sum(analytics.by_hour) == 3
+    assert analytics.by_weekday == [1, 0, 1, 0, 0, 1, 0]
+    assert analytics.median_gap_seconds == 2 * 86400 + 43200
+    assert analytics.median_period_seconds == 2 * 86400
+    assert analytics.trend_seconds_per_period == pytest.approx(86400)
+    assert analytics.top_reasons == [("стресс", 2), ("работе", 1)]
+
+
+def test_compute_relapse_analytics_without_relapses():
+    analytics = compute_relapse_analytics(PeriodTimeline.from_epochs([0.0], [np.nan]), np.array([np.nan]), [None])
+    assert analytics.total_relapses == 0
+    assert analytics.median_gap_seconds is None
+    assert analytics.trend_seconds_per_period is None
+
+
+def test_reason_keywords_skip_stop_words():
+    assert reason_keywords(["это был стресс", "просто скука", "стресс"]) == [("стресс", 2), ("скука", 1)]
+
+
+@pytest.mark.asyncio
+async def test_analytics_cached_until_next_relapse(session, user_id):
+    habit_service = HabitService(session)
+    habit = await habit_service.create_habit(user_id, HabitCreate(name="Test Habit"))
+    await habit_service.log_relapse(str(habit.id), "скука")
+
+    service = AnalyticsService(session, TTLCache(maxsize=10, ttl=60))
+    first = await service.get_relapse_analytics(user_id, str(habit.id))
+    assert first.total_relapses == 1
+    assert await service.get_relapse_analytics(user_id, str(habit.id)) is first
+    assert service.cache.hits == 1
+
+    await habit_service.log_relapse(str(habit.id), "скука")
+    second = await service.get_relapse_analytics(user_id, str(habit.id))
+    assert second.total_relapses == 2
+    assert second.top_reasons == [("скука", 2)]
+
+
+@pytest.mark.asyncio
+async def test_latest_relapse_ignores_older_periods(session, user_id):
+    habit_id = uuid.uuid4()
+    await session.execute(insert(User).values(id=user_id))
+    await session.execute(insert(Habit).values(id=habit_id, user_id=user_id, name="Test Habit"))
+    relapse_ids = []
+    for day in range(3):
+        period_id, relapse_id = uuid.uuid4(), uuid.uuid4()
+        start = MONDAY + timedelta(days=day)
+        await session.execute(
+            insert(Period).values(id=period_id, habit_id=habit_id, start_at=start, end_at=start + timedelta(hours=12))
+        )
+        await session.execute(
+            insert(Relapse).values(id=relapse_id, period_id=period_id, occurred_at=start + timedelta(hours=12))
+        )
+        relapse_ids.append(relapse_id)
+    await session.execute(insert(Period).values(id=uuid.uuid4(), habit_id=habit_id, start_at=MONDAY + timedelta(days=3)))
+    await session.commit()
+
+    cache = TTLCache(maxsize=10, ttl=60)
+    analytics = await AnalyticsService(session, cache).get_relapse_analytics(user_id, habit_id)
+    assert analytics.total_relapses == 3
+    assert cache.get(habit_id)[0] == relapse_ids[-1]
+
+
+@pytest.mark.asyncio
+async def test_analytics_of_another_users_habit_are_not_found(session, user_id):
+    habit_service = HabitService(session)
+    habit = await habit_service.create_habit(user_id, HabitCreate(name="Test Habit"))
+    await habit_service.log_relapse(str(habit.id), "ссора с женой")
+    service = AnalyticsService(session, TTLCache(maxsize=10, ttl=60))
+
+    # Not even once the owner's analytics are cached
+    assert (await service.get_relapse_analytics(user_id, habit.id)).total_relapses == 1
+    with pytest.raises(ValueError):
+        await service.get_relapse_analytics(user_id + 1, habit.id)
+    with pytest.raises(ValueError):
+        await service.get_relapse_analytics(user_id, uuid.uuid4())
+
+
+@pytest.mark.asyncio
+async def test_forged_analytics_callback_is_refused(engine, user_id):
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_maker() as session:
+        habit = await HabitService(session).create_habit(user_id, HabitCreate(name="Test Habit"))
+    dp = create_dispatcher(DatabaseMiddleware(session_maker))
+    bot_session = FakeBotSession()
+
+    await dp.feed_update(create_bot(bot_session), callback_update(user_id + 1, f"analytics:{habit.id}"))
+
+    answer, = bot_session.calls
+    assert type(answer).__name__ == "AnswerCallbackQuery" and answer.text == "Привычка не найдена"
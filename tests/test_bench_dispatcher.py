@@ -0,0 +1,25 @@
+import pytest
+
+from benchmarks.bench_dispatcher import compare, run
+
+
+@pytest.mark.asyncio
+async def test_replay_covers_every_handler():
+    result = await run("sqlite+aiosqlite:///:memory:", users=20, actions=10, concurrency=1)
+
+    assert set(result["handlers"]) == {
+        "cmd_start", "start_new_habit", "process_habit_name", "show_habits", "show_progress",
+        "show_habit_details", "start_relapse_from_habit", "process_relapse_reason",
+        "process_delete_request", "confirm_habit_deletion",
+    }
+    assert result["updates"] == sum(stats["count"] for stats in result["handlers"].values())
+    assert result["api_calls"] == result["updates"]
+
+
+def test_compare_reports_regressions_past_threshold():
+    baseline = {"throughput_per_second": 100.0, "handlers": {"cmd_start": {"p95_ms": 10.0}}}
+    within = {"throughput_per_second": 90.0, "handlers": {"cmd_start": {"p95_ms": 11.9}}}
+    slower = {"throughput_per_second": 70.0, "handlers": {"cmd_start": {"p95_ms": 12.5}}}
+
+    assert compare(within, baseline, threshold=0.2) == []
+    assert len(compare(slower, baseline, threshold=0.2)) == 2
@@ -0,0 +1,194 @@
+import asyncio
+
+import pytest
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp.test_utils import TestServer
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from benchmarks.fakes import FakeTelegramServer, message_update
+from bot.api.session import RateLimitedSession
+from bot.config import get_settings
+from bot.db.budget import query_budget
+from bot.db.models import Broadcast, BroadcastDelivery, User
+from bot.dispatcher import create_bot, create_dispatcher
+from bot.middlewares.db import DatabaseMiddleware
+from bot.services.broadcast import BroadcastService, set_blocked
+
+ADMIN_ID = 999
+USER_IDS = list(range(1, 26))
+
+
+@pytest.fixture
+def session_maker(engine):
+    return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest.fixture
+async def users(session_maker):
+    async with session_maker() as session:
+        await session.execute(insert(User.__table__), [{"id": user_id} for user_id in USER_IDS])
+        await session.commit()
+    return USER_IDS
+
+
+@pytest.fixture
+async def telegram():
+    server = FakeTelegramServer()
+    async with TestServer(server.app()) as test_server:
+        server.base_url = str(test_server.make_url("")).rstrip("/")
+        yield server
+
+
+@pytest.fixture
+async def bot(telegram):
+    session = RateLimitedSession(api=TelegramAPIServer.from_base(telegram.base_url), global_rate=1000)
+    bot = create_bot(session)
+    yield bot
+    await bot.session.close()
+
+
+@pytest.fixture
+def broadcasts(session_maker):
+    return BroadcastService(session_maker, batch_size=10, concurrency=4)
+
+
+def recipients(telegram, text):
+    return [int(data["chat_id"]) for data in telegram.calls_of("sendMessage") if data["text"] == text]
+
+
+async def create(session_maker, broadcasts, text):
+    async with session_maker() as session:
+        return await broadcasts.create(session, text, ADMIN_ID)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_everyone_and_skips_blocked(session_maker, broadcasts, bot, telegram, users):
+    telegram.blocked = {3, 17}
+    broadcast_id = await create(session_maker, broadcasts, "news")
+
+    await broadcasts.start(bot, broadcast_id)
+
+    assert sorted(recipients(telegram, "news")) == [user_id for user_id in users if user_id not in (3, 17)]
+    summary = await broadcasts.summary(broadcast_id)
+    assert (summary.status, summary.sent, summary.blocked, summary.failed, summary.pending) == ("done", 23, 2, 0, 0)
+    report, = [data["text"] for data in telegram.calls_of("sendMessage") if data["chat_id"] == str(ADMIN_ID)]
+    assert "Доставлено: 23" in report
+
+    async with session_maker() as session:
+        blocked = (await session.execute(select(User.id).where(User.is_blocked == True))).scalars()
+        assert sorted(blocked) == [3, 17]
+
+    # Marked users are not even tried again, until they unblock the bot
+    telegram.blocked.discard(17)
+    async with session_maker() as session:
+        await set_blocked(session, 17, False)
+    rejected = len(telegram.rejected)
+    await broadcasts.run(bot, await create(session_maker, broadcasts, "more news"))
+    assert len(telegram.rejected) == rejected
+    assert 3 not in recipients(telegram, "more news")
+    assert 17 in recipients(telegram, "more news")
+
+
+@pytest.mark.asyncio
+async def test_crashed_broadcast_resumes_without_resending(
+    session_maker, broadcasts, bot, telegram, users, monkeypatch
+):
+    broadcast_id = await create(session_maker, broadcasts, "news")
+    record = broadcasts.record
+    pages = 0
+
+    async def crash_on_second_page(*args):
+        nonlocal pages
+        pages += 1
+        if pages == 2:
+            raise RuntimeError("worker died")
+        await record(*args)
+
+    # The second page is sent, then the process dies before recording it
+    monkeypatch.setattr(broadcasts, "record", crash_on_second_page)
+    with pytest.raises(RuntimeError):
+        await broadcasts.run(bot, broadcast_id)
+    assert len(recipients(telegram, "news")) == 20
+
+    restarted = BroadcastService(session_maker, batch_size=10)
+    assert await restarted.resume(bot) == [broadcast_id]
+    await restarted.start(bot, broadcast_id)
+
+    sent = recipients(telegram, "news")
+    assert sorted(sent) == users
+    summary = await restarted.summary(broadcast_id)
+    assert (summary.status, summary.sent, summary.pending) == ("done", 15, 10)
+    async with session_maker() as session:
+        pending = await session.scalars(
+            select(BroadcastDelivery.user_id).where(BroadcastDelivery.status == "pending")
+        )
+        assert sorted(pending) == users[10:20]
+    report = [data["text"] for data in telegram.calls_of("sendMessage") if data["chat_id"] == str(ADMIN_ID)][-1]
+    assert f"/broadcast_retry {broadcast_id}" in report
+
+    # Retried on request; they may get it twice, the rest don't
+    await restarted.start(bot, broadcast_id, retry=True)
+    sent = recipients(telegram, "news")
+    assert sorted(sent) == sorted(users + users[10:20])
+    summary = await restarted.summary(broadcast_id)
+    assert (summary.sent, summary.pending) == (25, 0)
+    assert await restarted.stranded(broadcast_id) == (None, [])
+
+
+@pytest.mark.asyncio
+async def test_stop_records_the_page_being_sent(session_maker, broadcasts, bot, telegram, users, monkeypatch):
+    broadcast_id = await create(session_maker, broadcasts, "news")
+    claim = broadcasts.claim
+    stopping = []
+
+    async def stop_after_first_claim(*args):
+        claimed = await claim(*args)
+        if not stopping:
+            stopping.append(asyncio.create_task(broadcasts.stop()))
+        return claimed
+
+    monkeypatch.setattr(broadcasts, "claim", stop_after_first_claim)
+    await broadcasts.start(bot, broadcast_id)
+    await stopping[0]
+
+    # The first page was sent and recorded, no report yet
+    summary = await broadcasts.summary(broadcast_id)
+    assert (summary.status, summary.sent, summary.pending) == ("running", 10, 0)
+    assert len(recipients(telegram, "news")) == 10
+
+    restarted = BroadcastService(session_maker, batch_size=10)
+    assert await restarted.resume(bot) == [broadcast_id]
+    await restarted.start(bot, broadcast_id)
+    assert sorted(recipients(telegram, "news")) == users
+
+
+@pytest.mark.asyncio
+async def test_broadcast_command_previews_first(session_maker, broadcasts, bot, telegram, users, monkeypatch):
+    monkeypatch.setattr(get_settings(), "ADMIN_IDS", [ADMIN_ID])
+    dp = create_dispatcher(DatabaseMiddleware(session_maker), jobs=False)
+    telegram.malformed = {"<b>news"}
+
+    await dp.feed_update(bot, message_update(ADMIN_ID, "/broadcast <b>news"), broadcasts=broadcasts)
+    await dp.feed_update(bot, message_update(users[0], "/broadcast hi"), broadcasts=broadcasts)
+    await bot.session.close()
+
+    # Rejected markup never becomes a broadcast, other users can't send one
+    async with session_maker() as session:
+        assert await session.scalar(select(func.count()).select_from(Broadcast)) == 0
+    reply, = [data["text"] for data in telegram.calls_of("sendMessage") if data["chat_id"] == str(ADMIN_ID)]
+    assert reply.startswith("❌ Сообщение не отправлено")
+    assert not [data for data in telegram.calls_of("sendMessage") if data["chat_id"] == str(users[0])]
+
+
+@pytest.mark.asyncio
+async def test_broadcast_task_is_outside_the_handlers_budget(session_maker, broadcasts, bot, telegram, users):
+    broadcast_id = await create(session_maker, broadcasts, "news")
+
+    # Like the /broadcast handler, still inside its budget while pages are claimed
+    with query_budget(1, "start_broadcast", strict=True) as budget:
+        await broadcasts.start(bot, broadcast_id)
+    assert budget.statements == 0
+
+    summary = await broadcasts.summary(broadcast_id)
+    assert (summary.status, summary.sent) == ("done", len(users))
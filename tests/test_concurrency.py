@@ -0,0 +1,152 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+import pytz
+from sqlalchemy import event, select, func, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from benchmarks.fakes import FakeBotSession, message_update
+from bot.config import settings
+from bot.db.base import Base
+from bot.db.models import Habit, Period, Relapse
+from bot.dispatcher import create_bot, create_dispatcher
+from bot.fsm.habit import RelapseLogging
+from bot.middlewares.db import DatabaseMiddleware
+from bot.models.schemas import HabitCreate
+from bot.services.consistency import find_counter_drift
+from bot.services.habit import HabitService, _create_habit_statement, _guarded_habit_insert, _log_relapse_statement
+
+CALLS = 200
+
+
+@pytest.fixture
+async def file_engine(tmp_path):
+    # Separate connections per session, like a real pool
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'concurrency.db'}",
+        connect_args={"timeout": 60}
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def statement_counter(file_engine):
+    counter = {"statements": 0}
+
+    def before_cursor_execute(*args):
+        counter["statements"] += 1
+
+    event.listen(file_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield counter
+    event.remove(file_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+async def run_concurrently(session_maker, call):
+    async def one(i):
+        async with session_maker() as session:
+            return await call(HabitService(session), i)
+
+    return await asyncio.gather(*(one(i) for i in range(CALLS)), return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_create_habit_respects_limit(file_engine, statement_counter, user_id):
+    session_maker = async_sessionmaker(file_engine, class_=AsyncSession, expire_on_commit=False)
+
+    results = await run_concurrently(
+        session_maker,
+        lambda service, i: service.create_habit(user_id, HabitCreate(name=f"Habit {i}"))
+    )
+
+    created = [r for r in results if isinstance(r, Habit)]
+    errors = [r for r in results if isinstance(r, Exception)]
+    assert len(created) == settings.MAX_HABITS_PER_USER
+    assert all(isinstance(e, ValueError) for e in errors)
+
+    # Upsert + guarded insert, plus the initial period when created
+    assert statement_counter["statements"] == 2 * CALLS + len(created)
+
+    async with session_maker() as session:
+        habits = await session.scalar(select(func.count()).select_from(Habit))
+        periods = await session.scalar(select(func.count()).select_from(Period))
+    assert habits == periods == settings.MAX_HABITS_PER_USER
+
+
+@pytest.mark.asyncio
+async def test_concurrent_log_relapse_keeps_one_open_period(file_engine, statement_counter, user_id):
+    session_maker = async_sessionmaker(file_engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_maker() as session:
+        habit = await HabitService(session).create_habit(user_id, HabitCreate(name="Test Habit"))
+    statement_counter["statements"] = 0
+
+    results = await run_concurrently(
+        session_maker,
+        lambda service, i: service.log_relapse(str(habit.id), f"Reason {i}")
+    )
+
+    relapses = [r for r in results if isinstance(r, Relapse)]
+    assert len(relapses) == CALLS
+    assert statement_counter["statements"] == 4 * CALLS
+
+    async with session_maker() as session:
+        open_periods = await session.scalar(
+            select(func.count()).select_from(Period).where(Period.end_at.is_(None))
+        )
+        closed_periods = await session.scalar(
+            select(func.count()).select_from(Period).where(Period.end_at.is_not(None))
+        )
+        relapse_rows = await session.scalar(select(func.count()).select_from(Relapse))
+        stats = await HabitService(session).get_habit_stats(str(habit.id))
+        drift = await find_counter_drift(session)
+
+    assert open_periods == 1
+    assert closed_periods == relapse_rows == stats.total_relapses == CALLS
+    assert drift == []
+
+
+def test_postgres_write_paths_are_single_statements(user_id):
+    now = datetime.now(pytz.UTC)
+    values = {"id": uuid.uuid4(), "user_id": user_id, "name": "Test Habit", "current_period_start": now}
+    dialect = postgresql.dialect()
+
+    create = str(_create_habit_statement(_guarded_habit_insert(values, 3, "postgresql"), now).compile(dialect=dialect))
+    relapse = str(_log_relapse_statement(uuid.uuid4(), uuid.uuid4(), None, now).compile(dialect=dialect))
+
+    assert create.startswith("WITH new_habit AS")
+    assert "INSERT INTO periods" in create
+    assert relapse.startswith("WITH closed_period AS")
+    assert "UPDATE periods" in relapse
+    assert "new_period AS" in relapse and "habit_counters AS" in relapse
+    assert "new_relapse AS" in relapse
+
+
+@pytest.mark.asyncio
+async def test_duplicate_relapse_reason_is_answered(engine, user_id):
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    bot_session = FakeBotSession()
+    bot = create_bot(bot_session)
+    dp = create_dispatcher(DatabaseMiddleware(session_maker))
+    async with session_maker() as session:
+        habit = await HabitService(session).create_habit(user_id, HabitCreate(name="Test Habit"))
+        # What a concurrent duplicate finds on PostgreSQL: the period is already closed
+        await session.execute(
+            update(Period.__table__).where(Period.habit_id == habit.id).values(end_at=datetime.now(pytz.UTC))
+        )
+        await session.commit()
+    state = dp.fsm.get_context(bot, chat_id=user_id, user_id=user_id)
+    await state.set_state(RelapseLogging.waiting_for_reason)
+    await state.update_data(habit_id=str(habit.id))
+
+    await dp.feed_update(bot, message_update(user_id, "Стресс"))
+
+    reply, = bot_session.calls
+    assert "уже отмечен" in reply.text
+    assert await state.get_state() is None
+    async with session_maker() as session:
+        assert await session.scalar(select(func.count()).select_from(Relapse)) == 0
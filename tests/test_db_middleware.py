@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.middlewares.db import DatabaseMiddleware, LazySession
+
+
+class CountingFactory:
+    def __init__(self, engine):
+        self.session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.session_maker()
+
+
+@pytest.mark.asyncio
+async def test_session_is_not_created_for_handlers_without_db(engine):
+    factory = CountingFactory(engine)
+    middleware = DatabaseMiddleware(factory)
+
+    async def handler(event, data):
+        return "ok"
+
+    assert await middleware(handler, object(), {}) == "ok"
+    assert factory.calls == 0
+    assert (middleware.sessions_used, middleware.sessions_skipped) == (0, 1)
+
+
+@pytest.mark.asyncio
+async def test_session_is_created_on_first_use(engine):
+    factory = CountingFactory(engine)
+    middleware = DatabaseMiddleware(factory)
+
+    async def handler(event, data):
+        session = data["session"]
+        assert isinstance(session, LazySession) and not session.used
+        first = await session.scalar(select(1))
+        second = await session.scalar(select(2))
+        return first + second
+
+    assert await middleware(handler, object(), {}) == 3
+    assert factory.calls == 1
+    assert (middleware.sessions_used, middleware.sessions_skipped) == (1, 0)
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from bot.config import Settings
+from bot.db.base import engine_options, create_engine_from_settings
+from bot.db.pool import TimedAsyncQueuePool, pool_wait_stats
+
+
+def make_settings(**overrides) -> Settings:
+    return Settings(BOT_TOKEN="42:TEST", DATABASE_URL="postgresql+asyncpg://u:p@localhost/db", **overrides)
+
+
+def test_postgres_engine_options():
+    options = engine_options(make_settings(DB_POOL_SIZE=20, DB_STATEMENT_TIMEOUT_MS=5000))
+
+    assert options["poolclass"] is TimedAsyncQueuePool
+    assert options["pool_size"] == 20
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"]["prepared_statement_cache_size"] == 100
+    assert options["connect_args"]["server_settings"] == {
+        "application_name": "sw-telegram-bot",
+        "statement_timeout": "5000",
+    }
+
+
+def test_sqlite_ignores_pool_options():
+    config = make_settings(DB_POOL_SIZE=20)
+    assert engine_options(config, "sqlite+aiosqlite:///:memory:") == {}
+
+
+def test_engine_factory_applies_pool_size():
+    engine = create_engine_from_settings(make_settings(DB_POOL_SIZE=7, DB_MAX_OVERFLOW=0))
+    assert isinstance(engine.pool, TimedAsyncQueuePool)
+    assert engine.pool.size() == 7
+
+
+@pytest.mark.asyncio
+async def test_pool_records_checkout_wait(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedAsyncQueuePool,
+        pool_size=1,
+        max_overflow=0
+    )
+    pool_wait_stats.reset()
+
+    async def query():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            await asyncio.sleep(0.05)
+
+    await asyncio.gather(query(), query())
+    await engine.dispose()
+
+    assert pool_wait_stats.checkouts == 2
+    # The second checkout waited for the only connection
+    assert pool_wait_stats.max_seconds >= 0.04
@@ -0,0 +1,71 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.models.schemas import HabitCreate
+from bot.services.export import EXPORT_COLUMNS, Exporter, export_all
+from bot.services.habit import HabitService
+
+
+async def create_history(session, user_id: int) -> None:
+    service = HabitService(session)
+    habit = await service.create_habit(user_id, HabitCreate(name=f"Habit {user_id}"))
+    await service.log_relapse(str(habit.id), "Стресс, \"кофе\"")
+    await service.log_relapse(str(habit.id))
+
+
+@pytest.mark.asyncio
+async def test_export_csv(session, user_id):
+    await create_history(session, user_id)
+    await create_history(session, user_id + 1)
+
+    buffer = io.BytesIO()
+    with Exporter(buffer, "csv", chunk_size=2) as exporter:
+        written = await exporter.write_users(session, [user_id])
+    assert written == exporter.rows == 3
+
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(buffer.getvalue()).decode())))
+    assert len(rows) == 3
+    assert {row["user_id"] for row in rows} == {str(user_id)}
+    assert [row["relapse_reason"] for row in rows] == ["Стресс, \"кофе\"", "", ""]
+    assert rows[-1]["period_end_at"] == "" and rows[-1]["relapse_id"] == ""
+
+
+@pytest.mark.asyncio
+async def test_export_ndjson(session, user_id):
+    await create_history(session, user_id)
+
+    buffer = io.BytesIO()
+    with Exporter(buffer, "ndjson") as exporter:
+        await exporter.write_users(session, [user_id])
+
+    lines = gzip.decompress(buffer.getvalue()).decode().splitlines()
+    records = [json.loads(line) for line in lines]
+    assert len(records) == 3
+    assert set(records[0]) == set(EXPORT_COLUMNS)
+    assert records[0]["habit_is_active"] is True
+    assert records[-1]["period_end_at"] is None
+
+
+@pytest.mark.asyncio
+async def test_export_all_walks_users_in_batches(engine, session, user_id):
+    for offset in range(5):
+        await create_history(session, user_id + offset)
+
+    buffer = io.BytesIO()
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    users, rows = await export_all(session_maker, buffer, "csv", batch_size=2)
+    assert (users, rows) == (5, 15)
+
+    exported = list(csv.DictReader(io.StringIO(gzip.decompress(buffer.getvalue()).decode())))
+    assert len(exported) == 15
+    assert sorted({int(row["user_id"]) for row in exported}) == [user_id + i for i in range(5)]
+
+
+def test_export_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        Exporter(io.BytesIO(), "xml")
@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import event, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from benchmarks.fakes import FakeBotSession, message_update
+from bot.db.models import FSMState, Habit
+from bot.dispatcher import create_bot, create_dispatcher
+from bot.fsm.habit import HabitCreation, RelapseLogging
+from bot.fsm.storage import SQLStorage
+from bot.middlewares.db import DatabaseMiddleware
+
+KEY = StorageKey(bot_id=42, chat_id=12345, user_id=12345)
+
+
+@pytest.fixture
+def write_counter(engine):
+    counter = {"writes": 0}
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if not statement.lstrip().upper().startswith("SELECT"):
+            counter["writes"] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield counter
+    event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.mark.asyncio
+async def test_state_and_data_survive_restart(engine):
+    storage = SQLStorage(engine, flush_interval=60)
+    await storage.set_state(KEY, RelapseLogging.waiting_for_reason)
+    await storage.update_data(KEY, {"habit_id": "abc"})
+    await storage.close()
+
+    restarted = SQLStorage(engine)
+    assert await restarted.get_state(KEY) == RelapseLogging.waiting_for_reason.state
+    assert await restarted.get_data(KEY) == {"habit_id": "abc"}
+    assert await restarted.get_value(KEY, "habit_id") == "abc"
+    await restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_burst_of_writes_is_coalesced(engine, write_counter):
+    storage = SQLStorage(engine, flush_interval=60)
+    await storage.set_state(KEY, HabitCreation.waiting_for_name)
+    for i in range(10):
+        await storage.update_data(KEY, {"step": i})
+    await storage.set_state(KEY, RelapseLogging.waiting_for_reason)
+    assert write_counter["writes"] == 0
+
+    await storage.flush()
+    assert write_counter["writes"] == 1
+    assert storage.rows_written == 1
+
+    async with engine.connect() as conn:
+        row = (await conn.execute(select(FSMState.state, FSMState.data))).one()
+    assert row.state == RelapseLogging.waiting_for_reason.state
+    assert row.data == {"step": 9}
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_cleared_state_deletes_row(engine):
+    storage = SQLStorage(engine, flush_interval=60)
+    await storage.set_state(KEY, HabitCreation.waiting_for_name)
+    await storage.flush()
+    await storage.set_state(KEY, None)
+    await storage.set_data(KEY, {})
+    await storage.flush()
+
+    async with engine.connect() as conn:
+        assert (await conn.execute(select(FSMState))).first() is None
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_sweep_removes_stale_states(engine):
+    storage = SQLStorage(engine, flush_interval=60, state_ttl=timedelta(hours=1))
+    other_key = StorageKey(bot_id=42, chat_id=1, user_id=1)
+    await storage.set_state(KEY, HabitCreation.waiting_for_name)
+    await storage.set_state(other_key, HabitCreation.waiting_for_name)
+    await storage.flush()
+
+    async with engine.begin() as conn:
+        await conn.execute(
+            update(FSMState)
+            .where(FSMState.key == storage.key_builder.build(KEY))
+            .values(updated_at=datetime.now(pytz.UTC) - timedelta(hours=2))
+        )
+
+    assert await storage.sweep() == 1
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_write_through_storages_share_state(engine, write_counter):
+    # Two worker processes serving the same user
+    first, second = SQLStorage(engine, flush_interval=0), SQLStorage(engine, flush_interval=0)
+    await first.set_state(KEY, RelapseLogging.waiting_for_reason)
+    assert write_counter["writes"] == 1
+    assert await second.get_state(KEY) == RelapseLogging.waiting_for_reason.state
+
+    await second.set_state(KEY, None)
+    await second.set_data(KEY, {})
+    assert await first.get_state(KEY) is None
+    async with engine.connect() as conn:
+        assert (await conn.execute(select(FSMState.key))).first() is None
+    await first.close()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_write_through_is_outside_handler_budgets(engine, user_id):
+    # Budgets are strict in tests; the handlers' budgets count only their own statements
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    dp = create_dispatcher(DatabaseMiddleware(session_maker))
+    dp.fsm.storage = SQLStorage(engine, flush_interval=0)
+    bot_session = FakeBotSession()
+    bot = create_bot(bot_session)
+
+    await dp.feed_update(bot, message_update(user_id, "➕ Add Habit"))
+    await dp.feed_update(bot, message_update(user_id, "Smoking"))
+
+    assert "Smoking" in bot_session.calls[-1].text
+    async with session_maker() as session:
+        assert await session.scalar(select(func.count()).select_from(Habit)) == 1
+    await dp.fsm.storage.close()
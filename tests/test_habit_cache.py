@@ -0,0 +1,138 @@
+import pytest
+
+from bot.db.notify import PostgresInvalidationBackend
+from bot.misc.cache import TTLCache
+from bot.models.schemas import HabitCreate
+from bot.services.habit import HabitService, get_user_habits_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeNotifyConnection:
+    """Stands in for asyncpg: NOTIFY reaches every connection listening."""
+
+    def __init__(self, connections, pid):
+        self.connections = connections
+        self.pid = pid
+        self.listeners = {}
+
+    def get_server_pid(self):
+        return self.pid
+
+    async def add_listener(self, channel, callback):
+        self.listeners[channel] = callback
+
+    def add_termination_listener(self, callback):
+        pass
+
+    async def execute(self, query, channel, payload):
+        for connection in self.connections:
+            if channel in connection.listeners:
+                connection.listeners[channel](connection, self.pid, channel, payload)
+
+    async def close(self):
+        self.connections.remove(self)
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+    cache.set("a", 1, cache.token())
+
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    clock.now = 5.0
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1, cache.token())
+    cache.set("b", 2, cache.token())
+    cache.get("a")
+    cache.set("c", 3, cache.token())
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+@pytest.mark.asyncio
+async def test_fill_started_before_invalidation_is_dropped():
+    cache = TTLCache(maxsize=10, ttl=60)
+    token = cache.token()  # reader starts its query
+    await cache.invalidate("a")  # writer commits
+
+    assert cache.set("a", "stale", token) is False
+    assert cache.get("a") is None
+    assert cache.set("a", "fresh", cache.token()) is True
+
+
+@pytest.mark.asyncio
+async def test_forgotten_invalidations_reject_old_tokens():
+    cache = TTLCache(maxsize=1, ttl=60)
+    token = cache.token()
+    await cache.invalidate("a")
+    await cache.invalidate("b")  # pushes "a" out of the invalidation log
+
+    assert cache.set("a", "stale", token) is False
+
+
+@pytest.mark.asyncio
+async def test_user_habits_are_never_stale_after_writes(session, user_id):
+    service = HabitService(session)
+
+    assert await service.get_user_habits(user_id) == []
+    habit = await service.create_habit(user_id, HabitCreate(name="Habit 1"))
+    assert [h.name for h in await service.get_user_habits(user_id)] == ["Habit 1"]
+
+    # Served from cache until the next write
+    hits = get_user_habits_cache().hits
+    await service.get_user_habits(user_id)
+    assert get_user_habits_cache().hits == hits + 1
+
+    await service.create_habit(user_id, HabitCreate(name="Habit 2"))
+    assert {h.name for h in await service.get_user_habits(user_id)} == {"Habit 1", "Habit 2"}
+
+    await service.delete_habit(str(habit.id))
+    assert [h.name for h in await service.get_user_habits(user_id)] == ["Habit 2"]
+
+
+@pytest.mark.asyncio
+async def test_invalidations_reach_other_processes():
+    connections = []
+
+    async def connect(dsn):
+        assert dsn == "postgresql://u:p@localhost/db"
+        connections.append(FakeNotifyConnection(connections, pid=len(connections) + 1))
+        return connections[-1]
+
+    caches = []
+    for _ in range(2):
+        backend = PostgresInvalidationBackend("postgresql+asyncpg://u:p@localhost/db", "habits", connect=connect)
+        await backend.start()
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.use_backend(backend)
+        cache.set(1, "habits", cache.token())
+        caches.append(cache)
+
+    await caches[0].invalidate(1)
+    assert caches[0].get(1) is None and caches[1].get(1) is None
+    assert (caches[0].backend.received, caches[1].backend.received) == (0, 1)
+    for cache in caches:
+        await cache.backend.close()
+    assert not connections
+
+    # Updates still draining at shutdown commit their writes after the close
+    cache = caches[0]
+    cache.set(1, "habits", cache.token())
+    await cache.invalidate(1)
+    assert cache.get(1) is None
+    assert cache.backend.published == 1
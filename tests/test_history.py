@@ -0,0 +1,104 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from sqlalchemy import insert
+
+from bot.db.models import User, Habit, Period, Relapse
+from bot.keyboards.history import HistoryCursor, get_history_keyboard
+from bot.services.habit import HabitService
+
+
+async def seed_history(session, user_id: int, periods: int) -> uuid.UUID:
+    habit_id = uuid.uuid4()
+    await session.execute(insert(User).values(id=user_id))
+    await session.execute(insert(Habit).values(id=habit_id, user_id=user_id, name="Test Habit"))
+
+    start = datetime(2026, 1, 1, tzinfo=pytz.UTC)
+    for i in range(periods):
+        period_id = uuid.uuid4()
+        # Pairs of closed periods share start_at, so the id has to break the tie
+        start_at = start + timedelta(hours=i // 2 if i < periods - 1 else periods)
+        end_at = None if i == periods - 1 else start_at + timedelta(minutes=30)
+        await session.execute(
+            insert(Period).values(id=period_id, habit_id=habit_id, start_at=start_at, end_at=end_at)
+        )
+        if end_at is not None:
+            await session.execute(
+                insert(Relapse).values(id=uuid.uuid4(), period_id=period_id, occurred_at=end_at, reason=f"r{i}")
+            )
+    await session.commit()
+    return habit_id
+
+
+def next_cursor(habit_id, page, newer: bool) -> tuple:
+    entry = page.entries[0] if newer else page.entries[-1]
+    cursor = HistoryCursor.unpack(HistoryCursor(habit_id, entry.start_at, entry.period_id, newer).pack())
+    return cursor.start_at, cursor.period_id
+
+
+@pytest.mark.asyncio
+async def test_history_pages_walk_both_ways(session, user_id):
+    habit_id = await seed_history(session, user_id, 12)
+    service = HabitService(session)
+
+    page = await service.get_history_page(user_id, str(habit_id), limit=5)
+    assert page.habit_name == "Test Habit"
+    assert page.entries[0].end_at is None
+    assert not page.has_newer and page.has_older
+
+    pages = [page]
+    while page.has_older:
+        cursor = next_cursor(habit_id, page, newer=False)
+        page = await service.get_history_page(user_id, str(habit_id), cursor=cursor, limit=5)
+        pages.append(page)
+    assert [len(p.entries) for p in pages] == [5, 5, 2]
+
+    keys = [(e.start_at, str(e.period_id)) for p in pages for e in p.entries]
+    assert keys == sorted(keys, reverse=True)
+    assert len(set(keys)) == 12
+    assert all(e.relapse_reason for e in pages[-1].entries)
+
+    # Walk back from the last page to the first
+    page = pages[-1]
+    cursor = next_cursor(habit_id, page, newer=True)
+    page = await service.get_history_page(user_id, str(habit_id), cursor=cursor, newer=True, limit=5)
+    assert page.entries == pages[1].entries
+    assert page.has_newer and page.has_older
+    cursor = next_cursor(habit_id, page, newer=True)
+    page = await service.get_history_page(user_id, str(habit_id), cursor=cursor, newer=True, limit=5)
+    assert page.entries == pages[0].entries
+    assert not page.has_newer
+
+
+@pytest.mark.asyncio
+async def test_history_of_another_user_is_empty(session, user_id):
+    habit_id = await seed_history(session, user_id, 3)
+    page = await HabitService(session).get_history_page(user_id + 1, str(habit_id))
+    assert page.entries == []
+    assert page.habit_name is None
+
+
+def test_history_cursor_fits_callback_data():
+    cursor = HistoryCursor(uuid.uuid4(), datetime.now(pytz.UTC), uuid.uuid4(), newer=False)
+    data = cursor.pack()
+    assert len(data.encode()) <= 64
+    assert HistoryCursor.unpack(data) == cursor
+
+    with pytest.raises(ValueError):
+        HistoryCursor.unpack("h:garbage")
+
+
+@pytest.mark.asyncio
+async def test_history_keyboard_buttons(session, user_id):
+    habit_id = await seed_history(session, user_id, 3)
+    service = HabitService(session)
+
+    page = await service.get_history_page(user_id, str(habit_id), limit=2)
+    buttons = get_history_keyboard(habit_id, page).inline_keyboard[0]
+    assert [b.text for b in buttons] == ["▶️"]
+    assert HistoryCursor.unpack(buttons[0].callback_data).period_id == page.entries[-1].period_id
+
+    single = await service.get_history_page(user_id, str(habit_id), limit=5)
+    assert get_history_keyboard(habit_id, single) is None
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from aiogram import Dispatcher, Router
+from aiogram.types import Message
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from benchmarks.fakes import FakeBotSession, message_update
+from bot.api.ingest import QueuedRequestHandler, ShardedUpdateQueue
+from bot.dispatcher import create_bot
+from bot.misc.metrics import MetricsRegistry
+
+
+def payload(update) -> dict:
+    return update.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+
+def recording_dispatcher(seen: list, running: list, delay: float = 0.005) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def record(message: Message) -> None:
+        running.append(1)
+        seen.append((message.from_user.id, int(message.text)))
+        await asyncio.sleep(delay)
+        running.pop()
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+@pytest.mark.asyncio
+async def test_updates_keep_per_user_order_with_bounded_concurrency():
+    seen, running, peak = [], [], []
+    dp = recording_dispatcher(seen, running)
+    queue = ShardedUpdateQueue(dp, create_bot(FakeBotSession()), shards=3, max_size=300)
+    await queue.start()
+
+    async def watch() -> None:
+        while True:
+            peak.append(len(running))
+            await asyncio.sleep(0.001)
+
+    watcher = asyncio.create_task(watch())
+    for number in range(20):
+        for user_id in range(1, 6):
+            assert queue.submit(message_update(user_id, str(number)))
+    await queue.stop()
+    watcher.cancel()
+
+    for user_id in range(1, 6):
+        assert [n for uid, n in seen if uid == user_id] == list(range(20))
+    assert max(peak) <= 3
+    assert queue.stats.processed == 100
+    assert queue.stats.failed == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queue_answers_503():
+    seen, running = [], []
+    dp = recording_dispatcher(seen, running)
+    registry = MetricsRegistry()
+    queue = ShardedUpdateQueue(dp, create_bot(FakeBotSession()), shards=1, max_size=2, registry=registry)
+    app = web.Application()
+    QueuedRequestHandler(queue).register(app, path="/webhook")
+
+    # Workers are not started, so nothing leaves the queue
+    async with TestClient(TestServer(app)) as client:
+        statuses = []
+        for number in range(3):
+            response = await client.post("/webhook", json=payload(message_update(1, str(number))))
+            statuses.append(response.status)
+        assert statuses == [200, 200, 503]
+        assert response.headers["Retry-After"] == "1"
+        assert registry.gauges[("update_queue_depth", ())] == 2
+
+    await queue.start()
+    await queue.stop()
+    assert seen == [(1, 0), (1, 1)]
+    assert queue.stats.rejected == 1
+    assert registry.counters[("updates_shed_total", ())] == 1
+    assert registry.counters[("updates_queued_total", ())] == 2
+    assert registry.histograms[("update_queue_wait_seconds", ())].count == 2
+    assert "update_queue_depth 0\n" in registry.render()
@@ -0,0 +1,86 @@
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from benchmarks.fakes import FakeBotSession, message_update
+from bot.api.server import create_app
+from bot.config import get_settings
+from bot.dispatcher import create_bot, create_dispatcher
+from bot.middlewares.db import DatabaseMiddleware
+from bot.middlewares.metrics import MetricsMiddleware
+from bot.misc.metrics import Histogram, MetricsRegistry, metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+def histogram(name: str, **labels) -> Histogram:
+    return metrics.histograms[(name, tuple(sorted(labels.items())))]
+
+
+@pytest.mark.asyncio
+async def test_updates_are_measured_per_handler(engine, user_id):
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    dp = create_dispatcher(DatabaseMiddleware(session_maker))
+    bot = create_bot(FakeBotSession())
+
+    await dp.feed_update(bot, message_update(user_id, "/start"))
+    await dp.feed_update(bot, message_update(user_id, "➕ Add Habit"))
+    await dp.feed_update(bot, message_update(user_id, "Не курить"))
+
+    start = "common.cmd_start"
+    create = "habit_create.process_habit_name"
+    assert histogram("update_seconds", handler=start).count == 1
+    assert histogram("handler_seconds", handler=create).count == 1
+    assert histogram("update_db_statements", handler=start).sum == 0
+    assert histogram("update_db_statements", handler=create).sum >= 2
+    assert histogram("update_db_seconds", handler=create).sum > 0
+    assert histogram("update_api_calls", handler=create).sum == 1
+    assert histogram("telegram_api_seconds", method="sendMessage").count == 3
+    assert metrics.counters[("updates_total", ())] == 3
+
+
+@pytest.mark.asyncio
+async def test_unsampled_updates_are_only_counted():
+    registry = MetricsRegistry()
+    middleware = MetricsMiddleware(sample_rate=0.5, registry=registry, random_=lambda: 0.9)
+
+    async def handler(event, data):
+        return "ok"
+
+    assert await middleware(handler, object(), {}) == "ok"
+    assert registry.counters == {("updates_total", ()): 1}
+    assert registry.histograms == {}
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(monkeypatch):
+    metrics.observe("update_seconds", 0.003, handler="common.cmd_start")
+    # Not served unless configured
+    app = create_app(create_dispatcher(), create_bot(FakeBotSession()), "/webhook")
+    async with TestClient(TestServer(app)) as client:
+        assert (await client.get("/metrics")).status == 404
+
+    monkeypatch.setattr(get_settings(), "METRICS_PATH", "/metrics")
+    app = create_app(create_dispatcher(), create_bot(FakeBotSession()), "/webhook")
+    async with TestClient(TestServer(app)) as client:
+        response = await client.get("/metrics")
+        body = await response.text()
+
+    assert response.status == 200
+    assert 'update_seconds_bucket{handler="common.cmd_start",le="0.005"} 1' in body
+    assert 'update_seconds_count{handler="common.cmd_start"} 1' in body
+
+
+def test_histogram_quantiles():
+    histogram = Histogram((0.01, 0.1, 1.0))
+    for value in [0.005] * 90 + [0.05] * 9 + [5.0]:
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(0.95) == 0.1
+    assert histogram.quantile(1.0) == float("inf")
@@ -0,0 +1,159 @@
+import random
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+from bot.config import get_settings
+from bot.misc.quantiles import KLLSketch
+from bot.models.schemas import HabitCreate
+from bot.services.habit import HabitService
+from bot.services.percentiles import StreakPercentiles, refresh_percentiles, restore_percentiles
+
+# Additive rank error allowed, as a share of n; KLL with k=200 stays well under
+RANK_ERROR = 0.02
+# Percentile points allowed for current streaks while the sketches are not drifted
+PERCENTILE_ERROR = 3.0
+
+
+def max_rank_error(sketch: KLLSketch, values: list[float]) -> float:
+    exact = sorted(values)
+    points = exact[::max(1, len(exact) // 500)]
+    return max(abs(sketch.rank(value) - bisect_right(exact, value)) for value in points) / len(exact)
+
+
+@pytest.mark.parametrize("distribution", ["uniform", "lognormal", "sorted"])
+def test_kll_rank_error_is_bounded(distribution):
+    rng = random.Random(42)
+    if distribution == "uniform":
+        values = [rng.uniform(0, 1e6) for _ in range(100_000)]
+    else:
+        values = [rng.lognormvariate(10, 2) for _ in range(100_000)]
+    if distribution == "sorted":
+        values.sort()
+
+    sketch = KLLSketch(k=200, seed=1)
+    sketch.extend(values)
+    assert sketch.n == len(values)
+    assert max_rank_error(sketch, values) <= RANK_ERROR
+    # Memory stays far below the stream size
+    assert sum(len(compactor) for compactor in sketch.to_dict()["compactors"]) < 1000
+
+
+def test_kll_merge_and_round_trip():
+    rng = random.Random(7)
+    first = [rng.gauss(0, 1) for _ in range(30_000)]
+    second = [rng.gauss(3, 1) for _ in range(50_000)]
+    sketch, other = KLLSketch(seed=1), KLLSketch(seed=2)
+    sketch.extend(first)
+    other.extend(second)
+    sketch.merge(other)
+
+    restored = KLLSketch.from_dict(sketch.to_dict())
+    assert restored.n == 80_000
+    assert max_rank_error(restored, first + second) <= RANK_ERROR
+    assert abs(restored.quantile(0.5) - sorted(first + second)[40_000]) < 0.2
+
+
+def test_current_percentile_with_removed_starts():
+    rng = random.Random(3)
+    now = datetime(2026, 10, 18, tzinfo=pytz.UTC)
+    starts = [now - timedelta(seconds=rng.expovariate(1 / 86400 / 30)) for _ in range(20_000)]
+    removed = set(rng.sample(range(len(starts)), 8_000))
+
+    percentiles = StreakPercentiles()
+    for start in starts:
+        percentiles.record_start(start)
+    for index in removed:
+        percentiles.record_removed(starts[index])
+
+    open_starts = sorted(start.timestamp() for i, start in enumerate(starts) if i not in removed)
+    assert percentiles.open_count == len(open_starts)
+    # Errors of both sketches add up, which a rebuild bounds by the churn
+    assert not percentiles.drifted(1.0)
+    for start in rng.sample(starts, 200):
+        shorter = len(open_starts) - bisect_left(open_starts, start.timestamp()) - 1
+        exact = 100 * shorter / len(open_starts)
+        assert abs(percentiles.current_percentile(start) - exact) <= PERCENTILE_ERROR
+
+    # Relapses restart streaks without growing the open population
+    for start in rng.sample([start for i, start in enumerate(starts) if i not in removed], 5_000):
+        percentiles.record_close(start, now)
+        percentiles.record_start(now)
+    assert percentiles.open_count == len(open_starts)
+    assert percentiles.drifted(1.0)
+
+
+@pytest.mark.asyncio
+async def test_habit_stats_report_percentiles(session, user_id):
+    percentiles = StreakPercentiles(min_population=3)
+    service = HabitService(session, percentiles=percentiles)
+    habits = [
+        await service.create_habit(user_id + offset, HabitCreate(name="Test Habit"))
+        for offset in range(4)
+    ]
+    await service.log_relapse(str(habits[0].id))
+    await service.delete_habit(str(habits[3].id))
+    assert percentiles.open_count == 3
+
+    # habits[1] started first, habits[0] restarted last
+    assert (await service.get_habit_stats(str(habits[1].id))).streak_percentile == pytest.approx(200 / 3)
+    assert (await service.get_habit_stats(str(habits[0].id))).streak_percentile == 0
+    # Only one completed period so far
+    assert (await service.get_habit_stats(str(habits[0].id))).completed_percentile is None
+
+    rebuilt = await StreakPercentiles.rebuild(session)
+    assert rebuilt.open_count == 3
+    assert rebuilt.completed.n == 1
+
+
+@pytest.mark.asyncio
+async def test_percentiles_snapshot_round_trip(session):
+    percentiles = StreakPercentiles()
+    now = datetime.now(pytz.UTC)
+    for hours in range(50):
+        percentiles.record_start(now - timedelta(hours=hours))
+    await percentiles.save(session)
+
+    loaded = await StreakPercentiles.load(session, max_age=timedelta(minutes=5))
+    assert loaded.open_count == 50
+    assert loaded.current_percentile(now - timedelta(hours=25)) == percentiles.current_percentile(now - timedelta(hours=25))
+    assert await StreakPercentiles.load(session, max_age=timedelta(0)) is None
+
+
+@pytest.mark.asyncio
+async def test_drifted_and_stale_sketches_are_rebuilt(session, user_id, monkeypatch):
+    # Two processes: the first runs the jobs and saves the snapshot
+    first, second = StreakPercentiles(min_population=3), StreakPercentiles(min_population=3)
+    habits = [
+        await HabitService(session, percentiles=first).create_habit(user_id + offset, HabitCreate(name="Test Habit"))
+        for offset in range(4)
+    ]
+    await restore_percentiles(session, first)
+    await restore_percentiles(session, second)
+    assert first.open_count == second.open_count == 4
+    assert second.updated_at == first.updated_at
+
+    # Relapses handled by the second process only
+    service = HabitService(session, percentiles=second)
+    for habit in habits:
+        await service.log_relapse(str(habit.id))
+        await service.log_relapse(str(habit.id))
+    assert second.drifted(1.0)
+    await refresh_percentiles(session, second, save=False)
+    assert (second.ended.n, second.open_count, second.completed.n) == (0, 4, 8)
+    # Only the process running the jobs saves snapshots
+    assert (await StreakPercentiles.load(session, timedelta(minutes=5))).completed.n == 0
+
+    # The first process doesn't see them until its snapshot gets old
+    await refresh_percentiles(session, first, save=True)
+    assert first.completed.n == 0
+    monkeypatch.setattr(get_settings(), "SKETCH_MAX_AGE", 0.0)
+    await refresh_percentiles(session, first, save=True)
+    assert (first.open_count, first.completed.n) == (4, 8)
+
+    # Which the second process then loads
+    monkeypatch.setattr(get_settings(), "SKETCH_MAX_AGE", 300.0)
+    await refresh_percentiles(session, second, save=False)
+    assert second.updated_at == first.updated_at
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.db.budget import QueryBudgetExceeded, query_budget
+from bot.db.models import Habit
+from bot.models.schemas import HabitCreate
+from bot.services.habit import HabitService
+
+
+@pytest.mark.asyncio
+async def test_exceeding_budget_raises_in_strict_mode(session):
+    with query_budget(1, "two selects") as budget:
+        await session.execute(select(1))
+        with pytest.raises(QueryBudgetExceeded, match="two selects ran 2 statements, budget is 1"):
+            await session.execute(select(2))
+    assert budget.statements == 2
+
+
+@pytest.mark.asyncio
+async def test_exceeding_budget_logs_otherwise(session, caplog):
+    with caplog.at_level(logging.WARNING, logger="bot.db.budget"):
+        with query_budget(1, "two selects", strict=False):
+            await session.execute(select(1))
+            await session.execute(select(2))
+    assert "Query budget exceeded by two selects: 2 statements, budget 1" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_decorated_calls_count_separately(engine):
+    session_maker = async_sessionmaker(engine, class_=AsyncSession)
+
+    @query_budget(1)
+    async def one_query():
+        async with session_maker() as session:
+            await asyncio.sleep(0)
+            return await session.scalar(select(1))
+
+    assert await asyncio.gather(one_query(), one_query(), one_query()) == [1, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_statements_after_exit_are_not_counted(session):
+    async def late_query():
+        await session.execute(select(1))
+
+    # The task inherits the budget's context but queries after the block
+    with query_budget(0, "spawner") as budget:
+        task = asyncio.create_task(late_query())
+    await task
+    assert budget.statements == 0
+
+
+@pytest.mark.asyncio
+async def test_relationships_do_not_lazy_load(session, user_id):
+    habit = await HabitService(session).create_habit(user_id, HabitCreate(name="Test"))
+    loaded = await session.scalar(select(Habit).where(Habit.id == habit.id))
+    with pytest.raises(InvalidRequestError, match="lazy='raise'"):
+        loaded.periods
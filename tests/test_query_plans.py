@@ -0,0 +1,76 @@
+import re
+
+import pytest
+from sqlalchemy import event
+
+from bot.misc.cache import TTLCache
+from bot.services.analytics import AnalyticsService
+from bot.services.habit import HabitService
+from bot.models.schemas import HabitCreate
+
+# A plan step that reads a whole table instead of an index
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+@pytest.fixture
+def captured_statements(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+async def explain(engine, statement, parameters) -> list[str]:
+    async with engine.connect() as conn:
+        result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[3] for row in result]
+
+
+@pytest.mark.asyncio
+async def test_service_queries_use_indexes(engine, session, captured_statements, user_id):
+    service = HabitService(session)
+    habit = await service.create_habit(user_id, HabitCreate(name="Test Habit"))
+    await service.create_habit(user_id, HabitCreate(name="Other Habit"))
+    await service.get_user_habits(user_id)
+    await service.log_relapse(str(habit.id), "Test reason")
+    await service.get_habit_stats(str(habit.id))
+    await AnalyticsService(session, TTLCache(maxsize=1, ttl=60)).get_relapse_analytics(user_id, str(habit.id))
+    page = await service.get_history_page(user_id, str(habit.id), limit=1)
+    last = page.entries[-1]
+    await service.get_history_page(user_id, str(habit.id), cursor=(last.start_at, last.period_id), limit=1)
+    await service.delete_habit(str(habit.id))
+
+    assert captured_statements
+    for statement, parameters in captured_statements:
+        plan = await explain(engine, statement, parameters)
+        scans = [step for step in plan if FULL_SCAN.match(step)]
+        assert not scans, f"{statement!r} scans a table: {plan}"
+
+
+@pytest.mark.asyncio
+async def test_rollup_queries_use_indexes(engine, session, captured_statements, user_id):
+    from datetime import timedelta
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+    from bot.services.rollups import RollupService, StatsService
+
+    service = HabitService(session)
+    habit = await service.create_habit(user_id, HabitCreate(name="Test Habit"))
+    await service.log_relapse(str(habit.id), "Test reason")
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    captured_statements.clear()
+
+    await RollupService(session_maker, lag=timedelta(0)).run_once()
+    await StatsService(session).get_dashboard()
+
+    # Summing daily_stats reads the whole rollup table, one row per day
+    statements = [item for item in captured_statements if "sum(daily_stats" not in item[0]]
+    assert statements
+    for statement, parameters in statements:
+        plan = await explain(engine, statement, parameters)
+        scans = [step for step in plan if FULL_SCAN.match(step)]
+        assert not scans, f"{statement!r} scans a table: {plan}"
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from benchmarks.fakes import FakeBotSession
+from bot.db.models import User
+from bot.dispatcher import create_bot
+from bot.models.schemas import HabitCreate
+from bot.services.broadcast import set_blocked
+from bot.services.habit import HabitService
+from bot.services.reminders import ReminderService, _claim_statement, days_word
+
+
+@pytest.fixture
+def session_maker(engine):
+    return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest.fixture
+def bot_session():
+    return FakeBotSession()
+
+
+@pytest.fixture
+def reminders(session_maker, bot_session):
+    return ReminderService(session_maker, create_bot(bot_session), batch_size=10)
+
+
+async def next_reminder_at(session_maker, user_id):
+    async with session_maker() as session:
+        value = await session.scalar(select(User.next_reminder_at).where(User.id == user_id))
+    return value if value is None or value.tzinfo else pytz.UTC.localize(value)
+
+
+@pytest.mark.asyncio
+async def test_check_in_is_sent_once_per_interval(session_maker, reminders, bot_session, user_id):
+    async with session_maker() as session:
+        await HabitService(session).create_habit(user_id, HabitCreate(name="Не курить"))
+    first = await next_reminder_at(session_maker, user_id)
+    assert first > datetime.now(pytz.UTC) + timedelta(hours=23)
+
+    assert await reminders.run_once(first - timedelta(minutes=1)) == 0
+    now = first + timedelta(seconds=1)
+    assert await reminders.run_once(now) == 1
+    assert await reminders.run_once(now) == 0
+
+    (message,) = bot_session.calls_of("SendMessage")
+    assert message.chat_id == user_id
+    assert "1 день без срывов: «Не курить»" in message.text
+    assert await next_reminder_at(session_maker, user_id) == now + timedelta(days=1)
+
+
+@pytest.mark.asyncio
+async def test_users_without_active_habits_are_unscheduled(session_maker, reminders, bot_session, user_id):
+    async with session_maker() as session:
+        habit = await HabitService(session).create_habit(user_id, HabitCreate(name="Не курить"))
+        await HabitService(session).delete_habit(str(habit.id))
+
+    assert await reminders.run_once(datetime.now(pytz.UTC) + timedelta(days=2)) == 1
+    assert not bot_session.calls_of("SendMessage")
+    assert await next_reminder_at(session_maker, user_id) is None
+
+
+@pytest.mark.asyncio
+async def test_due_reminders_are_drained_in_batches(session_maker, reminders, bot_session):
+    async with session_maker() as session:
+        for user_id in range(1, 26):
+            await HabitService(session).create_habit(user_id, HabitCreate(name="Спорт"))
+
+    assert await reminders.run_once(datetime.now(pytz.UTC) + timedelta(days=7, minutes=1)) == 25
+    messages = bot_session.calls_of("SendMessage")
+    assert sorted(message.chat_id for message in messages) == list(range(1, 26))
+    assert all("7 дней без срывов" in message.text for message in messages)
+
+
+@pytest.mark.asyncio
+async def test_blocked_users_are_marked_and_unscheduled(session_maker, reminders, bot_session):
+    async with session_maker() as session:
+        for user_id in (1, 2):
+            await HabitService(session).create_habit(user_id, HabitCreate(name="<b>Спорт"))
+    bot_session.blocked = {2}
+
+    assert await reminders.run_once(datetime.now(pytz.UTC) + timedelta(days=1, minutes=1)) == 2
+    assert (reminders.sent, reminders.blocked) == (1, 1)
+    delivered = bot_session.calls_of("SendMessage")[0]
+    assert "«&lt;b&gt;Спорт»" in delivered.text
+    async with session_maker() as session:
+        blocked = await session.scalar(select(User.is_blocked).where(User.id == 2))
+    assert blocked
+    assert await next_reminder_at(session_maker, 2) is None
+
+    # Unblocking schedules a check-in right away
+    async with session_maker() as session:
+        await set_blocked(session, 2, False)
+    bot_session.blocked.clear()
+    assert await reminders.run_once(datetime.now(pytz.UTC) + timedelta(minutes=1)) == 1
+    assert bot_session.calls_of("SendMessage")[-1].chat_id == 2
+
+
+def test_claim_skips_rows_locked_by_other_workers():
+    now = datetime.now(pytz.UTC)
+    sql = str(_claim_statement(now, now, 100, "postgresql").compile(dialect=postgresql.dialect()))
+    assert "FOR UPDATE SKIP LOCKED" in sql
+
+
+def test_days_word():
+    assert [days_word(days) for days in (1, 2, 5, 11, 21, 22, 25, 111, 112)] == [
+        "день", "дня", "дней", "дней", "день", "дня", "дней", "дней", "дней"
+    ]
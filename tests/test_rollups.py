@@ -0,0 +1,107 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.db.models import User, Habit, Period, Relapse, DailyStats
+from bot.services import rollups
+from bot.services.rollups import RollupService, StatsService
+
+DAY = datetime(2026, 10, 12, tzinfo=pytz.UTC)
+
+
+@pytest.fixture
+def session_maker(engine):
+    return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def add_user(session, user_id: int, at: datetime) -> uuid.UUID:
+    habit_id = uuid.uuid4()
+    await session.execute(insert(User).values(id=user_id, created_at=at))
+    await session.execute(insert(Habit).values(id=habit_id, user_id=user_id, name="Habit", created_at=at))
+    await session.execute(insert(Period).values(id=uuid.uuid4(), habit_id=habit_id, start_at=at))
+    await session.commit()
+    return habit_id
+
+
+async def add_relapse(session, habit_id: uuid.UUID, start_at: datetime, at: datetime) -> None:
+    period_id = uuid.uuid4()
+    await session.execute(insert(Period).values(id=period_id, habit_id=habit_id, start_at=start_at, end_at=at))
+    await session.execute(insert(Relapse).values(id=uuid.uuid4(), period_id=period_id, occurred_at=at))
+    await session.commit()
+
+
+async def daily_stats(session) -> dict:
+    result = await session.execute(select(DailyStats).order_by(DailyStats.day))
+    return {row.day: row for row in result.scalars()}
+
+
+async def seed(session) -> None:
+    first = await add_user(session, 1, DAY + timedelta(hours=1))
+    await add_user(session, 2, DAY + timedelta(hours=20))
+    # User 1 relapses twice the next day, in two different windows
+    await add_relapse(session, first, DAY + timedelta(hours=1), DAY + timedelta(days=1, hours=2))
+    await add_relapse(session, first, DAY - timedelta(days=10), DAY + timedelta(days=1, hours=14))
+
+
+@pytest.mark.asyncio
+async def test_rollup_folds_windows_and_catches_up(session, session_maker):
+    await seed(session)
+    service = RollupService(session_maker, window=timedelta(hours=12), lag=timedelta(minutes=5))
+
+    folded = await service.run_once(now=DAY + timedelta(days=3))
+    assert folded >= 5
+    assert await service.run_once(now=DAY + timedelta(days=3)) == 0
+
+    stats = await daily_stats(session)
+    first, second = stats[DAY.date()], stats[(DAY + timedelta(days=1)).date()]
+    assert (first.new_users, first.habits_created, first.active_users, first.relapses) == (2, 2, 2, 0)
+    # Relapses in two windows of the same day count one active user
+    assert (second.new_users, second.active_users, second.relapses) == (0, 1, 2)
+    assert (second.streaks_1_3d, second.streaks_7_30d) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_rollup_resumes_after_crash(session, session_maker, monkeypatch):
+    await seed(session)
+    service = RollupService(session_maker, window=timedelta(days=1), lag=timedelta(minutes=5))
+    await service.fold_once(now=DAY + timedelta(days=3))
+
+    original = rollups._active_users_insert
+
+    def crash(*args):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(rollups, "_active_users_insert", crash)
+    with pytest.raises(RuntimeError):
+        await service.fold_once(now=DAY + timedelta(days=3))
+    monkeypatch.setattr(rollups, "_active_users_insert", original)
+
+    # The failed window left neither counts nor a moved watermark behind
+    stats = await daily_stats(session)
+    assert (DAY + timedelta(days=1)).date() not in stats
+
+    await service.run_once(now=DAY + timedelta(days=3))
+    stats = await daily_stats(session)
+    assert stats[DAY.date()].new_users == 2
+    assert stats[(DAY + timedelta(days=1)).date()].relapses == 2
+
+
+@pytest.mark.asyncio
+async def test_dashboard_reads_rollups(session, session_maker):
+    await seed(session)
+    await RollupService(session_maker, lag=timedelta(0)).run_once(now=DAY + timedelta(days=2))
+
+    dashboard = await StatsService(session).get_dashboard(days=7, today=(DAY + timedelta(days=2)).date())
+    assert [day.day for day in dashboard.days] == [(DAY + timedelta(days=1)).date(), DAY.date()]
+    assert (dashboard.totals.new_users, dashboard.totals.relapses) == (2, 2)
+    assert dashboard.updated_to == DAY + timedelta(days=2)
+
+
+@pytest.mark.asyncio
+async def test_dashboard_before_first_rollup(session):
+    dashboard = await StatsService(session).get_dashboard()
+    assert dashboard.days == [] and dashboard.updated_to is None
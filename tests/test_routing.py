@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from bot.db.base import Base
+from bot.db.models import Habit, User
+from bot.db.routing import create_session_maker, writes
+from bot.middlewares.db import DatabaseMiddleware
+from bot.misc.cache import TTLCache
+from bot.models.schemas import HabitCreate
+from bot.services.habit import HabitService, _log_relapse_statement
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+async def databases(tmp_path):
+    # Two files stand in for a primary and a replica that never catches up
+    engines = []
+    for name in ("primary", "replica"):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / name}.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        engines.append(engine)
+    yield engines
+    for engine in engines:
+        await engine.dispose()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def session_maker(databases, clock):
+    primary, replica = databases
+    return create_session_maker(primary, replica, recent_writers=TTLCache(maxsize=10, ttl=5, clock=clock))
+
+
+async def user_names(session_maker, user_id: int, writer: int | None = None) -> list[str]:
+    async with session_maker(info={"user_id": writer}) as session:
+        result = await session.execute(select(Habit.name).where(Habit.user_id == user_id))
+        return list(result.scalars())
+
+
+@pytest.mark.asyncio
+async def test_writes_go_to_primary_and_writer_sticks(session_maker, clock, user_id):
+    async with session_maker(info={"user_id": user_id}) as session:
+        await HabitService(session).create_habit(user_id, HabitCreate(name="Test Habit"))
+
+    # The writer reads their habit from the primary, anyone else from the replica
+    assert await user_names(session_maker, user_id, writer=user_id) == ["Test Habit"]
+    assert await user_names(session_maker, user_id, writer=user_id + 1) == []
+    assert await user_names(session_maker, user_id) == []
+
+    clock.now = 6
+    assert await user_names(session_maker, user_id, writer=user_id) == []
+
+
+@pytest.mark.asyncio
+async def test_session_stays_on_primary_after_write(session_maker, user_id):
+    async with session_maker() as session:
+        session.add(User(id=user_id))
+        await session.flush()
+        assert (await session.execute(select(User.id))).scalars().all() == [user_id]
+        await session.commit()
+
+    async with session_maker() as session:
+        assert (await session.execute(select(User.id))).scalars().all() == []
+        # Locking reads go to the primary
+        assert (await session.execute(select(User.id).with_for_update())).scalars().all() == [user_id]
+
+
+def test_writes_detects_dml_ctes():
+    import uuid
+    from datetime import datetime
+
+    assert writes(_log_relapse_statement(uuid.uuid4(), uuid.uuid4(), None, datetime.now()))
+    assert not writes(select(Habit).where(Habit.user_id == 1))
+
+
+def test_without_replica_sessions_are_plain(databases):
+    session_maker = create_session_maker(databases[0])
+    assert session_maker.kw.get("sync_session_class") is None
+
+
+@pytest.mark.asyncio
+async def test_middleware_tags_session_with_user(session_maker, user_id):
+    seen = {}
+
+    async def handler(event, data):
+        seen.update(data["session"].info)
+
+    await DatabaseMiddleware(session_maker)(handler, None, {"event_from_user": SimpleNamespace(id=user_id)})
+    assert seen == {"user_id": user_id}
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramForbiddenError
+from aiohttp.test_utils import TestServer
+
+from benchmarks.fakes import FakeTelegramServer
+from bot.api.session import RateLimitedSession, bulk_sends, delivered
+from bot.dispatcher import create_bot
+from bot.misc.metrics import MetricsRegistry
+
+
+@pytest.fixture
+async def telegram():
+    server = FakeTelegramServer()
+    async with TestServer(server.app()) as test_server:
+        server.base_url = str(test_server.make_url("")).rstrip("/")
+        yield server
+
+
+def make_bot(telegram, **kwargs):
+    session = RateLimitedSession(api=TelegramAPIServer.from_base(telegram.base_url), **kwargs)
+    return create_bot(session)
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honored(telegram):
+    bot = make_bot(telegram)
+    telegram.flood[1] = 1
+
+    with bulk_sends():
+        message = await bot.send_message(1, "hello")
+    await bot.session.close()
+
+    assert message.text == "hello"
+    (rejected_at, _, _), = telegram.rejected
+    (sent_at, _, _), = telegram.calls
+    assert sent_at - rejected_at >= telegram.retry_after * 0.95
+    assert bot.session.stats.retried == 1
+
+
+@pytest.mark.asyncio
+async def test_interactive_replies_do_not_wait_for_delivery(telegram):
+    bot = make_bot(telegram)
+    telegram.flood[1] = 1
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await bot.send_message(1, "reply") is None
+    assert loop.time() - started < 0.5
+    assert not telegram.calls
+
+    await bot.session.close()
+    assert [data["text"] for data in telegram.calls_of("sendMessage")] == ["reply"]
+
+
+@pytest.mark.asyncio
+async def test_per_chat_rate_and_order(telegram):
+    bot = make_bot(telegram, chat_rate=20, chat_burst=1)
+
+    with bulk_sends():
+        await asyncio.gather(*(bot.send_message(1, str(number)) for number in range(8)))
+    await bot.session.close()
+
+    assert [data["text"] for data in telegram.calls_of("sendMessage")] == [str(n) for n in range(8)]
+    times = [sent_at for sent_at, _, _ in telegram.calls]
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    assert min(gaps) >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_interactive_replies_overtake_bulk_sends(telegram):
+    bot = make_bot(telegram, global_rate=20)
+
+    async def broadcast():
+        with bulk_sends():
+            await asyncio.gather(*(bot.send_message(chat_id, "news") for chat_id in range(100, 160)))
+
+    task = asyncio.create_task(broadcast())
+    await asyncio.sleep(0.01)
+    await bot.send_message(1, "reply")
+    await task
+    await bot.session.close()
+
+    order = [int(data["chat_id"]) for _, _, data in telegram.calls]
+    assert order.index(1) <= 21
+
+
+@pytest.mark.asyncio
+async def test_delivered_replies_return_results_and_errors(telegram):
+    bot = make_bot(telegram)
+    telegram.blocked = {2}
+
+    with delivered():
+        message = await bot.send_message(1, "preview")
+        with pytest.raises(TelegramForbiddenError):
+            await bot.send_message(2, "preview")
+    await bot.session.close()
+
+    assert message.text == "preview"
+    assert bot.session.stats.deferred == 0
+
+
+@pytest.mark.asyncio
+async def test_deferred_sends_are_timed_when_delivered(telegram):
+    registry = MetricsRegistry()
+    bot = make_bot(telegram, registry=registry)
+    telegram.blocked = {2}
+    telegram.flood[1] = 1
+
+    assert await bot.send_message(1, "reply") is None
+    assert await bot.send_message(2, "reply") is None
+    assert not registry.histograms
+    await bot.session.close()
+
+    latency = registry.histograms[("telegram_api_seconds", (("method", "sendMessage"),))]
+    # The flood-limited attempt, its retry and the rejected one
+    assert latency.count == 3
+    assert latency.sum > 0
+    errors = {labels: count for (name, labels), count in registry.counters.items() if name == "telegram_api_errors_total"}
+    assert errors == {
+        (("error", "TelegramForbiddenError"), ("method", "sendMessage")): 1,
+        (("error", "TelegramRetryAfter"), ("method", "sendMessage")): 1,
+    }
+    assert registry.histograms[("telegram_api_queue_seconds", (("priority", "interactive"),))].count == 3
@@ -0,0 +1,112 @@
+import logging
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from bot.config import Settings
+from bot.db.base import Base, Database, _open_pool
+from bot.db.models import User
+from bot.db.pool import TimedAsyncQueuePool
+from bot.models.schemas import HabitCreate
+from bot.services.habit import HabitService
+from bot.services.warmup import hot_statements
+
+ROOT = Path(__file__).resolve().parent.parent
+# Cumulative import time of bot.db.base; about 0.35 s here, leaves room for slow CI
+IMPORT_BUDGET_SECONDS = 1.5
+
+
+def import_times(module: str, **env: str) -> tuple[dict[str, int], subprocess.CompletedProcess]:
+    environment = {
+        key: value for key, value in os.environ.items() if key not in ("BOT_TOKEN", "DATABASE_URL")
+    }
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env={**environment, **env},
+        capture_output=True,
+        text=True
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times, process
+
+
+def test_importing_db_base_is_cheap():
+    times, process = import_times(
+        "bot.db.base, bot.db.models", DATABASE_URL="postgresql+asyncpg://u:p@localhost/db"
+    )
+    assert process.returncode == 0, process.stderr
+    # No engine, so no driver; no settings, so no pydantic-settings or .env
+    assert "asyncpg" not in times
+    assert "pydantic_settings" not in times
+    assert times["bot.db.base"] / 1e6 < IMPORT_BUDGET_SECONDS
+
+
+def test_settings_are_read_on_first_use():
+    # Without BOT_TOKEN the import still works, the first access fails
+    _, process = import_times("bot.config")
+    assert process.returncode == 0, process.stderr
+    _, process = import_times("bot.config; bot.config.settings.BOT_TOKEN")
+    assert process.returncode != 0 and "BOT_TOKEN" in process.stderr
+
+
+def test_modules_read_settings_at_call_time():
+    # Caches, sketches, router filters and query budgets are created at import
+    modules = (
+        "bot.services.habit, bot.services.analytics, bot.services.percentiles, "
+        "bot.handlers.admin, bot.db.budget, bot.dispatcher"
+    )
+    _, process = import_times(f"{modules}; assert bot.config.get_settings.cache_info().currsize == 0")
+    assert process.returncode == 0, process.stderr
+
+
+@pytest.mark.asyncio
+async def test_warm_up_opens_pool_and_compiles_statements(tmp_path, user_id, caplog):
+    database = Database(Settings(BOT_TOKEN="42:TEST", DATABASE_URL=f"sqlite+aiosqlite:///{tmp_path / 'warm.db'}"))
+    assert database._engine is None
+    engine = database.engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+    await database.warm_up(hot_statements("sqlite"))
+
+    # The engine logs whether each statement was compiled or found in its cache
+    caplog.set_level(logging.INFO, logger="sqlalchemy.engine.Engine")
+    async with database.session_maker() as session:
+        service = HabitService(session)
+        habit = await service.create_habit(user_id, HabitCreate(name="Test Habit"))
+        await service.get_user_habits(user_id)
+        await service.get_habit_stats(str(habit.id))
+        await service.get_history_page(user_id, str(habit.id))
+    statements = [record.getMessage() for record in caplog.records if record.getMessage().startswith("[")]
+    compiled = [statement for statement in statements if statement.startswith("[generated")]
+    # Only the SQLite-only period insert was compiled on demand
+    assert len(statements) > 4 and len(compiled) == 1
+    # The warm-up left no rows behind
+    async with database.session_maker() as session:
+        assert await session.get(User, 0) is None
+
+    with pytest.raises(RuntimeError):
+        database.configure(database.config)
+    await database.dispose()
+    assert database._engine is None
+
+
+@pytest.mark.asyncio
+async def test_open_pool_fills_the_pool(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", poolclass=TimedAsyncQueuePool, pool_size=3
+    )
+    await _open_pool(engine)
+    assert engine.pool.checkedin() == 3
+    await engine.dispose()
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+from aiogram import Dispatcher, Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, Message
+
+from benchmarks.fakes import FakeBotSession, callback_update, message_update
+from bot.dispatcher import create_bot
+from bot.middlewares.throttling import ThrottlingMiddleware
+from bot.misc.metrics import MetricsRegistry
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def throttling(clock):
+    return ThrottlingMiddleware(rate=1.0, burst=3, coalesce_window=1.0, registry=MetricsRegistry(), clock=clock)
+
+
+@pytest.fixture
+def handled():
+    return []
+
+
+@pytest.fixture
+def dp(throttling, handled):
+    router = Router()
+
+    @router.callback_query()
+    async def on_callback(callback: CallbackQuery):
+        handled.append(callback.data)
+        await asyncio.sleep(0.01)
+
+    @router.message()
+    async def on_message(message: Message):
+        handled.append(message.text)
+
+    dp = Dispatcher()
+    dp.update.outer_middleware(throttling)
+    dp.include_router(router)
+    return dp
+
+
+@pytest.fixture
+def bot_session():
+    return FakeBotSession()
+
+
+@pytest.mark.asyncio
+async def test_repeated_taps_run_once(dp, throttling, handled, clock, bot_session):
+    bot = create_bot(bot_session)
+
+    await asyncio.gather(*(dp.feed_update(bot, callback_update(1, "confirm")) for _ in range(3)))
+    await throttling.answered()
+    assert handled == ["confirm"]
+    assert throttling.coalesced == 2
+    # Only the dropped taps are answered here, the handler leaves its own spinner
+    assert [type(call).__name__ for call in bot_session.calls] == ["AnswerCallbackQuery"] * 2
+
+    # Still within the window after the handler finished
+    clock.now = 0.5
+    await dp.feed_update(bot, callback_update(1, "confirm"))
+    # Other buttons and other users are not affected
+    await dp.feed_update(bot, callback_update(1, "cancel"))
+    await dp.feed_update(bot, callback_update(2, "confirm"))
+    clock.now = 1.5
+    await dp.feed_update(bot, callback_update(1, "confirm"))
+    assert handled == ["confirm", "cancel", "confirm", "confirm"]
+    assert throttling.coalesced == 3
+    assert throttling.registry.counters[("updates_throttled_total", (("reason", "coalesced"),))] == 3
+
+
+@pytest.mark.asyncio
+async def test_flood_is_dropped_by_token_bucket(dp, throttling, handled, clock, bot_session):
+    bot = create_bot(bot_session)
+
+    for number in range(5):
+        await dp.feed_update(bot, message_update(1, str(number)))
+    assert handled == ["0", "1", "2"]
+    assert throttling.dropped == 2
+    assert not bot_session.calls
+
+    clock.now = 1.0
+    await dp.feed_update(bot, message_update(1, "5"))
+    await dp.feed_update(bot, message_update(1, "6"))
+    await dp.feed_update(bot, message_update(2, "other user"))
+    assert handled == ["0", "1", "2", "5", "other user"]
+    assert throttling.dropped == 3
+
+
+@pytest.mark.asyncio
+async def test_state_is_bounded_and_expires(clock, bot_session):
+    throttling = ThrottlingMiddleware(rate=1.0, burst=2, max_users=2, registry=MetricsRegistry(), clock=clock)
+    dp = Dispatcher()
+    dp.update.outer_middleware(throttling)
+    bot = create_bot(bot_session)
+
+    for user_id in (1, 2, 3):
+        await dp.feed_update(bot, message_update(user_id, "hi"))
+        await dp.feed_update(bot, callback_update(user_id, "confirm"))
+    assert list(throttling._buckets) == [2, 3]
+    assert len(throttling._callbacks) == 2
+
+    # Once refilled, a bucket is dropped with the user's expired callbacks
+    clock.now = 5.0
+    await dp.feed_update(bot, message_update(4, "hi"))
+    assert list(throttling._buckets) == [4]
+    assert not throttling._callbacks
+
+
+class SlowAnswers(FakeBotSession):
+    """Answers callbacks after a delay, or fails them like an expired query."""
+
+    def __init__(self, delay: float, fail: bool):
+        super().__init__()
+        self.delay = delay
+        self.fail = fail
+
+    async def make_request(self, bot, method, timeout=None):
+        if type(method).__name__ == "AnswerCallbackQuery":
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                self.calls.append(method)
+                raise TelegramBadRequest(method=method, message="Bad Request: query is too old")
+        return await super().make_request(bot, method, timeout)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fail", [False, True])
+async def test_dropped_taps_do_not_wait_for_their_answer(dp, throttling, handled, fail):
+    bot_session = SlowAnswers(delay=0.5, fail=fail)
+    bot = create_bot(bot_session)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await asyncio.gather(*(dp.feed_update(bot, callback_update(1, "confirm")) for _ in range(3)))
+    assert loop.time() - started < 0.4
+    assert handled == ["confirm"]
+
+    # Failed answers are only logged
+    await throttling.answered()
+    assert len(bot_session.calls_of("AnswerCallbackQuery")) == 2
@@ -0,0 +1,74 @@
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+import pytz
+from sqlalchemy import insert
+
+from bot.db.models import User, Habit, Period
+from bot.services.timeline import PeriodTimeline
+
+START = datetime(2026, 10, 1, tzinfo=pytz.UTC)
+HOUR = 3600.0
+
+
+def test_timeline_queries():
+    base = START.timestamp()
+    # Periods of 1, 3 and 2 hours with one-hour gaps, given out of order, then an open one
+    starts = [base + 5 * HOUR, base, base + 2 * HOUR, base + 8 * HOUR]
+    ends = [base + 7 * HOUR, base + HOUR, base + 5 * HOUR, np.nan]
+    timeline = PeriodTimeline.from_epochs(starts, ends)
+
+    assert len(timeline) == 3
+    assert timeline.start_at.tolist() == [base, base + 2 * HOUR, base + 5 * HOUR]
+    assert timeline.total_seconds == 6 * HOUR
+    assert timeline.longest_seconds == 3 * HOUR
+    assert timeline.open_start == base + 8 * HOUR
+    assert timeline.longest_streak(base + 10 * HOUR) == 3 * HOUR
+    assert timeline.longest_streak(base + 12 * HOUR) == 4 * HOUR
+
+    assert timeline.count_between(base + HOUR, base + 6 * HOUR) == 2
+    assert timeline.total_between(base + HOUR, base + 6 * HOUR) == 5 * HOUR
+    assert timeline.between(base + 2 * HOUR, base + 5 * HOUR).durations.tolist() == [3 * HOUR]
+    assert timeline.period_at(base + 3 * HOUR) == 1
+    assert timeline.period_at(base + 1.5 * HOUR) is None
+    assert timeline.period_at(base - HOUR) is None
+
+
+def test_empty_timeline():
+    timeline = PeriodTimeline.from_epochs([], [])
+    assert len(timeline) == 0
+    assert timeline.total_seconds == 0 and timeline.longest_seconds == 0
+    assert timeline.count_between(0, 1e12) == 0
+    assert timeline.period_at(0) is None
+
+
+def test_timeline_has_no_instance_dict():
+    timeline = PeriodTimeline.from_epochs([0.0], [1.0])
+    with pytest.raises(AttributeError):
+        timeline.extra = 1
+    assert timeline.start_at.flags["C_CONTIGUOUS"]
+
+
+@pytest.mark.asyncio
+async def test_timeline_load(session, user_id):
+    habit_id = uuid.uuid4()
+    await session.execute(insert(User).values(id=user_id))
+    await session.execute(insert(Habit).values(id=habit_id, user_id=user_id, name="Test Habit"))
+    start = START
+    rows = []
+    for hours in (2, 5, 1):
+        rows.append({"id": uuid.uuid4(), "habit_id": habit_id, "start_at": start, "end_at": start + timedelta(hours=hours)})
+        start += timedelta(hours=hours)
+    rows.append({"id": uuid.uuid4(), "habit_id": habit_id, "start_at": start, "end_at": None})
+    await session.execute(insert(Period), rows)
+    await session.commit()
+
+    timeline = await PeriodTimeline.load(session, habit_id)
+    assert len(timeline) == 3
+    assert timeline.total_seconds == pytest.approx(8 * HOUR, abs=1)
+    assert timeline.longest_seconds == pytest.approx(5 * HOUR, abs=1)
+    assert timeline.open_start == pytest.approx(start.timestamp(), abs=1)
+
+    assert len(await PeriodTimeline.load(session, uuid.uuid4())) == 0
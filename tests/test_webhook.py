@@ -0,0 +1,108 @@
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from sqlalchemy import create_engine
+
+from benchmarks.fakes import FakeBotSession, message_update
+from bot.api.server import check_worker_settings, create_app, run_webhook
+from bot.config import Settings
+from bot.db.base import Base
+from bot.dispatcher import create_bot, create_dispatcher
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def payload(update) -> dict:
+    return update.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.asyncio
+async def test_webhook_feeds_updates_to_dispatcher():
+    session = FakeBotSession()
+    app = create_app(create_dispatcher(), create_bot(session), "/webhook")
+
+    async with TestClient(TestServer(app)) as client:
+        response = await client.post("/webhook", json=payload(message_update(12345, "/start")))
+        assert response.status == 200
+
+    (answer,) = session.calls_of("SendMessage")
+    assert answer.chat_id == 12345
+    assert "Strong Will" in answer.text
+
+
+@pytest.mark.asyncio
+async def test_workers_serve_and_stop_gracefully(tmp_path):
+    port = free_port()
+    sync_engine = create_engine(f"sqlite:///{tmp_path / 'webhook.db'}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(ROOT),
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tmp_path / 'webhook.db'}",
+        "WEBHOOK_URL": "https://example.com",
+        "WEBHOOK_PATH": "/webhook",
+        # Nothing per-user kept in one worker's memory
+        "FSM_STORAGE": "sql",
+        "FSM_FLUSH_INTERVAL": "0",
+        "HABIT_CACHE_SIZE": "0",
+    }
+    script = (
+        "from bot.api.server import run_webhook\n"
+        "from benchmarks.fakes import FakeBotSession\n"
+        f"run_webhook(workers=2, host='127.0.0.1', port={port}, session_factory=FakeBotSession)\n"
+    )
+    parent = subprocess.Popen([sys.executable, "-c", script], cwd=ROOT, env=env)
+    try:
+        url = f"http://127.0.0.1:{port}/webhook"
+        async with aiohttp.ClientSession() as client:
+            for _ in range(300):
+                try:
+                    async with client.post(url, json=payload(message_update(1, "/help"))) as response:
+                        if response.status == 200:
+                            break
+                except aiohttp.ClientConnectionError:
+                    await asyncio.sleep(0.1)
+            else:
+                pytest.fail("webhook workers did not start")
+
+            responses = await asyncio.gather(*(
+                client.post(url, json=payload(message_update(user_id, "/start")))
+                for user_id in range(50)
+            ))
+            assert {response.status for response in responses} == {200}
+    finally:
+        parent.send_signal(signal.SIGTERM)
+        returncode = parent.wait(timeout=30)
+
+    assert returncode == 0
+
+
+def test_several_workers_require_shared_state(monkeypatch):
+    config = Settings(BOT_TOKEN="42:TEST", DATABASE_URL="postgresql+asyncpg://u:p@localhost/db")
+    assert len(check_worker_settings(config)) == 2
+    config = config.model_copy(update={"FSM_STORAGE": "sql"})
+    assert [problem.split()[0] for problem in check_worker_settings(config)] == [
+        "FSM_FLUSH_INTERVAL", "CACHE_INVALIDATION"
+    ]
+    config = config.model_copy(update={"FSM_FLUSH_INTERVAL": 0, "CACHE_INVALIDATION": "postgres"})
+    assert check_worker_settings(config) == []
+
+    # Refused before the webhook is registered
+    monkeypatch.setattr("bot.api.server.set_webhook", None)
+    with pytest.raises(SystemExit, match="FSM_STORAGE"):
+        run_webhook(workers=2)